@@ -0,0 +1,445 @@
+'''
+Logistics only dry runs for TipTracker protocols.
+An in-process model of the parts of the Protocol API TipTracker uses. Labware, wells, pipettes, stackers and the waste chute keep just enough state
+(well.has_tip, labware parent/child, occupied deck slots) for the tracker to run its real code paths, and every liquid handling or module call is accepted
+and ignored, so a protocol's tip decisions (pick_up return codes, swaps, pauses, rack loads) are checked in a fraction of a second instead of a full simulation.
+
+	python TipDryRun.py my_protocol.py							#Print the tip logistics of every tracker in the protocol
+	python TipDryRun.py my_protocol.py --save expected.json		#Save them as the expected result
+	python TipDryRun.py my_protocol.py --check expected.json	#Exit 1 if they changed, i.e. in a pre-commit hook
+
+The deck model is also used by the benchmarks
+	import TipDryRun
+	TipDryRun.install()		#Must run before importing TipTracker
+	from TipTracker import TipTracker
+'''
+import importlib.util
+import json
+import sys
+import types
+
+OFF_DECK = 'offDeck'
+ALL = 'ALL'
+COLUMN = 'COLUMN'
+SINGLE = 'SINGLE'
+ROW = 'ROW'
+PARTIAL_COLUMN = 'PARTIAL_COLUMN'
+ROWS = 'ABCDEFGH'
+MODULE_NAMES = ['opentrons','opentrons.protocol_api','opentrons.protocol_api.labware','opentrons.types']
+
+
+class OutOfTipsError(Exception):
+	pass
+
+class _Ignored:
+	#Stands in for anything the tracker does not need, every attribute, call or index returns itself
+	def __getattr__(self, name):
+		return self
+
+	def __call__(self, *args, **kwargs):
+		return self
+
+	def __getitem__(self, key):
+		return self
+
+	def __iter__(self):
+		return iter(())
+
+IGNORED = _Ignored()
+
+class Well:
+	def __init__(self, parent, well_name):
+		self.parent = parent
+		self.well_name = well_name
+		self.has_tip = True
+
+	def __getattr__(self, name):
+		#top(), bottom(), center(), load_liquid() and the like
+		return IGNORED
+
+	def __repr__(self):
+		return f'{self.well_name} of {self.parent}'
+
+class _LabwareCore:
+	def __init__(self, labware):
+		self.labware = labware
+
+class Labware:
+	def __init__(self, load_name, parent):
+		self.load_name = load_name
+		self.parent = parent
+		self.child = None
+		self._core = _LabwareCore(self)
+		self._wells = [Well(self, f'{row}{column}') for column in range(1,13) for row in ROWS]
+		self._by_name = {well.well_name : well for well in self._wells}
+
+	def __getattr__(self, name):
+		#set_offset(), load_liquid() and the like
+		if name.startswith('__'):
+			raise AttributeError(name)
+		return IGNORED
+
+	def wells(self):
+		return list(self._wells)
+
+	def wells_by_name(self):
+		return dict(self._by_name)
+
+	def columns(self):
+		return [self._wells[column:column + 8] for column in range(0,96,8)]
+
+	def rows(self):
+		return [self._wells[row::8] for row in range(8)]
+
+	def __getitem__(self, well_name):
+		return self._by_name[well_name]
+
+	def load_labware(self, load_name, *args, **kwargs):
+		#Tipracks on an adapter
+		if self.child != None:
+			raise ValueError(f'Cannot load {load_name} on {self}, it is occupied')
+		self.child = Labware(load_name, self)
+		return self.child
+
+	def __repr__(self):
+		return f'{self.load_name} on {self.parent}'
+
+class WasteChute:
+	pass
+
+class TrashBin:
+	def __init__(self, location = 'A3'):
+		self.location = location
+
+class ModuleContext:
+	def __init__(self, ctx, slot):
+		self.ctx = ctx
+		self.slot = slot
+		self.parent = slot
+		self.child = None
+
+	def __getattr__(self, name):
+		#Temperatures, shaking, lids and the like
+		if name.startswith('__'):
+			raise AttributeError(name)
+		return IGNORED
+
+	def load_labware(self, load_name, *args, **kwargs):
+		self.child = Labware(load_name, self)
+		return self.child
+
+	def load_adapter(self, load_name, *args, **kwargs):
+		return self.load_labware(load_name)
+
+class FlexStackerContext(ModuleContext):
+	def __init__(self, ctx, slot):
+		ModuleContext.__init__(self, ctx, slot)
+		self.load_name = None
+		self.count = 0
+		self.lid = False
+
+	def set_stored_labware(self, load_name, count, lid = False, *args, **kwargs):
+		self.load_name = load_name
+		self.count = count
+		self.lid = lid
+
+	def retrieve(self):
+		if self.count == 0:
+			raise RuntimeError(f'Stacker on {self.slot} is empty')
+		self.count = self.count - 1
+		labware = Labware(self.load_name, self)
+		if self.lid:
+			labware.child = Labware('opentrons_flex_tiprack_lid', labware)
+		return labware
+
+	def fill(self, count = None, message = None):
+		self.ctx.pauses = self.ctx.pauses + 1
+		self.count = count
+
+class Deck(dict):
+	#Empty slots read as None like ctx.deck
+	def __getitem__(self, slot):
+		return dict.get(self, slot)
+
+class _ProtocolCore:
+	def __init__(self, ctx):
+		self.ctx = ctx
+
+	def move_labware(self, labware_core, new_location, use_gripper, pause_for_manual_move, pick_up_offset, drop_offset):
+		self.ctx.move_labware(labware_core.labware, new_location, use_gripper=use_gripper)
+
+class ProtocolContext:
+	def __init__(self, params = None, simulating = True):
+		self.deck = Deck()
+		self.simulating = simulating	#False to model a run on the robot, i.e. for checkpoint and inventory files
+		self.loaded_modules = {}
+		self.params = types.SimpleNamespace(**(params if params != None else {}))
+		self._core = _ProtocolCore(self)
+		self.moves = 0
+		self.pauses = 0
+		self.homes = 0
+		self.comments = 0
+
+	def __getattr__(self, name):
+		#define_liquid(), set_rail_lights(), delay() and the like
+		if name.startswith('__'):
+			raise AttributeError(name)
+		return IGNORED
+
+	def load_labware(self, load_name, location, label = None, adapter = None, *args, **kwargs):
+		if type(location) in (Labware,ModuleContext,FlexStackerContext):
+			return location.load_labware(load_name)
+		if self.deck[location] != None:
+			raise ValueError(f'Cannot load {load_name} on {location}, it is occupied')
+		if adapter != None:
+			self.deck[location] = Labware(adapter, location)
+			return self.deck[location].load_labware(load_name)
+		self.deck[location] = Labware(load_name, location)
+		return self.deck[location]
+
+	def load_adapter(self, load_name, location, *args, **kwargs):
+		return self.load_labware(load_name, location)
+
+	def load_module(self, module_name, location = None, *args, **kwargs):
+		module = FlexStackerContext(self, location) if 'stacker' in module_name.lower() else ModuleContext(self, location)
+		self.loaded_modules[location] = module
+		self.deck[location] = module
+		return module
+
+	def load_instrument(self, instrument_name, mount = None, tip_racks = None, *args, **kwargs):
+		channels = 96 if '96' in instrument_name else 8 if '8' in instrument_name or 'multi' in instrument_name else 1
+		pipette = InstrumentContext(channels)
+		pipette.tip_racks = tip_racks if tip_racks != None else []
+		return pipette
+
+	def load_waste_chute(self, *args, **kwargs):
+		return WasteChute()
+
+	def load_trash_bin(self, location = 'A3', *args, **kwargs):
+		return TrashBin(location)
+
+	def move_labware(self, labware, new_location, use_gripper = False, *args, **kwargs):
+		if (type(new_location) == str and new_location != OFF_DECK and self.deck[new_location] != None) or (type(new_location) == Labware and new_location.child != None):
+			raise ValueError(f'Cannot move {labware} to {new_location}, it is occupied')
+		if type(labware.parent) == str and self.deck.get(labware.parent) is labware:
+			self.deck[labware.parent] = None
+		elif type(labware.parent) == Labware:
+			labware.parent.child = None
+		if type(new_location) == Labware:
+			new_location.child = labware
+		elif type(new_location) == str and new_location != OFF_DECK:
+			self.deck[new_location] = labware
+		labware.parent = new_location if type(new_location) in (str,Labware) else OFF_DECK
+		self.moves = self.moves + 1
+
+	def pause(self, msg = None):
+		self.pauses = self.pauses + 1
+
+	def home(self):
+		self.homes = self.homes + 1
+
+	def comment(self, msg):
+		self.comments = self.comments + 1
+
+	def is_simulating(self):
+		return self.simulating
+
+class InstrumentContext:
+	def __init__(self, channels = 1):
+		self.channels = channels
+		self.active_channels = channels
+		self.tip_racks = []
+		self._last_tip_picked_up_from = None
+		self._nozzle_start = 'H1'
+
+	def __getattr__(self, name):
+		#aspirate(), dispense(), mix(), transfer() and the like
+		if name.startswith('__'):
+			raise AttributeError(name)
+		return IGNORED
+
+	def _tips_under(self, well):
+		#Wells under the active nozzles with the primary nozzle on well
+		if self.active_channels == 1:
+			return [well]
+		wells = well.parent.wells()
+		index = wells.index(well)
+		if self.active_channels == 96:
+			return wells
+		if self.active_channels == 12:
+			return wells[index % 8 :: 8]
+		if self.active_channels < 8 and self._nozzle_start[0] == 'H':
+			return wells[index - self.active_channels + 1 : index + 1]
+		return wells[index : index + self.active_channels]
+
+	def _next_tip(self, racks):
+		for rack in racks:
+			for column in rack.columns():
+				if self.active_channels == 1:
+					well = next((well for well in column if well.has_tip), None)
+					if well != None:
+						return well
+				elif all(well.has_tip for well in column):
+					return column[0]
+		return None
+
+	def pick_up_tip(self, location = None):
+		if type(location) != Well:
+			racks = [location] if type(location) == Labware else self.tip_racks
+			location = self._next_tip(racks)
+			if location == None:
+				raise OutOfTipsError('No tips left')
+		for well in self._tips_under(location):
+			well.has_tip = False
+		self._last_tip_picked_up_from = location
+
+	def return_tip(self, home_after = None):
+		for well in self._tips_under(self._last_tip_picked_up_from):
+			well.has_tip = True
+		self._last_tip_picked_up_from = None
+
+	def drop_tip(self, location = None):
+		if type(location) == Well: #Dropping into a tiprack well leaves the tip there
+			location.has_tip = True
+		self._last_tip_picked_up_from = None
+
+	def configure_nozzle_layout(self, style, start = None, end = None, tip_racks = None):
+		self._nozzle_start = start if start != None else 'H1'
+		if style == ALL:
+			self.active_channels = self.channels
+		elif style == SINGLE:
+			self.active_channels = 1
+		elif style == COLUMN:
+			self.active_channels = 8
+		elif style == ROW:
+			self.active_channels = 12
+		else:
+			self.active_channels = abs(ord(end[0]) - ord(start[0])) + 1
+
+class Point(tuple):
+	def __new__(cls, x = 0.0, y = 0.0, z = 0.0):
+		return tuple.__new__(cls, (x, y, z))
+
+
+def install():
+	'''Register the deck model as the opentrons package so TipTracker and protocols import it'''
+	opentrons = types.ModuleType('opentrons')
+	protocol_api = types.ModuleType('opentrons.protocol_api')
+	labware = types.ModuleType('opentrons.protocol_api.labware')
+	opentrons_types = types.ModuleType('opentrons.types')
+	for name in ['OFF_DECK','ALL','COLUMN','SINGLE','ROW','PARTIAL_COLUMN','ProtocolContext','InstrumentContext','Labware','Well','WasteChute','TrashBin','ModuleContext','FlexStackerContext']:
+		setattr(protocol_api, name, globals()[name])
+	protocol_api.ParameterContext = _Ignored
+	labware.OutOfTipsError = OutOfTipsError
+	labware.Labware = Labware
+	labware.Well = Well
+	opentrons_types.Point = Point
+	opentrons_types.Location = lambda point, labware : (point, labware)
+	opentrons.protocol_api = protocol_api
+	opentrons.types = opentrons_types
+	protocol_api.labware = labware
+	sys.modules.update({'opentrons' : opentrons, 'opentrons.protocol_api' : protocol_api, 'opentrons.protocol_api.labware' : labware, 'opentrons.types' : opentrons_types})
+
+class _Parameters:
+	#Collects the defaults of a protocol's add_parameters
+	def __init__(self):
+		self.values = {}
+
+	def __getattr__(self, name):
+		def add(variable_name = None, default = None, **kwargs):
+			self.values[variable_name] = default
+		return add
+
+def dry_run(protocol_path : str, params : dict | None = None) -> dict:
+	'''Run a protocol's run(ctx) against the deck model and collect what every TipTracker it creates decided.
+	protocol_path = path to the protocol file
+	params = optional runtime parameter values, defaults from the protocol's add_parameters are used for the rest
+	Returns dict with
+	pauses, moves - operator pauses and labware moves on the deck
+	trackers - for each tracker in the order they were created: return_codes (count of each pick_up return code), tip_counts, tip_rack_counts, \\
+	gripper_moves, sim_time and decisions, every pick up, swap, carousel, waste, refill, pause and load as [kind, rack, slot, code] in order'''
+	saved_modules = {name : sys.modules.get(name,None) for name in MODULE_NAMES + ['TipTracker']}
+	sys.modules.pop('TipTracker',None)
+	install()
+	import TipTracker as tracker_module
+	trackers = []
+	originals = {}
+	def capture(tracker_class):
+		#Wrap a TipTracker class so every tracker it creates also records its events, the imported module or a copy pasted into the protocol
+		if tracker_class in originals:
+			return
+		original_init = tracker_class.__init__
+		originals[tracker_class] = original_init
+		def init(tracker, *args, **kwargs):
+			original_init(tracker, *args, **kwargs)
+			sink = tracker_module.MemorySink()
+			tracker.add_sink(sink)
+			trackers.append((tracker,sink))
+		tracker_class.__init__ = init
+	capture(tracker_module.TipTracker)
+	try:
+		spec = importlib.util.spec_from_file_location('dry_run_protocol', protocol_path)
+		protocol = importlib.util.module_from_spec(spec)
+		spec.loader.exec_module(protocol)
+		for value in list(vars(protocol).values()):
+			if isinstance(value,type) and value.__name__ == 'TipTracker':
+				capture(value)
+		defaults = _Parameters()
+		if hasattr(protocol, 'add_parameters'):
+			protocol.add_parameters(defaults)
+		ctx = ProtocolContext(dict(defaults.values, **(params if params != None else {})))
+		protocol.run(ctx)
+	finally:
+		for tracker_class,original_init in originals.items():
+			tracker_class.__init__ = original_init
+		for name,module in saved_modules.items():
+			if module == None:
+				sys.modules.pop(name,None)
+			else:
+				sys.modules[name] = module
+	if trackers == []:
+		raise ValueError(f"{protocol_path} did not create a TipTracker, there are no tip logistics to check")
+	results = []
+	for tracker,sink in trackers:
+		events = sink.events
+		codes = {}
+		for event in events:
+			if event.kind == 'pickup':
+				codes[event.code] = codes.get(event.code,0) + 1
+		results.append({
+			'return_codes' : {str(code) : count for code,count in sorted(codes.items())},
+			'tip_counts' : dict(tracker.tip_counts),
+			'tip_rack_counts' : dict(tracker.tip_rack_counts),
+			'gripper_moves' : tracker.gripper_moves,
+			'sim_time' : round(tracker.sim_time,1),
+			'decisions' : [[event.kind,event.rack,event.slot,event.code] for event in events if event.kind != 'pickup' or event.code != 0]})
+	return {'pauses' : ctx.pauses, 'moves' : ctx.moves, 'trackers' : results}
+
+
+if __name__ == '__main__':
+	if len(sys.argv) not in (2,4) or (len(sys.argv) == 4 and sys.argv[2] not in ('--save','--check')):
+		print('Usage: python TipDryRun.py protocol.py [--save | --check expected.json]')
+		sys.exit(1)
+	result = dry_run(sys.argv[1])
+	if len(sys.argv) == 2:
+		print(json.dumps(result,indent=2))
+	elif sys.argv[2] == '--save':
+		with open(sys.argv[3],'w') as expected_file:
+			json.dump(result,expected_file,indent=2)
+	else:
+		with open(sys.argv[3]) as expected_file:
+			expected = json.load(expected_file)
+		if expected != result:
+			print(f'Tip logistics of {sys.argv[1]} changed from {sys.argv[3]}')
+			for key in ['pauses','moves']:
+				if expected.get(key) != result[key]:
+					print(f'	{key}: {expected.get(key)} -> {result[key]}')
+			for number,(old,new) in enumerate(zip(expected.get('trackers',[]),result['trackers'])):
+				for key in new.keys():
+					if old.get(key) != new[key] and key != 'decisions':
+						print(f'	tracker {number} {key}: {old.get(key)} -> {new[key]}')
+				if old.get('decisions') != new['decisions']:
+					first = next((index for index,(a,b) in enumerate(zip(old.get('decisions',[]),new['decisions'])) if a != b),min(len(old.get('decisions',[])),len(new['decisions'])))
+					print(f'	tracker {number} decisions differ from #{first}')
+			sys.exit(1)
+		print(f'Tip logistics of {sys.argv[1]} match {sys.argv[3]}')
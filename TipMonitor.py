@@ -0,0 +1,109 @@
+'''
+Local reader for the inventory snapshots a running TipTracker publishes, so staff can see tips run down from outside the protocol
+and stage racks before the next manual refill pause instead of finding out when the robot stops.
+Follows the file written by InventoryFileSink or listens for the datagrams sent by InventorySocketSink.
+
+	python TipMonitor.py inventory.json					#Follow the snapshot file
+	python TipMonitor.py --port 8765					#Listen for snapshots sent over UDP
+	python TipMonitor.py inventory.json --once			#Print the current snapshot and exit
+'''
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+
+def read_snapshot(path : str) -> dict | None:
+	'''Latest snapshot in a file written by InventoryFileSink, None if there is none yet'''
+	try:
+		with open(path) as snapshot_file:
+			return json.load(snapshot_file)
+	except (OSError,ValueError):
+		return None
+
+def follow_file(path : str, interval : float = 1.0):
+	'''Yield every new snapshot written to path, checking every interval seconds'''
+	last = None
+	while True:
+		try:
+			changed = os.stat(path).st_mtime_ns
+		except OSError:
+			changed = None
+		if changed != None and changed != last:
+			snapshot = read_snapshot(path)
+			if snapshot != None:
+				last = changed
+				yield snapshot
+		time.sleep(interval)
+
+def listen(port : int = 8765, host : str = '0.0.0.0'):
+	'''Yield every snapshot sent to the UDP port'''
+	receiver = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+	receiver.bind((host,port))
+	try:
+		while True:
+			data = receiver.recv(65536)
+			try:
+				yield json.loads(data)
+			except ValueError:
+				continue
+	finally:
+		receiver.close()
+
+def pickup_rate(previous : dict | None, snapshot : dict) -> float | None:
+	'''Pick ups per second between two snapshots, None if it cannot be told yet'''
+	if previous == None or snapshot['time'] <= previous['time'] or snapshot['pickups'] <= previous['pickups']:
+		return None
+	return (snapshot['pickups'] - previous['pickups']) / (snapshot['time'] - previous['time'])
+
+def format_snapshot(snapshot : dict, rate : float | None = None) -> list[str]:
+	'''Lines describing a snapshot, rate = pick ups per second used to estimate when the next pause comes'''
+	lines = [f"{time.strftime('%H:%M:%S',time.localtime(snapshot['time']))}  {snapshot['pickups']} pick ups"]
+	lines.append(f"{'rack type':<40} {'on deck':>8} {'reserve':>8} {'racks':>8} {'stacked':>8}")
+	for name in snapshot['tips'].keys():
+		loaded = snapshot['tip_rack_counts'].get(name,0)
+		limit = snapshot['max_racks'].get(name,None)
+		racks = f'{loaded}/{limit}' if limit != None else f'{loaded}'
+		lines.append(f"{name:<40} {snapshot['tips'][name]:>8} {snapshot['reserve'][name]:>8} {racks:>8} {snapshot['stackers'].get(name,0):>8}")
+	for number,pickups in snapshot['until_pause'].items():
+		lines.append(f'pipette {number}: {pickups} pick ups until a refill pause')
+	if snapshot['next_pause'] != None:
+		line = f"next pause in {snapshot['next_pause']} pick ups"
+		if rate != None:
+			line = line + f", about {snapshot['next_pause'] / rate / 60:.1f} min at the current rate"
+		lines.append(line)
+	return lines
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description='Watch the tip inventory of a running TipTracker protocol')
+	parser.add_argument('path',nargs='?',help='snapshot file written by InventoryFileSink')
+	parser.add_argument('--port',type=int,help='UDP port InventorySocketSink sends to, instead of a file')
+	parser.add_argument('--host',default='0.0.0.0',help='address to listen on with --port')
+	parser.add_argument('--interval',type=float,default=1.0,help='seconds between checks of the snapshot file')
+	parser.add_argument('--once',action='store_true',help='print the current snapshot file and exit')
+	args = parser.parse_args(argv)
+	if args.path == None and args.port == None:
+		parser.error('give a snapshot file or --port')
+
+	if args.once:
+		snapshot = read_snapshot(args.path) if args.path != None else next(listen(args.port,args.host))
+		if snapshot == None:
+			print(f'No snapshot in {args.path}')
+			return 1
+		print('\n'.join(format_snapshot(snapshot)))
+		return 0
+	previous = None
+	rate = None
+	try:
+		for snapshot in (listen(args.port,args.host) if args.port != None else follow_file(args.path,args.interval)):
+			rate = pickup_rate(previous,snapshot) or rate
+			print('\n'.join(format_snapshot(snapshot,rate)) + '\n')
+			previous = snapshot
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,535 @@
+'''
+Offline tip budget planning for TipTracker.
+Replays a recorded pickup sequence against a deck configuration with the same decisions pick_up makes
+(expansion swap, carousel, stacker, manual refill) but only counts tips, so it runs in milliseconds without the Opentrons simulator.
+
+Record the input from one simulation with TrackerObject.plan_config() and then sweep layouts here, i.e.
+	python TipPlanner.py plan_config.json
+	python TipPlanner.py plan_config.json --optimize
+	python TipPlanner.py plan_config.json --what-if candidates.json --samples 24 --sample-range 8 48 --retry 0.02
+'''
+import json
+import math
+import os
+import random
+import sys
+
+TIPS_PER_RACK = 96
+COLUMNS_PER_RACK = 12
+TIPS_PER_COLUMN = 8
+FLEX_DECK_SLOTS = ['A1','A2','A3','B1','B2','B3','C1','C2','C3','D1','D2','D3']
+FLEX_EXPANSION_SLOTS = ['A4','B4','C4','D4']
+SLOT_PITCH = (164.0,107.0)																		#mm between slot centers in x and y
+LAYOUT_WEIGHTS = {'pause' : 300.0, 'move' : 20.0, 'distance' : 0.02}								#Rough seconds per manual pause, per gripper move and per mm of gripper travel
+
+
+def plan(pickups : list, rack_assignments : dict[str : list[str]], ex_slots : list[str] | None = None, stackers : dict[str : int] | None = None, max_racks : dict[str : int] | None = None, use_chute : bool = True, use_gripper : bool = True, stacker_lids : bool | dict[str : bool] = False, starting_slots : dict[str : list[str]] | None = None, open_slots : int | list[str] | None = None) -> dict:
+	'''Dry run a pickup sequence against a deck configuration and return the tip budget.
+	pickups = list of (pipette, rack_name, channels) or (rack_name, channels) in the order they are picked up, i.e. TrackerObject.pickup_history
+	rack_assignments = dict of rack load name to the slots it is loaded on, expansion slots included, i.e. TrackerObject.rack_assignments
+	ex_slots = list of expansion slots, racks assigned to these are swapped onto the active deck when empty
+	stackers = dict of rack load name to the number of racks stored in stackers for it
+	max_racks = dict of rack load name to the most racks that can be loaded, i.e. TrackerObject.max_racks_count
+	use_chute = bool, True if empty racks are thrown out through the waste chute, False to carousel them
+	use_gripper = bool, if the gripper is available to move racks
+	stacker_lids = bool, if stacker racks have a lid that has to be thrown away, or a dict of rack load name to bool for each rack type, i.e. TrackerObject.plan_config()['stacker_lids']
+	starting_slots = optional dict of rack load name to the slots loaded at the start of the run if different from rack_assignments, i.e. add_starting_tipracks slots
+	open_slots = slots kept empty for carousel as a list or a count, i.e. TrackerObject.open_slot plus TrackerObject.open_slots
+	Returns dict with
+	tips - tips picked up for each rack type
+	min_racks - fewest racks that could hold those tips
+	racks_used - racks tips were actually taken from, larger than min_racks when columns are broken up
+	racks_loaded - racks loaded onto the deck or stackers, the same as TrackerObject.tip_rack_counts
+	max_racks - best max_racks value for each rack type so the last refill only asks for racks that get used
+	pauses - list of manual refill pauses with the pickup index, rack type, racks to load and stacker (True when the racks go into its stackers)
+	gripper_moves - gripper moves for each rack type
+	restocks - times each rack type was restocked from expansion slots, stackers or manually
+	short - rack types that ran out because of max_racks, with the pickup index they ran out on'''
+	ex_slots = ex_slots if ex_slots != None else []
+	stackers = dict(stackers) if stackers != None else {}
+	max_racks = max_racks if max_racks != None else {}
+	stacker_capacity = dict(stackers)
+	stacker_lids = stacker_lids if type(stacker_lids) == dict else {name : stacker_lids for name in stackers.keys()}
+	chute = use_chute and use_gripper
+	racks = {}
+	#Free open slots are shared by every rack type, unassigned expansion slots are spare holes to carousel through
+	assigned = [slot for slots in rack_assignments.values() for slot in ([slots] if type(slots) == str else slots)]
+	pool = {'open' : open_slots if type(open_slots) == int else len(open_slots) if open_slots != None else 0, 'spare' : len([slot for slot in ex_slots if slot not in assigned]), 'racks' : racks}
+	result = {'tips' : {}, 'min_racks' : {}, 'racks_used' : {}, 'racks_loaded' : {}, 'max_racks' : {}, 'pauses' : [], 'gripper_moves' : {}, 'restocks' : {}, 'short' : {}}
+	starting_slots = starting_slots if starting_slots != None else {}
+	for name,slots in rack_assignments.items():
+		slots = [slots] if type(slots) == str else slots
+		deck_slots = [slot for slot in slots if slot not in ex_slots]
+		racks[name] = {
+			'deck_slots' : len(deck_slots),
+			'ex_slots' : len(slots) - len(deck_slots),
+			'active' : [],
+			'expansion' : 0,
+			'open' : 0,
+			'parked' : 0,
+			'lent' : {}}
+		result['tips'][name] = 0
+		result['racks_used'][name] = 0
+		result['racks_loaded'][name] = 0
+		result['gripper_moves'][name] = 0
+		result['restocks'][name] = {'expansion' : 0, 'stacker' : 0, 'manual' : 0}
+		start = starting_slots.get(name,slots)
+		start = [start] if type(start) == str else start
+		start_deck = len([slot for slot in start if slot not in ex_slots])
+		_load(racks[name],result,name,start_deck,len(start) - start_deck,max_racks)
+	for name,quantity in stackers.items():
+		result['racks_loaded'][name] = result['racks_loaded'].get(name,0) + quantity
+
+	for x,pickup in enumerate(pickups):
+		name,channels = pickup[-2],pickup[-1]
+		if name not in racks:
+			raise KeyError(f"Tiprack {name} not found in rack_assignments")
+		if name in result['short']:
+			continue
+		state = racks[name]
+		if not _take(state,result,name,channels):
+			_restock(state,result,name,x,chute,stackers,stacker_capacity,stacker_lids,max_racks,pool)
+			if not _take(state,result,name,channels):
+				result['short'][name] = x
+				continue
+		result['tips'][name] = result['tips'][name] + channels
+
+	for name in racks.keys():
+		result['min_racks'][name] = math.ceil(result['tips'][name] / TIPS_PER_RACK)
+		result['max_racks'][name] = result['racks_used'][name]
+	return result
+
+
+def plan_config(config : dict) -> dict:
+	'''Run plan() from a dict shaped like TrackerObject.plan_config() or a JSON file from it'''
+	return plan(
+		pickups=config['pickups'],
+		rack_assignments=config['rack_assignments'],
+		ex_slots=config.get('ex_slots',None),
+		stackers=config.get('stackers',None),
+		max_racks=config.get('max_racks',None),
+		use_chute=config.get('use_chute',True),
+		use_gripper=config.get('use_gripper',True),
+		stacker_lids=config.get('stacker_lids',False),
+		starting_slots=config.get('starting_slots',None),
+		open_slots=config.get('open_slots',None))
+
+
+def optimize_layout(pickups : list, deck_slots : list[str] | None = None, ex_slots : list[str] | None = None, stackers : dict[str : int] | None = None, stacker_slots : dict[str : str] | None = None, use_chute : bool = True, use_gripper : bool = True, waste_slot : str = 'D3', weights : dict[str : float] | None = None, top : int = 5, iterations : int = 2000, seed : int = 0, open_slots : int = 1) -> list[dict]:
+	'''Search slot assignments for every rack type in a pickup sequence and return the best layouts ranked by estimated cost. \
+	Slot counts per rack type are chosen with branch-and-bound over plan() results, then the slots themselves are placed with simulated annealing \
+	to cut gripper travel to the waste chute, expansion slots, stackers and the carousel open slots.
+	pickups = list of (pipette, rack_name, channels) or (rack_name, channels), i.e. TrackerObject.pickup_history
+	deck_slots = deck slots free for tipracks, defaults to the whole Flex deck
+	ex_slots = expansion slots free for tipracks, defaults to A4-D4
+	stackers = dict of rack load name to the number of racks stored in stackers for it
+	stacker_slots = dict of rack load name to the slot its stacker retrieves into
+	use_chute = bool, True to throw empty racks out through the waste chute, False to carousel them
+	use_gripper = bool, if the gripper is available to move racks
+	waste_slot = slot the waste chute is on
+	weights = dict of cost per 'pause', 'move' and 'distance' (mm), defaults to LAYOUT_WEIGHTS in seconds
+	top = number of layouts to return
+	iterations = annealing steps for placing the slots of each layout
+	seed = random seed so results are repeatable
+	open_slots = deck slots kept open when carouseling, more let full racks come straight in while the empty ones stay parked
+	Returns list of dicts with rack_assignments, ex_slots, open_slot, open_slots, score, pauses, gripper_moves and distance (mm), best first'''
+	deck_slots = list(deck_slots) if deck_slots != None else list(FLEX_DECK_SLOTS)
+	ex_slots = list(ex_slots) if ex_slots != None else list(FLEX_EXPANSION_SLOTS)
+	stackers = stackers if stackers != None else {}
+	stacker_slots = stacker_slots if stacker_slots != None else {}
+	weights = dict(LAYOUT_WEIGHTS,**(weights if weights != None else {}))
+	carousel = not (use_chute and use_gripper)
+	#The chute sits on its slot and stackers sit on expansion slots, neither can hold a tiprack
+	if use_chute and waste_slot in deck_slots:
+		deck_slots.remove(waste_slot)
+	ex_slots = [slot for slot in ex_slots if slot not in stacker_slots.values()]
+	names = list(dict.fromkeys([pickup[-2] for pickup in pickups]))
+	open_slots = open_slots if carousel else 0
+	deck_free = len(deck_slots) - open_slots
+	if deck_free < len(names):
+		raise ValueError(f"Not enough deck slots for {len(names)} rack types, {deck_free} available")
+
+	#Rack types never share racks, so each (deck, expansion) slot count is planned once per type
+	options = {}
+	for name in names:
+		rack_pickups = [pickup for pickup in pickups if pickup[-2] == name]
+		options[name] = []
+		for deck_count in range(1,deck_free - len(names) + 2):
+			for ex_count in range(0,len(ex_slots) + 1):
+				slots = [f'deck{x}' for x in range(deck_count)] + ex_slots[:ex_count]
+				result = plan(rack_pickups,{name : slots},ex_slots,{name : stackers[name]} if name in stackers else None,None,use_chute,use_gripper,open_slots=open_slots)
+				cost = len(result['pauses']) * weights['pause'] + result['gripper_moves'][name] * weights['move']
+				options[name].append((cost,deck_count,ex_count,result))
+		options[name].sort(key=lambda option : option[:3])
+	best_rest = [sum([options[name][0][0] for name in names[x:]]) for x in range(len(names))] + [0.0]
+
+	allocations = []
+	def search(x,deck_left,ex_left,cost,chosen):
+		if x == len(names):
+			allocations.append((cost,list(chosen)))
+			allocations.sort(key=lambda allocation : allocation[0])
+			del allocations[top:]
+			return
+		for option in options[names[x]]:
+			#Options are sorted by cost so once the bound is beaten by the worst kept layout nothing later can do better
+			if len(allocations) >= top and cost + option[0] + best_rest[x + 1] >= allocations[-1][0]:
+				break
+			if option[1] > deck_left - (len(names) - x - 1) or option[2] > ex_left:
+				continue
+			chosen.append(option)
+			search(x + 1,deck_left - option[1],ex_left - option[2],cost + option[0],chosen)
+			chosen.pop()
+	search(0,deck_free,len(ex_slots),0.0,[])
+
+	rng = random.Random(seed)
+	layouts = []
+	for cost,chosen in allocations:
+		placement,distance = _place_slots(names,chosen,deck_slots,ex_slots,stacker_slots,carousel,open_slots,waste_slot,iterations,rng)
+		layouts.append({
+			'rack_assignments' : placement['rack_assignments'],
+			'ex_slots' : [slot for slots in placement['rack_assignments'].values() for slot in slots if slot in ex_slots],
+			'open_slot' : placement['open_slots'][0] if placement['open_slots'] != [] else None,
+			'open_slots' : placement['open_slots'],
+			'score' : cost + distance * weights['distance'],
+			'pauses' : sum([len(option[3]['pauses']) for option in chosen]),
+			'gripper_moves' : sum([sum(option[3]['gripper_moves'].values()) for option in chosen]),
+			'distance' : distance})
+	layouts.sort(key=lambda layout : layout['score'])
+	return layouts
+
+
+def demand_trace(pickups : list, rng : random.Random, samples : int | None = None, sample_range : tuple[int,int] | None = None, retry_rate : float = 0.0) -> list:
+	'''One randomized pickup sequence built from a recorded one, for what_if.
+	pickups = recorded pickups, i.e. TrackerObject.pickup_history
+	rng = random.Random to draw from
+	samples = number of samples the recorded pickups were for
+	sample_range = (fewest, most) samples a run can have, a count is drawn uniformly and the recorded pickups are repeated or cut to match
+	retry_rate = chance each pick up is followed by a retry that takes another tip of the same kind
+	Returns list of pickups'''
+	pickups = list(pickups)
+	trace = pickups
+	if samples != None and sample_range != None and pickups != []:
+		length = round(len(pickups) * rng.randint(sample_range[0],sample_range[1]) / samples)
+		trace = [pickups[x % len(pickups)] for x in range(length)]
+	if retry_rate > 0:
+		retried = []
+		for pickup in trace:
+			retried.append(pickup)
+			while rng.random() < retry_rate:
+				retried.append(pickup)
+		trace = retried
+	return trace
+
+
+def what_if(pickups : list, configs : list[dict], trials : int = 1000, samples : int | None = None, sample_range : tuple[int,int] | None = None, retry_rate : float = 0.0, demand = None, weights : dict[str : float] | None = None, workers : int | None = None, seed : int = 0) -> list[dict]:
+	'''Monte Carlo what-if over randomized demand. Every trial draws a pickup sequence and runs plan() on it for each candidate deck configuration, \
+	trials are spread over a process pool. Trial x draws the same sequence for every configuration so they are compared on the same demand.
+	pickups = recorded pickups, i.e. TrackerObject.pickup_history
+	configs = list of deck configurations shaped like TrackerObject.plan_config() without the pickups, an optional 'name' is copied to the result
+	trials = randomized runs per configuration
+	samples, sample_range, retry_rate = how demand varies between runs, see demand_trace
+	demand = optional function taking a random.Random and returning a pickup sequence, used instead of demand_trace. It must be defined at module level so the pool can send it to workers
+	weights = dict of cost in seconds per 'pause' and 'move', defaults to LAYOUT_WEIGHTS
+	workers = processes to use, defaults to every core, 1 runs everything in this process
+	seed = random seed so results are repeatable
+	Returns list of dicts in the order of configs with
+	name - the config name, or its index
+	pause_probability - fraction of runs with at least one manual refill pause
+	pauses - mean and p95 of manual refill pauses per run
+	overhead - mean, p50 and p95 of seconds lost to pauses and gripper moves per run
+	gripper_moves - mean gripper moves per run
+	tips - mean and p95 of tips picked up per run
+	short_probability - fraction of runs where a rack type ran out because of max_racks
+	short - the same fraction for each rack type that ran short'''
+	if type(trials) != int or trials < 1:
+		raise ValueError(f'trials must be an integer of at least 1, got {trials}')
+	if sample_range != None and samples == None:
+		raise ValueError("sample_range needs samples, the number of samples the recorded pickups were for")
+	weights = dict(LAYOUT_WEIGHTS,**(weights if weights != None else {}))
+	workers = workers if workers != None else os.cpu_count() or 1
+	#A few batches per worker so the pool stays busy without sending the pickups for every trial
+	batch = max(1,math.ceil(trials / (workers * 4)))
+	tasks = [(index,config,pickups,range(start,min(start + batch,trials)),seed,samples,sample_range,retry_rate,demand) for index,config in enumerate(configs) for start in range(0,trials,batch)]
+	outcomes = [[] for _ in configs]
+	if workers == 1:
+		for task in tasks:
+			outcomes[task[0]].extend(_what_if_batch(*task[1:]))
+	else:
+		from concurrent.futures import ProcessPoolExecutor #Only what-if runs pay for the import
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			for task,results in zip(tasks,pool.map(_what_if_batch,*zip(*[task[1:] for task in tasks]))):
+				outcomes[task[0]].extend(results)
+
+	report = []
+	for index,config in enumerate(configs):
+		runs = outcomes[index]
+		pauses = sorted([run[0] for run in runs])
+		overhead = sorted([run[0] * weights['pause'] + run[1] * weights['move'] for run in runs])
+		tips = sorted([run[3] for run in runs])
+		short = {}
+		for run in runs:
+			for name in run[2]:
+				short[name] = short.get(name,0) + 1
+		report.append({
+			'name' : config.get('name',index),
+			'trials' : len(runs),
+			'pause_probability' : len([count for count in pauses if count > 0]) / len(runs),
+			'pauses' : {'mean' : sum(pauses) / len(runs), 'p95' : percentile(pauses,95)},
+			'overhead' : {'mean' : sum(overhead) / len(runs), 'p50' : percentile(overhead,50), 'p95' : percentile(overhead,95)},
+			'gripper_moves' : sum([run[1] for run in runs]) / len(runs),
+			'tips' : {'mean' : sum(tips) / len(runs), 'p95' : percentile(tips,95)},
+			'short_probability' : len([run for run in runs if run[2] != []]) / len(runs),
+			'short' : {name : count / len(runs) for name,count in short.items()}})
+	return report
+
+
+def slot_distance(slot1 : str, slot2 : str) -> float:
+	'''Straight line distance in mm between the centers of two deck slots, i.e. slot_distance('A1','D4'). TipTracker keeps a private copy so it stays one file'''
+	return math.hypot((int(slot1[1:]) - int(slot2[1:])) * SLOT_PITCH[0],(ord(slot1[0]) - ord(slot2[0])) * SLOT_PITCH[1])
+
+
+def percentile(values : list, q : float) -> float | None:
+	'''Nearest rank percentile of sorted values, q in percent i.e. 95, None if there are no values. Used by what_if, TipTracker.metrics keeps a private copy'''
+	if len(values) == 0:
+		return None
+	return values[min(len(values) - 1,max(0,math.ceil(q / 100 * len(values)) - 1))]
+
+
+def _place_slots(names,chosen,deck_slots,ex_slots,stacker_slots,carousel,open_slots,waste_slot,iterations,rng):
+	#Simulated annealing over slot permutations, the first slots of each list go to the rack types in order and the next deck slots are the open slots
+	deck_order = list(deck_slots)
+	ex_order = list(ex_slots)
+
+	def unpack():
+		assignments = {}
+		x = 0
+		y = 0
+		for name,option in zip(names,chosen):
+			assignments[name] = deck_order[x:x + option[1]] + ex_order[y:y + option[2]]
+			x = x + option[1]
+			y = y + option[2]
+		return assignments,deck_order[x:x + open_slots]
+
+	def travel():
+		assignments,opens = unpack()
+		distance = 0.0
+		for name,option in zip(names,chosen):
+			restocks = option[3]['restocks'][name]
+			active = assignments[name][:option[1]]
+			expansion = assignments[name][option[1]:]
+			if carousel:
+				#Full racks go straight to the open slots, the rest swap with an empty rack through the slot the last full rack left
+				swap = sum([min([slot_distance(e_slot,open_slot) for open_slot in opens]) if x < len(opens) else 2 * slot_distance(e_slot,slot) for x,(slot,e_slot) in enumerate(zip(active,expansion))])
+			else:
+				distance = distance + sum(restocks.values()) * sum([slot_distance(slot,waste_slot) for slot in active])
+				swap = sum([slot_distance(e_slot,slot) for slot,e_slot in zip(active,expansion)])
+			distance = distance + restocks['expansion'] * swap
+			if name in stacker_slots:
+				distance = distance + restocks['stacker'] * slot_distance(stacker_slots[name],active[0])
+		return distance
+
+	current = travel()
+	best = (current,list(deck_order),list(ex_order))
+	temperature = max(current,1.0) / 10
+	for _ in range(iterations):
+		order = deck_order if len(ex_order) < 2 or rng.random() < 0.7 else ex_order
+		if len(order) < 2:
+			break
+		x,y = rng.sample(range(len(order)),2)
+		order[x],order[y] = order[y],order[x]
+		candidate = travel()
+		if candidate <= current or rng.random() < math.exp((current - candidate) / temperature):
+			current = candidate
+			if current < best[0]:
+				best = (current,list(deck_order),list(ex_order))
+		else:
+			order[x],order[y] = order[y],order[x]
+		temperature = max(temperature * 0.995,1e-6)
+	deck_order[:] = best[1]
+	ex_order[:] = best[2]
+	assignments,opens = unpack()
+	return {'rack_assignments' : assignments, 'open_slots' : opens},best[0]
+
+
+def _what_if_batch(config,pickups,trials,seed,samples,sample_range,retry_rate,demand):
+	#Runs of one config for a range of trial numbers, (pauses, gripper moves, rack types that ran short, tips) for each
+	runs = []
+	for trial in trials:
+		rng = random.Random(seed * 1000003 + trial)
+		trace = demand(rng) if demand != None else demand_trace(pickups,rng,samples,sample_range,retry_rate)
+		result = plan(
+			pickups=trace,
+			rack_assignments=config['rack_assignments'],
+			ex_slots=config.get('ex_slots',None),
+			stackers=config.get('stackers',None),
+			max_racks=config.get('max_racks',None),
+			use_chute=config.get('use_chute',True),
+			use_gripper=config.get('use_gripper',True),
+			stacker_lids=config.get('stacker_lids',False),
+			starting_slots=config.get('starting_slots',None),
+			open_slots=config.get('open_slots',None))
+		runs.append((len(result['pauses']),sum(result['gripper_moves'].values()),list(result['short'].keys()),sum(result['tips'].values())))
+	return runs
+
+
+def _new_rack():
+	return [TIPS_PER_COLUMN] * COLUMNS_PER_RACK
+
+
+def _load(state,result,name,deck_count,ex_count,max_racks):
+	#Load fresh racks onto the active deck and expansion slots up to max_racks, returns how many were loaded
+	loaded = 0
+	for count,tier in [(deck_count,'active'),(ex_count,'expansion')]:
+		for _ in range(count):
+			if name in max_racks and result['racks_loaded'][name] >= max_racks[name]:
+				return loaded
+			if tier == 'active':
+				state['active'].append(_new_rack())
+			else:
+				state['expansion'] = state['expansion'] + 1
+			result['racks_loaded'][name] = result['racks_loaded'][name] + 1
+			loaded = loaded + 1
+	return loaded
+
+
+def _take(state,result,name,channels):
+	#Take tips the same way TipTracker.next_tip does, whole racks for 96 channels, whole rows for 96 channel ROW layouts,
+	#whole columns for 8 channels and the first column with enough tips otherwise
+	for rack in state['active']:
+		if channels == TIPS_PER_COLUMN * COLUMNS_PER_RACK or channels == COLUMNS_PER_RACK:
+			if min(rack) < channels // COLUMNS_PER_RACK:
+				continue
+			if rack.count(TIPS_PER_COLUMN) == COLUMNS_PER_RACK:
+				result['racks_used'][name] = result['racks_used'][name] + 1
+			rack[:] = [tips - channels // COLUMNS_PER_RACK for tips in rack]
+			return True
+		for column,tips in enumerate(rack):
+			if tips == 0 or tips < channels:
+				continue
+			if tips == TIPS_PER_COLUMN and rack.count(TIPS_PER_COLUMN) == COLUMNS_PER_RACK:
+				result['racks_used'][name] = result['racks_used'][name] + 1
+			rack[column] = tips - channels
+			return True
+	return False
+
+
+def _restock(state,result,name,x,chute,stackers,stacker_capacity,stacker_lids,max_racks,pool):
+	#Mirror of TipTracker._restock, counts gripper moves and pauses instead of moving labware
+	if chute:
+		result['gripper_moves'][name] = result['gripper_moves'][name] + len(state['active'])
+		state['active'] = []
+	direct = 0
+	chained = 0
+	if state['expansion'] > 0 and not chute:
+		#Mirror of TipTracker._plan_carousel, full racks go straight onto free open slots and the empty racks stay parked,
+		#the rest swap places with an empty rack, two moves each. The first empty rack needs a free slot: its own expansion slots, then unassigned ones,
+		#then other types' expansion slots, each later one takes the slot the previous full rack left. With nowhere to move it it is a manual refill
+		direct = min(state['expansion'],pool['open'])
+		owners = [name] if _holes(state) > 0 or direct > 0 else ['spare'] if pool['spare'] > 0 else [other for other,other_state in pool['racks'].items() if other != name and _holes(other_state) > 0]
+		if owners != []:
+			chained = min(state['expansion'] - direct,len(state['active']))
+	if state['expansion'] > 0 and (chute or direct + chained > 0):
+		if chute:
+			swaps = min(state['expansion'],state['deck_slots'])
+			result['gripper_moves'][name] = result['gripper_moves'][name] + swaps
+		else:
+			swaps = direct + chained
+			result['gripper_moves'][name] = result['gripper_moves'][name] + direct + 2 * chained
+			pool['open'] = pool['open'] - direct
+			state['open'] = state['open'] + direct
+			state['active'] = state['active'][chained:]
+			if chained > 0 and owners[0] != name:
+				#The first empty rack goes outside the type's own slots, the rest fill the slots the full racks left
+				state['lent'][owners[0]] = state['lent'].get(owners[0],0) + 1
+				if owners[0] == 'spare':
+					pool['spare'] = pool['spare'] - 1
+				else:
+					pool['racks'][owners[0]]['parked'] = pool['racks'][owners[0]]['parked'] + 1
+				state['parked'] = state['parked'] + chained - 1
+			else:
+				state['parked'] = state['parked'] + chained
+		state['expansion'] = state['expansion'] - swaps
+		result['restocks'][name]['expansion'] = result['restocks'][name]['expansion'] + 1
+		state['active'].extend([_new_rack() for _ in range(swaps)])
+	elif state['expansion'] == 0 and (stackers.get(name,0) > 0 or _fill_stackers(result,name,x,stackers,stacker_capacity,max_racks) > 0):
+		stackers[name] = stackers[name] - 1
+		result['restocks'][name]['stacker'] = result['restocks'][name]['stacker'] + 1
+		result['gripper_moves'][name] = result['gripper_moves'][name] + (2 if stacker_lids.get(name,False) else 1)	#The lid is moved off before the rack
+		if not chute and len(state['active']) >= state['deck_slots']:
+			state['active'] = state['active'][1:]
+		state['active'].append(_new_rack())
+	else:
+		#The refill clears every rack of the type, the open slots it held are free again
+		state['active'] = []
+		state['expansion'] = 0
+		pool['open'] = pool['open'] + state['open']
+		state['open'] = 0
+		#Empty racks of the type parked on other slots are cleared too, and so are other types' empty racks parked on its slots
+		for owner,count in state['lent'].items():
+			if owner == 'spare':
+				pool['spare'] = pool['spare'] + count
+			else:
+				pool['racks'][owner]['parked'] = max(pool['racks'][owner]['parked'] - count,0)
+		state['lent'] = {}
+		state['parked'] = 0
+		for other_state in pool['racks'].values():
+			other_state['lent'].pop(name,None)
+		loaded = _load(state,result,name,state['deck_slots'],state['ex_slots'],max_racks)
+		result['pauses'].append({'pickup' : x, 'rack_name' : name, 'racks_to_load' : loaded, 'stacker' : False})
+		result['restocks'][name]['manual'] = result['restocks'][name]['manual'] + 1
+
+
+def _holes(state):
+	#Free expansion slots of a rack type, not holding a full rack or a parked empty one
+	return state['ex_slots'] - state['expansion'] - state['parked']
+
+
+def _fill_stackers(result,name,x,stackers,stacker_capacity,max_racks):
+	#Mirror of TipTracker.fill_stackers, one pause topping the stackers of a type back up to what they were first loaded with, capped by max_racks
+	count = stacker_capacity.get(name,0) - stackers.get(name,0)
+	if name in max_racks:
+		count = min(count,max(max_racks[name] - result['racks_loaded'][name],0))
+	if count <= 0:
+		return 0
+	stackers[name] = stackers.get(name,0) + count
+	result['racks_loaded'][name] = result['racks_loaded'][name] + count
+	result['pauses'].append({'pickup' : x, 'rack_name' : name, 'racks_to_load' : count, 'stacker' : True})
+	result['restocks'][name]['manual'] = result['restocks'][name]['manual'] + 1
+	return count
+
+
+def main(argv = None):
+	import argparse #Only the command line pays for the import
+	parser = argparse.ArgumentParser(description='Plan tip budgets and layouts from a recorded TipTracker run')
+	parser.add_argument('config',help='json file from TrackerObject.plan_config()')
+	parser.add_argument('--optimize',action='store_true',help='search slot assignments for every rack type')
+	parser.add_argument('--what-if',nargs='?',const='',default=None,help='Monte Carlo over randomized demand, optionally with a json list of candidate configs to compare (default the recorded one)')
+	parser.add_argument('--trials',type=int,default=1000,help='randomized runs per config for --what-if')
+	parser.add_argument('--samples',type=int,help='samples the recorded run was for')
+	parser.add_argument('--sample-range',type=int,nargs=2,metavar=('FEWEST','MOST'),help='samples a run can have, needs --samples')
+	parser.add_argument('--retry',type=float,default=0.0,help='chance each pick up is retried with another tip')
+	parser.add_argument('--workers',type=int,help='processes for --what-if, default every core')
+	parser.add_argument('--seed',type=int,default=0)
+	args = parser.parse_args(argv)
+	if args.trials < 1:
+		parser.error('--trials must be at least 1')
+	with open(args.config) as config_file:
+		config = json.load(config_file)
+	if args.optimize:
+		print(json.dumps(optimize_layout(
+			config['pickups'],
+			stackers=config.get('stackers',None),
+			use_chute=config.get('use_chute',True),
+			use_gripper=config.get('use_gripper',True)),indent=2))
+	elif args.what_if != None:
+		configs = [config]
+		if args.what_if != '':
+			with open(args.what_if) as candidates_file:
+				configs = json.load(candidates_file)
+		print(json.dumps(what_if(config['pickups'],configs,args.trials,args.samples,args.sample_range,args.retry,workers=args.workers,seed=args.seed),indent=2))
+	else:
+		print(json.dumps(plan_config(config),indent=2))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
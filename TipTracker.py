@@ -1,6 +1,11 @@
-from opentrons import protocol_api
-from opentrons.protocol_api.labware import OutOfTipsError
-from opentrons.protocol_api import ALL, COLUMN
+from __future__ import annotations #Annotations are not evaluated when the module loads
+import importlib
+import json
+import math
+import os
+import time
+from bisect import bisect_left
+from collections import deque
 
 #PROTOCOL REQUIREMENTS
 metadata = {
@@ -18,11 +23,243 @@ requirements = {
 '''
 FEATURES TO IMPLEMENT
 1. Edge case for error recovery on last available tip
-2. Add the starting tip for tiptracking, dont use these tips for, can span multiple tipracks
 
 BUGS
 '''
 ##########################
+class _LazyModule:
+	#Stands in for a module until one of its attributes is read, then keeps the attribute so later reads are plain lookups
+	def __init__(self, name):
+		self._name = name
+
+	def __getattr__(self, attr):
+		value = getattr(importlib.import_module(self._name),attr)
+		setattr(self,attr,value)
+		return value
+
+protocol_api = _LazyModule('opentrons.protocol_api')	#Importing the tracker does not import opentrons, a protocol has already imported it by the time a tracker uses it
+_labware = _LazyModule('opentrons.protocol_api.labware')
+
+CHECKPOINT_VERSION = 1
+EVENT_KINDS = ('pickup','swap','carousel','waste','refill','pause','load','assign','substitute','consolidate')
+
+class TipEvent:
+	'''One entry of the tracker's event log. The message is only formatted when a sink asks for it, so events nobody reads cost almost nothing.
+	kind = one of EVENT_KINDS
+	text = message template, formatted with the event fields
+	level = 'info' for events shown in the run log, 'debug' for the detail only printed when debugging
+	time = time.time() the event happened
+	pipette = pipette number, rack = rack load name, slot = deck slot, code = pick_up return code, any of these can be None
+	fields = any other values used by the message'''
+	__slots__ = ('kind', 'text', 'level', 'time', 'pipette', 'rack', 'slot', 'code', 'fields')
+
+	def __init__(self, kind : str, text : str, level : str, time : float, pipette : int | None = None, rack : str | None = None, slot : str | None = None, code : int | None = None, **fields):
+		self.kind = kind
+		self.text = text
+		self.level = level
+		self.time = time
+		self.pipette = pipette
+		self.rack = rack
+		self.slot = slot
+		self.code = code
+		self.fields = fields
+
+	@property
+	def message(self) -> str:
+		return self.text.format(pipette=self.pipette,rack=self.rack,slot=self.slot,code=self.code,**self.fields)
+
+	def as_dict(self) -> dict:
+		return {'kind' : self.kind, 'level' : self.level, 'time' : self.time, 'pipette' : self.pipette, 'rack' : self.rack, 'slot' : self.slot, 'code' : self.code, 'message' : self.message}
+
+	def __repr__(self):
+		return f'TipEvent({self.kind}, {self.message!r})'
+
+class RunLogSink:
+	'''Sink that writes events to the protocol run log with ctx.comment, debug events are skipped unless debug=True'''
+	def __init__(self, ctx : protocol_api.ProtocolContext, debug : bool = False):
+		self.ctx = ctx
+		self.debug = debug
+
+	def __call__(self, event : TipEvent):
+		if self.debug or event.level != 'debug':
+			self.ctx.comment(event.message)
+
+class PrintSink:
+	'''Sink that prints every event, used when debugging'''
+	def __call__(self, event : TipEvent):
+		print(event.message)
+
+class JsonlSink:
+	'''Sink that appends every event as one json line to a file, flushed after each line so a stopped run keeps every event up to the stop. \
+	Nothing is written while the protocol is analyzed, so analysis does not add its events to the file of the real run
+	path = file to write to, it is opened on the first event of a run
+	ctx = protocol context the tracker uses, to tell analysis from a run'''
+	def __init__(self, path : str, ctx : protocol_api.ProtocolContext | None = None):
+		self.path = path
+		self.simulating = ctx.is_simulating() if ctx != None else False
+		self.file = None
+
+	def __call__(self, event : TipEvent):
+		if self.simulating:
+			return
+		if self.file == None:
+			self.file = open(self.path,'a')
+		self.file.write(json.dumps(event.as_dict(),default=str) + '\n')
+		self.file.flush()
+
+	def close(self):
+		if self.file != None:
+			self.file.close()
+			self.file = None
+
+class MemorySink:
+	'''Sink that keeps every event in a list, unlike the tracker's ring buffer nothing is dropped
+	kinds = optional list of event kinds to keep, if None keeps all'''
+	def __init__(self, kinds : list[str] | None = None):
+		self.kinds = kinds
+		self.events : list[TipEvent] = []
+
+	def __call__(self, event : TipEvent):
+		if self.kinds == None or event.kind in self.kinds:
+			self.events.append(event)
+
+class InventoryFileSink:
+	'''Inventory sink that keeps the latest snapshot in a json file, replaced in one step so a reader never sees half a snapshot. Read it with TipMonitor.py
+	path = file to write to'''
+	def __init__(self, path : str):
+		self.path = path
+
+	def __call__(self, snapshot : dict):
+		with open(self.path + '.tmp','w') as snapshot_file:
+			json.dump(snapshot,snapshot_file)
+		os.replace(self.path + '.tmp',self.path)
+
+class InventorySocketSink:
+	'''Inventory sink that sends every snapshot as one json UDP datagram, the run never waits on it and nothing breaks if no one is listening. \
+	Read it with TipMonitor.py --port
+	host = address to send to, port = UDP port'''
+	def __init__(self, host : str = '127.0.0.1', port : int = 8765):
+		import socket #Only protocols that publish to a socket pay for the import
+		self.address = (host,port)
+		self.socket = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+
+	def __call__(self, snapshot : dict):
+		try:
+			self.socket.sendto(json.dumps(snapshot).encode(),self.address)
+		except OSError:
+			pass
+
+	def close(self):
+		self.socket.close()
+
+class InventoryQueueSink:
+	'''Inventory sink that keeps the latest snapshots in memory, for a thread in the same process to read
+	maxlen = snapshots kept, the oldest are dropped'''
+	def __init__(self, maxlen : int = 100):
+		self.snapshots : deque[dict] = deque(maxlen=maxlen)
+
+	def __call__(self, snapshot : dict):
+		self.snapshots.append(snapshot)
+
+	@property
+	def latest(self) -> dict | None:
+		return self.snapshots[-1] if len(self.snapshots) > 0 else None
+
+SIM_SECONDS = {'pick_up' : 6.0, 'gripper_move' : 25.0, 'manual_move' : 0.0, 'stacker_retrieve' : 20.0, 'home' : 8.0, 'pause' : 180.0, 'tip_transfer' : 14.0}	#Rough Flex durations in seconds for the simulated clock, pause is the operator's time
+SIM_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600)																	#Upper edges in simulated seconds of the metrics histograms
+TIMING_SAMPLES = 256																							#Samples kept for the percentiles of each timing, more on short runs
+
+class _Timing:
+	#Running stats of one timing, memory stays the same however many calls are recorded. Percentiles come from an evenly spaced
+	#subset of the samples, every one of them until there are TIMING_SAMPLES * 2 and then every second, fourth, ... call
+	__slots__ = ('count', 'wall', 'sim', 'sim_max', 'histogram', 'samples', 'stride')
+
+	def __init__(self):
+		self.count = 0
+		self.wall = 0.0
+		self.sim = 0.0
+		self.sim_max = None
+		self.histogram = [0] * (len(SIM_BUCKETS) + 1)	#Calls up to each SIM_BUCKETS edge, the last one is for longer calls
+		self.samples = []
+		self.stride = 1
+
+	def add(self, wall, sim):
+		if self.count % self.stride == 0:
+			self.samples.append((wall,sim))
+			if len(self.samples) == TIMING_SAMPLES * 2:
+				self.samples = self.samples[::2]
+				self.stride = self.stride * 2
+		self.count = self.count + 1
+		self.wall = self.wall + wall
+		self.sim = self.sim + sim
+		if self.sim_max == None or sim > self.sim_max:
+			self.sim_max = sim
+		self.histogram[bisect_left(SIM_BUCKETS,sim)] += 1
+
+def _percentile(values, q):
+	#Nearest rank percentile of a sorted list, q in percent. Same as TipPlanner.percentile, kept here so TipTracker.py stays one file
+	if len(values) == 0:
+		return None
+	return values[min(len(values) - 1,max(0,math.ceil(q / 100 * len(values)) - 1))]
+
+def _timing_stats(timings):
+	#Summary of several timings, i.e. one operation on every rack. Samples are thinned to the largest stride so each one stands for as many calls
+	stride = max([timing.stride for timing in timings],default=1)
+	samples = [sample for timing in timings for sample in timing.samples[::stride // timing.stride]]
+	wall = sorted(sample[0] for sample in samples)
+	sim = sorted(sample[1] for sample in samples)
+	sim_max = [timing.sim_max for timing in timings if timing.sim_max != None]
+	histogram = {}
+	for timing in timings:
+		for edge,count in zip(SIM_BUCKETS + ('inf',),timing.histogram):
+			if count > 0:
+				histogram[edge] = histogram.get(edge,0) + count
+	return {'count' : sum([timing.count for timing in timings]), 'wall' : sum([timing.wall for timing in timings]), 'sim' : sum([timing.sim for timing in timings]),
+		'wall_p50' : _percentile(wall,50), 'wall_p95' : _percentile(wall,95), 'sim_p50' : _percentile(sim,50), 'sim_p95' : _percentile(sim,95), 'sim_max' : max(sim_max) if sim_max != [] else None,
+		'histogram' : histogram}
+
+def _well_bit(well_name):
+	#Bit of a well in a rack's occupancy bitmap, wells are counted down each column
+	row = ord(well_name[0].upper()) - ord('A')
+	column = int(well_name[1:])
+	if row < 0 or row > 7 or column < 1 or column > 12:
+		raise ValueError(f'Invalid well {well_name}, must be A1 to H12')
+	return (column - 1) * 8 + row
+
+SLOT_PITCH = (164.0,107.0)	#mm between slot centers in x and y, same as TipPlanner
+LID_STACK_MAX = 5			#Most tiprack lids stacked on one empty rack before they go to the waste with it
+
+def _slot_distance(slot1, slot2):
+	#Straight line mm between the centers of two deck slots, same as TipPlanner.slot_distance
+	return math.hypot((int(slot1[1:]) - int(slot2[1:])) * SLOT_PITCH[0],(ord(slot1[0]) - ord(slot2[0])) * SLOT_PITCH[1])
+
+NUMBER_WORDS = ['one','two','three','four','five','six','seven','eight']
+FULL_RACK = (1 << 96) - 1 #Occupancy bitmap of a full 96 tiprack
+RACK_ROW = sum([1 << (column * 8) for column in range(12)]) #Occupancy bitmap of row A, shifted by the row for the others
+
+class _Lazy:
+	#Attribute kept in a private slot and only created by factory the first time it is read
+	__slots__ = ('factory', 'slot')
+
+	def __init__(self, factory):
+		self.factory = factory
+
+	def __set_name__(self, owner, name):
+		self.slot = owner.__dict__['_lazy_' + name]
+
+	def __get__(self, tracker, owner = None):
+		if tracker == None:
+			return self
+		try:
+			return self.slot.__get__(tracker, owner)
+		except AttributeError:
+			value = self.factory()
+			self.slot.__set__(tracker, value)
+			return value
+
+	def __set__(self, tracker, value):
+		self.slot.__set__(tracker, value)
+
 class TipTracker:
 	'''Create a tip tracking object to easily facitate how protocols that require many tips should have them added to the deck. \
 		Will pause the protocol to refill tips when empty. Or will move extra tipracks from expansion slots to the active deck when out \
@@ -30,39 +267,104 @@ class TipTracker:
 		Track_object = TipTracker(ctx, pipette1, pipette2, waste_bin, use_gripper=False)
 		ctx = protocol_api.ProtocolContext , your protocol context to access protocol information
 		pipette1 = protocol_api.InstrumentContext , your first pipette
-		pipette2 = protocol_api.InstrumentContext , your second pipette 
+		pipette2 = protocol_api.InstrumentContext , your second pipette, can be None
 		waste_bin = protocol_api.WasteChute or protocol_api.TrashBin , the waste being used
 		use_gripper = bool, if True will use the gripper to move labware, if False will use the manual method of moving labware off and on deck. \
+		pipettes = optional list of more pipettes, numbered in order after pipette1 and pipette2 (3, 4, ... when both are given)
+		prefetch_threshold = int, low-water mark of tips left on the active deck, below it prefetch() stages the next rack of that type ahead of time
+		debugging = bool, if True events are also printed, including debug detail
+		suppress_comments = bool, if True events are not written to the run log
+		event_buffer = int, how many of the latest events to keep in TipTracker.events, 0 keeps none
+		sinks = optional list of extra event sinks, any callable taking a TipEvent i.e. JsonlSink('events.jsonl',ctx) or MemorySink()
+		checkpoint_file = optional json file the tracker state is written to after every pick up, swap, refill and prefetch, pass it to TipTracker.restore to resume a stopped run. \
+		Nothing is written while the protocol is analyzed, analysis runs the protocol too and would overwrite the state of the stopped run
+		checkpoint_every = int, save the checkpoint every N pick ups, it is always saved after a swap, refill, prefetch, returned tip or reused tip
+		inventory_sinks = optional list of inventory sinks, any callable taking the inventory() dict i.e. InventoryFileSink('inventory.json'). Nothing is published while the protocol is analyzed
+		inventory_every = int, publish the inventory every N pick ups, it is always published after a swap, refill, prefetch, returned tip or reused tip
+		history_limit = int, most recent pick ups kept in TipTracker.pickup_history, None keeps every pick up of the run for TipPlanner
 		'''
 	#Off deck type name as str OffDeckType.OFF_DECK
 
-	def __init__(self, ctx : protocol_api.ProtocolContext, pipette1 : protocol_api.InstrumentContext, pipette2 : protocol_api.InstrumentContext, waste_bin : protocol_api.WasteChute | protocol_api.TrashBin, use_gripper : bool = False, debugging : bool = False, suppress_comments : bool = False):
+	#Subsystems only some protocols use are created the first time they are read
+	empty_ex_slots = _Lazy(dict)				#Dictionary of empty expansion slots that previously had tips
+	_using_stackers = _Lazy(bool)				#Internal property if stackers are being used
+	stackers = _Lazy(dict)						#Stackers holding each rack type, [module, racks left, racks when full, racks have lids] for each
+	stacker_loaded = _Lazy(dict)				#Racks put into stackers for each rack type by load_tips_in_stacker, refills from fill_stackers are not counted
+	rack_lids = _Lazy(dict)						#Lids stacked on empty racks, thrown out with the rack instead of one gripper trip each
+	slot_adapters = _Lazy(dict)					#Adapters holding tipracks on each slot, racks are moved back onto these
+	reserved = _Lazy(dict)						#Bitmap of wells on each rack kept out of pick ups, only used through pick_up(locus=well)
+	reuse_pool = _Lazy(dict)					#Free list of returned tips for each (reuse tag, channels), kept out of the fresh tip sequence
+	substitutes = _Lazy(dict)					#Rack types each pipette can fall back to, highest weight first, set with set_substitutes
+	open_slots = _Lazy(list)					#More slots kept empty for carousel besides open_slot, added with add_open_slots
+	unloaded_assignments = _Lazy(dict)			#Rack type assigned to each pipette before any rack of it was loaded, given to the pipette when the first one is
+	__slots__ = ('ctx', 'simulating', 'debug', 'pipette1', 'pipette2', 'ex_slots', 'use_gripper', 'waste', 'slot_racks', 'rack_slots', 'rack_locations', 'slot_tiers', 'rack_assignments', 'tip_counts', 'tip_rack_counts', 'use_chute', 'carousel_tips', 'pipettes', 'pipette_numbers', 'pick_up_count', 'drop_count', 'rack_adapters', 'print_comments', 'max_racks_count', 'ignore_slots', 'tip_maps', '_attached', 'prefetch_threshold', 'pickup_history', 'pickup_total', 'starting_slots', 'events', 'sinks', '_logging', '_debug_logging', 'sim_seconds', 'sim_time', 'gripper_moves', 'timings', 'checkpoint_file', 'checkpoint_every', 'inventory_sinks', 'inventory_every', 'open_slot', 'original_open_slot', 'nozzle_starts', '_open_columns',
+		'_lazy_empty_ex_slots', '_lazy__using_stackers', '_lazy_stackers', '_lazy_stacker_loaded', '_lazy_rack_lids', '_lazy_slot_adapters', '_lazy_reserved', '_lazy_reuse_pool', '_lazy_substitutes', '_lazy_open_slots', '_lazy_unloaded_assignments')
+
+	def __init__(self, ctx : protocol_api.ProtocolContext, pipette1 : protocol_api.InstrumentContext, pipette2 : protocol_api.InstrumentContext, waste_bin : protocol_api.WasteChute | protocol_api.TrashBin, use_gripper : bool = False, debugging : bool = False, suppress_comments : bool = False, prefetch_threshold : int | None = None, pipettes : list[protocol_api.InstrumentContext] | None = None, event_buffer : int = 0, sinks : list | None = None, checkpoint_file : str | None = None, checkpoint_every : int = 1, inventory_sinks : list | None = None, inventory_every : int = 1, history_limit : int | None = 10000):
 
 		self.ctx : protocol_api.ProtocolContext = ctx													#ProtocolContext
+		self.simulating : bool = ctx.is_simulating()													#True while the protocol is analyzed, no checkpoint is written then
 		self.debug : bool = debugging																	#Debugging mode flag
 		self.pipette1 : protocol_api.InstrumentContext = pipette1										#First pipette
 		self.pipette2 : protocol_api.InstrumentContext | None = pipette2								#Second Pipette
 		self.ex_slots : list[str] = []															#If using expansion slots
 		self.use_gripper : bool = use_gripper															#If using gripper
 		self.waste : protocol_api.WasteChute | protocol_api.TrashBin = waste_bin						#The waste bin type to use
-		self.tipracks : dict[protocol_api.Labware.load_name : list[str]] = {}							#Active deck tiprack tracker, internal strings are deck slots
-		self.ex_racks : dict[protocol_api.Labware.load_name : list[str]] = {}							#Expansion slots tiprack tracker
-		self.empty_ex_slots : dict[protocol_api.Labware.load_name : list[str]] = {}						#Dictionary of empty expansion slots that previously had tips
+		self.slot_racks : dict[str : protocol_api.Labware] = {}											#Slot index, the tiprack on each tracked slot
+		self.rack_slots : dict[protocol_api.Labware.load_name : dict[str : None]] = {}					#Slots holding each rack type in the order they were filled, dict used as an ordered set
+		self.rack_locations : dict[protocol_api.Labware : str] = {}										#Slot each tracked rack is on
+		self.slot_tiers : dict[str : str] = {}															#'expansion' for expansion slots, slots not in here are active. Stacker racks are not on a slot until they are retrieved
 		self.rack_assignments : dict[protocol_api.Labware.load_name : list[str]] = {}					#Dictionary map of where tipracks should be loaded
 		self.tip_counts : dict[protocol_api.Labware.load_name : int] = {}								#Dictionary of # of used tips for each rack type 
 		self.tip_rack_counts : dict[protocol_api.Labware.load_name : int] = {}							#Dictionary of tipracks loaded for each rack type
 		self.open_slot : str | None = None																#Slot with nothing on it, placeholder slot for carousel
 		self.original_open_slot : str | None = None														#Origional open_slot for carousel
-		self._using_stackers : bool= False																#Internal property if stackers are being used
-		self.stackers : dict[protocol_api.Labware.load_name : list[protocol_api.ModuleContext,int]] = {}#Dictionary of stacker instrument context and number of racks in the stacker, key is rack load name
-		self.use_chute : bool = True if type(waste_bin) == protocol_api.WasteChute else False			#Use waste chute to dispose of tips if present 
-		self.carousel_tips : bool = False if type(waste_bin) == protocol_api.WasteChute else True		#Carousel tips if no waste chute
-		self.pick_up_count : dict[protocol_api.InstrumentContext : int] = {pipette1 : 0, pipette2 : 0} 	#How many time pick up tip has been called for each pipette
-		self.drop_count : dict[protocol_api.InstrumentContext : int] = {pipette1 : 0, pipette2 : 0}		#How many time drop tip has been called for each pipette
+		self.use_chute : bool = type(waste_bin) == protocol_api.WasteChute								#Use waste chute to dispose of tips if present 
+		self.carousel_tips : bool = not self.use_chute													#Carousel tips if no waste chute
+		self.pipettes : dict[int | str | protocol_api.InstrumentContext : protocol_api.InstrumentContext] = {}	#Pipette registry, every pipette keyed by itself, its number and its aliases
+		self.pipette_numbers : dict[protocol_api.InstrumentContext : int] = {}							#Number each registered pipette was given, in the order they were registered
+		self.pick_up_count : dict[protocol_api.InstrumentContext : int] = {} 							#How many time pick up tip has been called for each pipette
+		self.drop_count : dict[protocol_api.InstrumentContext : int] = {}								#How many time drop tip has been called for each pipette
+		self.rack_adapters : dict[protocol_api.Labware.load_name : str] = {}							#Adapter load name for rack types that sit on an adapter, i.e. 96 channel tipracks
 		self.print_comments : bool = not suppress_comments 												#If True, will print comments to the protocol log
 		self.max_racks_count : dict = {}
 		self.ignore_slots : list[str] = []
+		self.tip_maps : dict[protocol_api.Labware : int] = {}											#Occupancy index, bitmap of wells still holding a tip for each tracked rack (bit i is rack.wells()[i])
+		self._attached : dict[protocol_api.InstrumentContext : tuple[protocol_api.Labware,int,protocol_api.Well]] = {}	#Rack, well bitmap and well of the tip currently on each pipette, used to restore the index on return_tip
+		self.nozzle_starts : dict[protocol_api.InstrumentContext : str] = {}							#Primary nozzle of partial layouts set through configure_nozzle_layout
+		self._open_columns : dict[protocol_api.InstrumentContext : tuple[protocol_api.Labware,int]] = {}	#Broken column each single or partial column pipette is working through
+		self.prefetch_threshold : int | None = prefetch_threshold										#Stage the next rack when fewer tips than this are left on the active deck
+		self.pickup_history : deque[tuple[int,str,int]] = deque(maxlen=history_limit)					#(pipette number, rack load name, tips) of the latest pick ups, input for TipPlanner
+		self.pickup_total : int = 0																		#Pick ups made so far, pickup_history only keeps the latest history_limit
+		self.starting_slots : dict[protocol_api.Labware.load_name : list[str]] = {}						#Slots each rack type was loaded on by add_starting_tipracks
+		self.events : deque[TipEvent] = deque(maxlen=event_buffer)										#Ring buffer of the latest events
+		self.sinks : list = ([RunLogSink(ctx)] if self.print_comments else []) + ([PrintSink()] if debugging else []) + (sinks if sinks != None else [])	#Callables every event is sent to
+		self._logging : bool = False																	#False when nothing reads events, call sites skip building them
+		self._debug_logging : bool = False																#False when nothing reads debug events, i.e. only the run log sink is attached
+		self._update_logging()
+		self.sim_seconds : dict[str : float] = dict(SIM_SECONDS)										#Simulated duration of each robot action, edit to match your robot
+		self.sim_time : float = 0.0																		#Simulated seconds spent on tip handling so far
+		self.gripper_moves : int = 0																	#Labware moves made with the gripper
+		self.timings : dict[tuple[str,str,int] : _Timing] = {}											#(operation, rack load name, pipette number) to the running stats of its wall and simulated seconds
+		self.checkpoint_file : str | None = checkpoint_file												#File the state is saved to after every pick up, swap, refill and prefetch
+		self.checkpoint_every : int = checkpoint_every													#Pick ups between checkpoints when nothing was swapped
+		self.inventory_sinks : list = inventory_sinks if inventory_sinks != None else []				#Callables the inventory snapshot is sent to
+		self.inventory_every : int = inventory_every													#Pick ups between inventory snapshots when nothing was swapped
+
 
+		for pip in [pipette1,pipette2] + (pipettes if pipettes != None else []):
+			if pip != None:
+				self.register_pipette(pip)
+
+	@property
+	def tipracks(self) -> dict[str : list[protocol_api.Labware]]:
+		'''Active deck tipracks for each rack type, read from the slot index'''
+		return {name : self._racks(name) for name in self.rack_slots.keys()}
+
+	@property
+	def ex_racks(self) -> dict[str : list[protocol_api.Labware]]:
+		'''Expansion slot tipracks for each rack type, read from the slot index'''
+		return {name : self._racks(name,'expansion') for name in self.rack_slots.keys()}
 
 	def assign_slots(self, tiprack1 : str, slots1 : str | list[str], tiprack2 : str = None,slots2 : list[str] | str = None, tiprack3 : str = None, slots3 : str | list[str] = None):
 		'''Dedicate slots to a tiprack, this is used as the slots to refill racks on the deck when they are out. \
@@ -92,46 +394,44 @@ class TipTracker:
 			slots2 = list of slots to load tiprack2 onto, can be str or list of strings
 			tiprack3 = str of the tiprack load name,
 			slots3 = list of slots to load tiprack3 onto, can be str or list of strings'''
-		for slots in [slots1, slots2, slots3]:
-			if type(slots) == str:
-				slots = [slots]
-
 		#Load labware for each tiprack in each slot
 		for rackname,slots in zip([tiprack1, tiprack2, tiprack3],[slots1, slots2, slots3]):
 			if rackname != None:
-				for slot in slots:
+				for slot in ([slots] if type(slots) in (str,protocol_api.Labware) else slots):
 					if self.max_racks_count.get(rackname,None) != None:
 						if self.max_racks_count[rackname] == self.tip_rack_counts.get(rackname,0):
-							if self.print_comments:
-								self.ctx.comment(f'Max racks of {rackname} reached, not loading more')
-							if self.debug:
-								print(f'Max racks of {rackname} reached, not loading more')
+							if self._logging:
+								self._emit('load','Max racks of {rack} reached, not loading more',rack=rackname)
 							continue
-					if type(slot) == str:
-						rack = self.ctx.load_labware(rackname, slot)
-						if rackname not in self.tip_rack_counts.keys():
-							self.tip_rack_counts[rackname] = 1
-						else:
-							self.tip_rack_counts[rackname] = self.tip_rack_counts[rackname] + 1
+					if type(slot) == protocol_api.Labware: #Adapter passed in place of a slot
+						self.slot_adapters[slot.parent] = slot
+						slot = slot.parent
+					if type(slot) != str:
+						raise TypeError(f'Slot {slot} must be a deck slot name or a tiprack adapter')
+					if slot in self.slot_adapters.keys():
+						rack = self.slot_adapters[slot].load_labware(rackname)
+					elif rackname in self.rack_adapters.keys():
+						rack = self.ctx.load_labware(rackname, slot, adapter=self.rack_adapters[rackname])
+						self.slot_adapters[slot] = rack.parent
 					else:
-						raise TypeError('This class cannot handle tipracks on adapter. 96 channel tip tracking not supported')
-					if self.ex_slots != None and slot in self.ex_slots:
-						if rackname in self.ex_racks.keys():
-							self.ex_racks[rackname].append(rack)
-						else:
-							self.ex_racks[rackname] = [rack]
+						rack = self.ctx.load_labware(rackname, slot)
+					if rackname not in self.tip_rack_counts.keys():
+						self.tip_rack_counts[rackname] = 1
 					else:
-						if rackname in self.tipracks.keys():
-							self.tipracks[rackname].append(rack)
-						else:
-							self.tipracks[rackname] = [rack]
+						self.tip_rack_counts[rackname] = self.tip_rack_counts[rackname] + 1
+					self._index_add(rack,slot)
+				for pip,name in list(self.unloaded_assignments.items()):
+					if name == rackname:
+						self.assign_tipracks(pip,name)
 
-	def pick_up(self, pipette : int | str | protocol_api.InstrumentContext, locus : protocol_api.Labware | protocol_api.Well | None = None, refill_all : bool = False) -> int:
+	def pick_up(self, pipette : int | str | protocol_api.InstrumentContext, locus : protocol_api.Labware | protocol_api.Well | None = None, refill_all : bool = False, reuse_tag : str | None = None) -> int:
 		'''Main use of the tracker function. If we run out of tips using this method, instead of an error being thrown it will check for extra racks in expansion slots \
 		or prompt users to phyically refill the tips. It will use the waste chute to throw out the empty tip racks before it needs to refill.
-		pipette = Any of the following (1,'One','one','1') or (2,'2',self.pipette2,'two','Two') to indicate which pipette to use
+		pipette = the pipette object, its number (1,'1','one','One') or any alias given to register_pipette
 		locus = optional Labware or Well to use to pick up tip, for example reuse tips
-		refill_all = bool, if True will refill all other empty racks with tips when out of the needed tip, if False will only refill the assigned tipracks that are out
+		refill_all = bool, if True will refill all other empty racks with tips when out of the needed tip in the same operator prompt, if False will only refill the assigned tipracks that are out
+		reuse_tag = optional tag of a tip returned with drop_tip(reuse_tag=...), i.e. a sample ID or reagent. Picks up a returned tip with that tag \
+		if one fits the active nozzles, otherwise a fresh tip
 		
 		Returns Integer corresponding to the following:
 		0 - Just Pickup, succesful pickup, no swap needed
@@ -139,154 +439,146 @@ class TipTracker:
 		2 - Wasted Tip, Grabbed from expansion
 		3 - Wasted Tip, Grabbed from stacker
 		4 - Manual Refill started
+		5 - Switched to a substitute rack type that still had tips on deck, see set_substitutes
 		'''
 		#Assign proper pipette and check what tips are currently assigned
-		pip = self.pipette1 if pipette in (1,'1',self.pipette1,'one','One') else self.pipette2 if pipette in (2,'2',self.pipette2,'two','Two') else None
-		if pip == None:
-			raise ValueError(f"Invalid pipette: {pipette}, must be in [1,'1',self.pipette1,'one','One'] or [2,'2',self.pipette2,'two','Two']")
+		started = self._start()
+		pip = self._pipette(pipette)
 		self.pick_up_count[pip] = self.pick_up_count[pip] + 1
+		if reuse_tag != None and self.reuse_pool.get((reuse_tag,pip.active_channels),None):
+			return self._reuse_tip(pip,reuse_tag,started)
 		#update tiprack list if deck has changed since last pick up
 		rack_name = pip.tip_racks[0].load_name
-		pip.tip_racks = self.tipracks[rack_name]
-		old_rack_slots = [slot for slot in self.rack_assignments[rack_name]] # Get the slots that are not expansion slots
-		waste_slots = [slot for slot in old_rack_slots if slot not in self.ex_slots]
-		#Add rack slots to a dictionary IFF they have no tips
-		other_rack_slots = { rack_load_name : [rack.parent for rack in rack_list if not any([well.has_tip for well in rack.wells()])] for rack_load_name,rack_list in self.tipracks.items() if rack_load_name != rack_name} # Move these to waste
-		empty_tip_slots = {rack_load_name : [slot for slot in racklist if self.ctx.deck[slot] == None] for rack_load_name, racklist in self.rack_assignments.items()} # Load these plus other racks slots
+		pip.tip_racks = self._racks(rack_name)
+		substituted = False
 		
 		if self.open_slot != None and self.original_open_slot == None:
 			self.original_open_slot = self.open_slot
-		#Try and pick up tip
-		try:	
-			pip.pick_up_tip(locus)
-			return_code =  0
-		except OutOfTipsError:
-			if self.print_comments:
-				self.ctx.comment('Out of tips, starting refilling process')
-			if self.debug:
-				print('Out of tips, starting refilling process')
-			#Trash old tips
-			if not self.carousel_tips: #Trash tips in waste chute if able
-				for slot in waste_slots:
-					if self.ctx.deck[slot] != None and self.ctx.deck[slot].load_name == rack_name:
-						self.waste_tips(slot)
-			#If out of tips and no expansions, refill tips of the same size
-			if self.ex_slots == None and self._using_stackers == False:
-				if self.print_comments:
-					self.ctx.comment('No expansion slots defined, Refilling Manually') # Dont have to worry about carousel here, no ex slots
-				if self.debug:
-					print('No expansion slots defined, Refilling Manually')
-				self.refill_tips(rack_name,old_rack_slots)
-				self.ctx.home()
-				self.ctx.pause(f"Please place {rack_name} onto slots {old_rack_slots}")
-				self.assign_tipracks(pipette,rack_name)
-				#Optionally refill all used tip racks, dont think this counts expansion deck slots
-				if refill_all:
-					if self.print_comments:
-						self.ctx.comment('Refilling all other tips')
-					if self.debug:
-						print('Refilling all other tips')
-					for other_rack_names,other_slots in other_rack_slots.items():
-						if other_slots != [] or empty_tip_slots[other_rack_names] != []:
-							if other_slots != []:
-								self.waste_tips(other_slots)
-							self.ctx.home()
-							self.ctx.pause(f"Please place {other_rack_names} onto slots {other_slots + empty_tip_slots[other_rack_names]}")
-							self.refill_tips(other_rack_names,other_slots + empty_tip_slots[other_rack_names])
-				pip.pick_up_tip(locus)
-				return_code = 4
-			else:
-				if self.print_comments:			
-					self.ctx.comment('Expansion slots or stackers defined, starting refilling process')
-				if self.debug:
-					print('Expansion slots defined, starting refilling process')
-				if refill_all:
-					if self.print_comments:
-						self.ctx.comment('Refilling all other tips')
-					if self.debug:
-						print('Refilling all other tips')
-					for other_rack_names,other_slots in other_rack_slots.items():
-						if other_slots != [] or empty_tip_slots[other_rack_names] != []:
-							if other_slots != []:
-								self.waste_tips(other_slots)
-							self.ctx.home()
-							self.ctx.pause(f"Please place {other_rack_names} onto slots {other_slots + empty_tip_slots[other_rack_names]}")
-							self.refill_tips(other_rack_names,other_slots + empty_tip_slots[other_rack_names])
-				if rack_name in self.ex_racks.keys() and self.ex_racks[rack_name] != []:
-					if self.print_comments:
-						self.ctx.comment('Tiprack on expansion slot, moving to active deck')
-					if self.debug:
-						print('Tiprack on expansion slot, moving to active deck')
-					if self.carousel_tips:
-						swap = False
-						for old_rack,e_rack in zip(self.tipracks[rack_name],self.ex_racks[rack_name]):
-							if all([well.has_tip for well in e_rack.wells()]):
-								self.carousel(old_rack,e_rack)
-								return_code = 1
-								swap = True
-						if swap == False:
-							if self.print_comments:
-								self.ctx.comment('No Tipracks on Expansion Slots have tips, beginning refill process')
-							if self.debug:
-								print('No Tipracks on Expansion Slots have tips, beginning refill process')
-							self.refill_tips(rack_name,self.rack_assignments[rack_name])
-						return_code = 4
-
-					else:
-						for e_rack, open_slot in zip(self.ex_racks[rack_name],waste_slots): #This needs a check for if expansion slot has tips 
-							e_slot_source = e_rack.parent
-							self.ctx.move_labware(e_rack, open_slot,use_gripper=self.use_gripper)
-							if rack_name in self.empty_ex_slots.keys():
-								self.empty_ex_slots[rack_name].append(e_slot_source)
-							else:
-								self.empty_ex_slots[rack_name] = [e_slot_source]
-							return_code = 2
-					self.reset_rack_list(rack_name)			
-					self.assign_tipracks(pipette,rack_name)
-					
-					pip.pick_up_tip(locus)
-				elif rack_name in self.stackers.keys() and self.stackers[rack_name][1] > 0:
-					if self.print_comments:
-						self.ctx.comment('Tiprack in stacker, moving to active deck')
-					if self.debug:
-						print('Tiprack in stacker, moving to active deck')
-					next_rack = self.move_from_stacker(rack_name)
-					self._shuttle_labware(next_rack,empty_tip_slots[rack_name])
-					self.reset_rack_list(rack_name)
-					self.assign_tipracks(pipette,rack_name)
-					pipette.pick_up_tip(locus)
-					return_code = 3
-				else:
-					if self.ex_racks:
-						if self.print_comments:
-							self.ctx.comment('No remaining tipracks on expansion deck, manual refill needed')
-						if self.debug:
-							print('No remaining tipracks on expansion deck, manual refill needed')
-					elif self._using_stackers:
-						if self.print_comments:
-							self.ctx.comment('No remaining tipracks in stackers, manual refill needed')
-						if self.debug:
-							print('No remaining tipracks in stackers, manual refill needed')
-						self.stackers[rack_name].fill(count=7)
-						self.stackers[rack_name][1] = 7
-					self.ctx.home()
-					self.refill_tips(rack_name,self.rack_assignments[rack_name])
-					self.reset_rack_list(rack_name)
-					self.assign_tipracks(pipette,rack_name)
-					self.open_slot = self.original_open_slot
-
-					pip.pick_up_tip(locus)
-					return_code =  4
-					
-					#Pause protocol and prompt user to load new tipracks, could we have option to add all tipracks
+		#Plan the next tip from the occupancy index so running out is found before the pipette is asked to pick up
+		target = locus if type(locus) == protocol_api.Well else self.next_tip(pip,locus)
+		if target == None and locus == None and pip in self.substitutes and self._supply(rack_name) == 0:
+			#Fall back to a compatible rack type before anything has to pause
+			substitute = self._substitute(pip,rack_name)
+			if substitute != None:
+				rack_name,target = substitute
+				substituted = True
+		if target != None:
+			self._pick_up_tip(pip,target)
+			return_code =  5 if substituted else 0
+		else:
+			restock_started = self._start()
+			return_code = self._restock(pipette,pip,rack_name,locus,refill_all)
+			self._record('refill' if return_code == 4 else 'swap',restock_started,rack_name,pip)
 
 		if rack_name in self.tip_counts.keys():
 			self.tip_counts[rack_name] = self.tip_counts[rack_name] + pip.active_channels
 		else:
 			self.tip_counts[rack_name] = pip.active_channels
+		self.pickup_history.append((self.pipette_numbers[pip],rack_name,pip.active_channels))
+		self.pickup_total = self.pickup_total + 1
+		if self.checkpoint_file != None and (return_code != 0 or self.pickup_total % self.checkpoint_every == 0):
+			self.save_checkpoint()
+		if self.inventory_sinks != [] and (return_code != 0 or self.pickup_total % self.inventory_every == 0):
+			self.publish_inventory()
+		self._record('pick_up',started,rack_name,pip)
+		if self._debug_logging:
+			self._emit('pickup','Picked up {tips} {rack} with pipette {pipette}, code {code}',level='debug',pipette=self.pipette_numbers[pip],rack=rack_name,code=return_code,tips=pip.active_channels)
+		return return_code
+
+	def _restock(self,pipette,pip,rack_name,locus,refill_all):
+		'''Internal refill chain for pick_up once the assigned rack type has no tips left on the active deck. Returns the pick_up code'''
+		if self._logging:
+			self._emit('refill','Out of tips of {rack}, starting refilling process',pipette=self.pipette_numbers[pip],rack=rack_name)
+		#Full deck views are only needed once a rack type is exhausted, empty racks are read from the occupancy index
+		old_rack_slots = [slot for slot in self.rack_assignments[rack_name]] # Get the slots that are not expansion slots
+		waste_slots = [slot for slot in old_rack_slots if slot not in self.ex_slots]
+		#Add rack slots to a dictionary IFF they have no tips
+		other_rack_slots = { rack_load_name : [slot for slot in rack_slots if self.slot_tiers.get(slot,'active') == 'active' and self.tips_in_rack(self.slot_racks[slot]) == 0] for rack_load_name,rack_slots in self.rack_slots.items() if rack_load_name != rack_name} # Move these to waste
+		empty_tip_slots = {rack_load_name : [slot for slot in racklist if self._slot_free(slot)] for rack_load_name, racklist in self.rack_assignments.items()} # Load these plus other racks slots
+		#Take the next rack out of a stacker before trashing so its lid can ride to the waste on an old rack
+		next_rack = None
+		if self._racks(rack_name,'expansion') == [] and self.stacker_inventory(rack_name) > 0:
+			old_racks = [self.slot_racks[slot] for slot in waste_slots if slot in self.rack_slots.get(rack_name,{})]
+			next_rack = self.move_from_stacker(rack_name,waste_slots[0] if waste_slots != [] else None,old_racks[0] if old_racks != [] and not self.carousel_tips else None)
+		#Trash old tips
+		if not self.carousel_tips: #Trash tips in waste chute if able
+			for slot in waste_slots:
+				if slot in self.rack_slots.get(rack_name,{}):
+					self.waste_tips(slot)
+		#Gather every refill first so the operator is only interrupted once
+		refills = {}
+		if refill_all:
+			if self._logging:
+				self._emit('refill','Refilling all other tips')
+			for other_rack_names,other_slots in other_rack_slots.items():
+				if other_slots != [] or empty_tip_slots[other_rack_names] != []:
+					refills[other_rack_names] = other_slots + empty_tip_slots[other_rack_names]
+		#If out of tips and no expansions, refill tips of the same size
+		if self.ex_slots == None and self._using_stackers == False:
+			if self._logging:
+				self._emit('refill','No expansion slots defined, Refilling Manually',rack=rack_name) # Dont have to worry about carousel here, no ex slots
+			refills[rack_name] = old_rack_slots
+			self.refill_batch(refills)
+			self.assign_tipracks(pipette,rack_name)
+			self._pick_up_tip(pip,locus)
+			return_code = 4
+		else:
+			if self._debug_logging:
+				self._emit('refill','Expansion slots or stackers defined, starting refilling process',level='debug')
+			if self._racks(rack_name,'expansion') != []:
+				if self._logging:
+					self._emit('swap','Tiprack of {rack} on expansion slot, moving to active deck',rack=rack_name)
+				if self.carousel_tips:
+					if self.carousel_racks(rack_name) > 0:
+						return_code = 1
+					else:
+						if self._logging:
+							self._emit('refill','No Tipracks on Expansion Slots have tips, beginning refill process',rack=rack_name)
+						refills[rack_name] = self.rack_assignments[rack_name]
+						return_code = 4
+
+				else:
+					for e_rack, open_slot in zip(self._racks(rack_name,'expansion'),waste_slots): #This needs a check for if expansion slot has tips 
+						self._shuttle_labware(e_rack,open_slot)
+						return_code = 2
+				if refills != {}:
+					self.refill_batch(refills)
+				self.assign_tipracks(pipette,rack_name)
+				
+				self._pick_up_tip(pip,locus)
+			elif next_rack != None:
+				if self._logging:
+					self._emit('swap','Tiprack of {rack} in stacker, moving to active deck',rack=rack_name)
+				self._shuttle_labware(next_rack,self._stacker_target(rack_name))
+				if refills != {}:
+					self.refill_batch(refills)
+				self.assign_tipracks(pipette,rack_name)
+				self._pick_up_tip(pip,locus)
+				return_code = 3
+			else:
+				if rack_name in self.stackers.keys():
+					if self._logging:
+						self._emit('refill','No remaining tipracks in stackers, refilling stackers',rack=rack_name)
+					if self.fill_stackers(rack_name) > 0:
+						self._shuttle_labware(self.move_from_stacker(rack_name,waste_slots[0] if waste_slots != [] else None),self._stacker_target(rack_name))
+					else:
+						refills[rack_name] = self.rack_assignments[rack_name]
+				else:
+					if self._logging:
+						self._emit('refill','No remaining tipracks on expansion deck, manual refill needed',rack=rack_name)
+					refills[rack_name] = self.rack_assignments[rack_name]
+				if refills != {}:
+					self.refill_batch(refills)
+				self.assign_tipracks(pipette,rack_name)
+				self.open_slot = self.original_open_slot
+
+				self._pick_up_tip(pip,locus)
+				return_code =  4
+				
+				#Pause protocol and prompt user to load new tipracks, could we have option to add all tipracks
 		return return_code
 
-	def add_starting_tipracks(self, tiprack1 : str, slots1 : str | list[str], tiprack2 : str = None,slots2 : list[str] | str = None, tiprack3 : str = None, slots3 : str | list[str] = None, max_racks_1 : int = None, max_racks_2 : int = None, max_racks_3 : int = None):
+	def add_starting_tipracks(self, tiprack1 : str, slots1 : str | list[str], tiprack2 : str = None,slots2 : list[str] | str = None, tiprack3 : str = None, slots3 : str | list[str] = None, max_racks_1 : int = None, max_racks_2 : int = None, max_racks_3 : int = None, starting_tip_1 : int = 0, starting_tip_2 : int = 0, starting_tip_3 : int = 0, reserved : dict[str : list] | None = None):
 		'''Load tipracks onto the deck and assign the proper slots to reload them onto. This method should always be used to the first set of tipracks just to ensure they properly \
 			match, but these variables could be different. i.e. you do not want the tipracks to be refilled onto the same slots as they start on. Can take three tipracks-slot pairs at once.
 			tiprack1 = str of the tiprack load name,
@@ -294,7 +586,11 @@ class TipTracker:
 			tiprack2 = str of the tiprack load name,
 			slots2 = list of slots to load tiprack2 onto, can be str or list of strings
 			tiprack3 = str of the tiprack load name,
-			slots3 = list of slots to load tiprack3 onto, can be str or list of strings'''
+			slots3 = list of slots to load tiprack3 onto, can be str or list of strings
+			max_racks_1, max_racks_2, max_racks_3 = optional most racks of each type to load over the run
+			starting_tip_1, starting_tip_2, starting_tip_3 = tips already used from each type when the run starts, counted down the columns of each rack \
+			in the order of its slots, i.e. 100 skips the first rack and the first 4 wells of the second. See set_starting_tip
+			reserved = optional dict of slot to wells to keep out of pick ups, see reserve_tips'''
 		assign_slots = [slots1, slots2, slots3]
 		tipracks = [tiprack1, tiprack2, tiprack3]
 		for slot, rack in zip(assign_slots,tipracks):
@@ -313,13 +609,59 @@ class TipTracker:
 					self.max_racks_count[tiprack] = max_rack
 		self.load_tipracks(tiprack1,slots1,tiprack2,slots2,tiprack3,slots3)
 		self.assign_slots(tiprack1,slots1,tiprack2,slots2,tiprack3,slots3)
+		for tiprack in tipracks:
+			if tiprack != None:
+				self.starting_slots[tiprack] = list(self.rack_assignments[tiprack])
+		for tiprack,starting_tip in zip(tipracks,[starting_tip_1, starting_tip_2, starting_tip_3]):
+			if tiprack != None and starting_tip != 0:
+				self.set_starting_tip(tiprack,starting_tip)
+		if reserved != None:
+			self.reserve_tips(reserved)
+
+	def set_starting_tip(self, rack_name : str, starting_tip : int):
+		'''Mark tips as already used so a run can start on partly used racks. Tips are counted down the columns of each rack of the type \
+		on the active deck in the order its slots were given, so the offset can span several racks. Racks in expansion slots are always full, \
+		put partly used racks on the active deck. The tips are only removed from the tracker's occupancy index, pick_up never scans for them.
+		rack_name = tiprack load name
+		starting_tip = number of tips already used, i.e. 0 is a full first rack, 100 skips the first rack and wells A1 to D1 of the second'''
+		racks = self._racks(rack_name)
+		if type(starting_tip) != int or starting_tip < 0 or starting_tip > len(racks) * 96:
+			raise ValueError(f'Starting tip {starting_tip} must be an integer between 0 and the {len(racks) * 96} tips of {rack_name} on the active deck, racks in expansion slots have to be full')
+		for rack in racks:
+			if starting_tip <= 0:
+				break
+			tip_map = self.tip_maps[rack] if rack in self.tip_maps else self._track_rack(rack)
+			self.tip_maps[rack] = tip_map & ~((1 << min(starting_tip,96)) - 1)
+			starting_tip = starting_tip - 96
+		if self._logging:
+			self._emit('load','Skipping used tips of {rack}, {tips} tips left',rack=rack_name,tips=self.tips_remaining(rack_name))
+
+	def reserve_tips(self, reserved : dict[str : list]):
+		'''Keep wells out of the tracker's pick ups, i.e. columns saved for reusing tips with pick_up(locus=well). Reserved wells are never handed out by pick_up \
+		and tips returned to them stay reserved. Reservations belong to the rack on the slot now, refilled racks are not reserved.
+		reserved = dict of slot to the wells to reserve on the rack there, well names like 'A12' or column numbers 1 to 12 for whole columns, i.e. {'A1' : [12], 'A2' : ['A1','B1']}'''
+		for slot,wells in reserved.items():
+			rack = self.slot_racks.get(slot,None)
+			if rack == None:
+				raise ValueError(f'No tiprack on slot {slot} to reserve tips on')
+			reserved_map = 0
+			for well in ([wells] if type(wells) in (str,int) else wells):
+				if type(well) == int:
+					if well < 1 or well > 12:
+						raise ValueError(f'Invalid column {well}, must be 1 to 12')
+					reserved_map = reserved_map | (0xFF << ((well - 1) * 8))
+				else:
+					reserved_map = reserved_map | (1 << _well_bit(well))
+			self.reserved[rack] = self.reserved.get(rack,0) | reserved_map
+			tip_map = self.tip_maps[rack] if rack in self.tip_maps else self._track_rack(rack)
+			self.tip_maps[rack] = tip_map & ~reserved_map
 
 	def reset_rack_list(self,rack_name):
 		'''Fetches a rackname and resets its internal data for the type of rack. Can be useful when you move the deck around with the gripper, \
 		place new racks on the deck or even perform manual moves of labware 
 		rack_name = str of the rack load name to reset, i.e. opentrons_flex_96_tiprack_50ul'''
-		rack_list = []
-		ex_list = []
+		for slot in list(self.rack_slots.get(rack_name,{}).keys()):
+			self._index_remove(slot,forget_tips=False)
 		for slot,item in self.ctx.deck.items(): 
 			if not item or item in self.ctx.loaded_modules.values():
 				continue
@@ -328,12 +670,10 @@ class TipTracker:
 			else:
 				rack_obj = item
 			if rack_obj.load_name == rack_name:
-				if slot in self.ex_slots:
-					ex_list.append(rack_obj)
-				else:
-					rack_list.append(rack_obj)
-		self.tipracks[rack_name] = rack_list
-		self.ex_racks[rack_name] = ex_list
+				self._index_add(rack_obj,slot)
+		#Drop occupancy for racks of this type that are no longer on the deck
+		for rack in [rack for rack in self.tip_maps if rack.load_name == rack_name and rack not in self.rack_locations]:
+			self._forget_rack(rack)
 
 
 	def add_expansion_slots(self, slots):
@@ -359,41 +699,54 @@ class TipTracker:
 		invalid_slots = [x for x in self.ex_slots if x not in ['A4','B4','C4','D4']]
 		if len(invalid_slots) > 0:
 			raise ValueError(f"Invalid expansion slots: {invalid_slots}, slots must be A4, B4, C4, or D4")
+		for slot in self.ex_slots:
+			self.slot_tiers[slot] = 'expansion'
 			
-	def drop_tip(self, pipette : int | str | protocol_api.InstrumentContext, locus : protocol_api.Labware | protocol_api.Well | None = None, return_tip : bool = False):
+	def drop_tip(self, pipette : int | str | protocol_api.InstrumentContext, locus : protocol_api.Labware | protocol_api.Well | None = None, return_tip : bool = False, reuse_tag : str | None = None):
 		'''Drop tip at locus, if locus is None will drop tip at the default waste bin if dropping or back to its original slot if returning. 
-		pipette = 1 or 2, corresponding to which order you loaded them in
+		pipette = the pipette object, its number or an alias
 		locus = labware or well to drop tip at, if None will drop at default waste bin
-		return_tip = bool, if True will return tip to original slot instead of dropping it at the waste bin'''
-		pip = self.pipette1 if pipette in (1,'1',self.pipette1,'one','One') else self.pipette2 if pipette in (2,'2',self.pipette2,'two','Two') else None
-		if pip == None:
-			raise ValueError(f"Invalid pipette number {pipette}, must be 1 or 2, as strings or integers or pipette objects")
+		return_tip = bool, if True will return tip to original slot instead of dropping it at the waste bin
+		reuse_tag = optional tag, i.e. a sample ID or reagent. Returns the tip to its well and keeps it for pick_up(reuse_tag=...) with the same tag \
+		instead of handing it out as a fresh tip. Returned tips are lost if their rack is swapped out'''
+		pip = self._pipette(pipette)
 		self.drop_count[pip] = self.drop_count[pip] + 1
-		if return_tip:
+		attached = self._attached.pop(pip,None)
+		if return_tip or reuse_tag != None:
 			pip.return_tip(locus)
+			if attached != None and attached[0] in self.tip_maps:
+				if reuse_tag != None:
+					key = (reuse_tag,pip.active_channels)
+					if key not in self.reuse_pool.keys():
+						self.reuse_pool[key] = deque()
+					self.reuse_pool[key].append(attached)
+				else:
+					self.tip_maps[attached[0]] = self.tip_maps[attached[0]] | (attached[1] & ~self.reserved.get(attached[0],0))
+			if self.checkpoint_file != None:
+				self.save_checkpoint()
+			if self.inventory_sinks != []:
+				self.publish_inventory()
 		else:
 			pip.drop_tip(locus)
 
 			
-	def replace_tips(self,old_rack_name : str, new_rack_name : str , number_to_replace : int | None = None, manually_remove = True):
+	def replace_tips(self,old_rack_name : str, new_rack_name : str , number_to_replace : int | None = None, manually_remove = True, consolidate : bool = False):
 		'''Remove a certain number (or all) of a certain type of tiprack to replace with a new type. \
 		Useful when you no longer need a type of tip on deck and you want the space for something else.
 		old_racks = list of tiprack labware objects to replace, can be a list of labware or a single labware object
 		new_rack_name = str of the new tiprack load name
-		number_to_replace = int of how many to replace, if None will replace all of that type'''
-		if self.print_comments:
-			self.ctx.comment(f'Replacing {number_to_replace} {old_rack_name} with {new_rack_name}')
-		if self.debug:
-			print('Replacing {number_to_replace} {old_rack_name} with {new_rack_name}')
+		number_to_replace = int of how many to replace, if None will replace all of that type
+		consolidate = bool, if True the tips left in the racks being replaced are first moved into the gaps of the old type's remaining racks, see consolidate'''
+		if self._logging:
+			self._emit('refill','Replacing {number} {rack} with {new_rack}',rack=old_rack_name,new_rack=new_rack_name,number=number_to_replace)
 		slot_list = self.rack_assignments[old_rack_name][:number_to_replace]
-		if self.print_comments:
-			self.ctx.comment('Replacing tipracks')
-		if self.debug:
-			print('Replacing Tipracks')
+		if consolidate and number_to_replace != None:
+			self.consolidate(old_rack_name,max_transfers=96 * len(slot_list),slots=slot_list)
 		self.ctx.home()
+		self._tick('home')
 		self.clear_old(old_rack_name,slot_list,manually_remove)
-		new_rack_slot_list = self.rack_assignments[new_rack_name].extend(slot_list)
-		old_rack_slot_list = [] if number_to_replace == None else self.rack_assignments[old_rack_name][self.rack_assignments[old_rack_name][number_to_replace:]]
+		new_rack_slot_list = self.rack_assignments.get(new_rack_name,[]) + slot_list
+		old_rack_slot_list = self.rack_assignments[old_rack_name][len(slot_list):]
 		#Option to remove the old assignment 
 		self.assign_slots(tiprack1=new_rack_name,slots1=new_rack_slot_list,
 						tiprack2=old_rack_name,slots2=old_rack_slot_list)
@@ -407,188 +760,1109 @@ class TipTracker:
 		slots = list of slots to refill, if str or labware will be converted to list. Labware should be passed only if it is a tiprack adapter'''
 		if self.ignore_slots != []:
 			slots = [slot for slot in slots if slot not in self.ignore_slots]
-			if self.print_comments:
-				self.ctx.comment(f'Ignoring slots {self.ignore_slots} for refill')
-			if self.debug:
-				print(f'Ignoring slots {self.ignore_slots} for refill')
-		if self.print_comments:
-			self.ctx.comment(f'Refilling tips of {name} on {slots}')
-		if self.debug:
-			print(f'Refilling tips of {name} on {slots}')
+			if self._debug_logging:
+				self._emit('refill','Ignoring slots {slots} for refill',level='debug',slots=self.ignore_slots)
+		if self._logging:
+			self._emit('refill','Refilling tips of {rack} on {slots}',rack=name,slots=slots)
 		self.clear_old(name)
 		
 		self.load_tipracks(name,slots)
 
+	def refill_batch(self, refills : dict[str : list[str]]):
+		'''Refill several rack types in one visit: home once, give the operator one prompt listing every slot, then clear and load all racks in one pass. \
+		pick_up uses this for manual refills and refill_all. Racks of a type that sit on its refill slots or have no tips left are removed first, \
+		thrown out with the gripper if using the waste chute or listed in the prompt for the operator otherwise.
+		refills = dict of tiprack load name to the slots to load fresh racks onto'''
+		toss_tips = self.use_chute and self.use_gripper
+		loads = {}
+		clears = {}
+		for name,slots in refills.items():
+			slots = [slots] if type(slots) == str else slots
+			loads[name] = [slot for slot in slots if slot not in self.ignore_slots]
+			if self.max_racks_count.get(name,None) != None:
+				loads[name] = loads[name][:max(self.max_racks_count[name] - self.tip_rack_counts.get(name,0),0)]
+			clears[name] = [slot for slot in self.rack_slots.get(name,{}) if slot in slots or self.tips_in_rack(self.slot_racks[slot]) == 0]
+		for name in list(loads.keys()):
+			#Carousel can park an empty rack of another type on a refill slot, it is cleared too. A rack that still has tips keeps its slot
+			for slot in [slot for slot in loads[name] if slot in self.slot_racks and self.slot_racks[slot].load_name != name]:
+				other = self.slot_racks[slot].load_name
+				if self.tips_in_rack(self.slot_racks[slot]) == 0:
+					clears[other] = clears.get(other,[]) + ([slot] if slot not in clears.get(other,[]) else [])
+				else:
+					loads[name].remove(slot)
+		prompt = []
+		for name in clears.keys():
+			if clears[name] != [] and not toss_tips:
+				prompt.append(f'remove {name} from {clears[name]}')
+		for name in loads.keys():
+			if loads[name] != []:
+				prompt.append(f'place {name} onto {loads[name]}')
+		if self._logging:
+			self._emit('refill','Refilling {racks} in one pass, loading {loads}, clearing {clears}',racks=list(loads.keys()),loads=loads,clears=clears)
+		if toss_tips:
+			for name in clears.keys():
+				if clears[name] != []:
+					self.clear_old(name,clears[name],save_tips=False,prompt=False)
+		self.ctx.home()
+		self._tick('home')
+		if prompt != []:
+			self._pause('Please ' + ', '.join(prompt),' + '.join(loads.keys()))
+		if not toss_tips:
+			for name in clears.keys():
+				if clears[name] != []:
+					self.clear_old(name,clears[name],prompt=False)
+		for name in loads.keys():
+			if loads[name] != []:
+				self.load_tipracks(name,loads[name])
+
 	def waste_tips(self, slots):
 		'''Move tipboxes to waste, this is done automatically when a all types of a tip are used or when refill_all=True for tip pickup but can be used to manually move tips from any slots to waste. \
-		If called manually, make sure to use clear_old on the slots after to remove it from internal data \
+		The racks are taken out of the slot index along with their occupancy, reservations and reused tips, so clear_old is not needed after \
 		slots = list of slots to move to waste, if str or labware will be converted to list. Labware should be passed only if it is a tiprack adapter'''
-		if self.print_comments:
-			self.ctx.comment(f'Wasting tips on slots {slots}: Using gripper : {self.use_gripper}')
-		if self.debug:
-			print(f'Wasting tips on slots {slots}: Using gripper : {self.use_gripper}')
+		if self._logging:
+			self._emit('waste','Wasting tips on slots {slots}: Using gripper : {gripper}',slots=slots,gripper=self.use_gripper)
+		started = self._start()
 		if type(slots) == str or type(slots) == protocol_api.Labware:
 			slots = [slots]
+		slots = [self.rack_locations.get(slot,slot) if type(slot) == protocol_api.Labware else slot for slot in slots]
 		if self.use_chute and self.use_gripper:
 			for slot in slots:
 				if slot in self.ignore_slots:
-					if self.debug:
-						print(f'Ignoring slot {slot} for waste tips')
+					if self._debug_logging:
+						self._emit('waste','Ignoring slot {slot} for waste tips',level='debug',slot=slot)
 					continue
-				self.ctx.move_labware(self.ctx.deck[slot], self.waste,use_gripper=self.use_gripper)
+				rack = self._index_remove(slot)
+				self._move(rack if rack != None else self.ctx.deck[slot], self.waste)
 		else:
 			for slot in slots:
 				if slot in self.ignore_slots:
-					if self.debug:
-						print(f'Ignoring slot {slot} for waste tips')
+					if self._debug_logging:
+						self._emit('waste','Ignoring slot {slot} for waste tips',level='debug',slot=slot)
 					continue
-				self.ctx.move_labware(self.ctx.deck[slot], protocol_api.OFF_DECK)
+				rack = self._index_remove(slot)
+				self._move(rack if rack != None else self.ctx.deck[slot], protocol_api.OFF_DECK, False)
+		self._record('waste',started)
 
 	def assign_tipracks(self, pipette : int | str | protocol_api.InstrumentContext, name : str):
 		'''Assign tipracks to pipette, this is done automatically when loading tips but can be used to reassign if needed.\
 		Instead of pip.tip_racks = [tipracks], use trackerObj.assign_tipracks(1,opentrons_flex_96_filtertip_50ul).\
-		pipette = 1 or 2, corresponding to which order you loaded them in
+		A rack type can be assigned before any of it is loaded, the pipette gets the racks once they are. A 96 channel pipette has to be assigned \
+		its rack type before add_starting_tipracks so the racks are loaded on the tiprack adapter.
+		pipette = the pipette object, its number or an alias
 		name = tiprack load name as str'''
-		if self.print_comments:
-			self.ctx.comment(f'Reassigning tipracks of {pipette} to {name}')
-		if self.debug:
-			print(f'Reassigning tipracks of {pipette} to {name}')
-		pip = self.pipette1 if pipette in (1,'1',self.pipette1,'one','One') else self.pipette2 if pipette in (2,'2',self.pipette2,'two','Two') else None
-		if pip == None:
-			raise ValueError(f"Invalid pipette number {pipette}, must be 1 or 2")
-		pip.tip_racks = self.tipracks[name]
+		pip = self._pipette(pipette)
+		if self._debug_logging:
+			self._emit('assign','Reassigning tipracks of pipette {pipette} to {rack}',level='debug',pipette=self.pipette_numbers[pip],rack=name)
+		if pip.channels == 96 and name not in self.rack_adapters.keys():
+			loose = [slot for slot in self.rack_slots.get(name,{}) if slot not in self.slot_adapters.keys()]
+			if loose != []:
+				raise ValueError(f'{name} is already loaded without the tiprack adapter on {loose}, assign it to the 96 channel pipette before add_starting_tipracks or load_tipracks')
+			self.rack_adapters[name] = 'opentrons_flex_96_tiprack_adapter'
+		pip.tip_racks = self._racks(name)
+		if pip.tip_racks == []:
+			self.unloaded_assignments[pip] = name
+		else:
+			self.unloaded_assignments.pop(pip,None)
+
+	def set_substitutes(self, pipette : int | str | protocol_api.InstrumentContext, racks : list[str | tuple[str,float]] | dict[str : float] | None):
+		'''Rack types a pipette can switch to when its assigned type runs out with nothing left in expansion slots or stackers, i.e. filter and non filter tips of the same volume. \
+		pick_up takes tips from the highest weighted type with tips on the active deck, then one that can still be swapped in from an expansion slot or stacker, \
+		and only pauses for a refill when none can. The pipette stays assigned to the type it switched to.
+		pipette = the pipette object, its number or an alias
+		racks = rack load names in order of preference, (load name, weight) pairs or a dict of load name to weight. Higher weights are tried first, \
+		plain names have a weight of 1 and ties keep the order given. None clears the policy'''
+		pip = self._pipette(pipette)
+		if racks == None:
+			self.substitutes.pop(pip,None)
+			return
+		pairs = list(racks.items()) if type(racks) == dict else [(rack,1.0) if type(rack) == str else tuple(rack) for rack in racks]
+		self.substitutes[pip] = sorted([(name,float(weight)) for name,weight in pairs],key=lambda pair : -pair[1])
+
+	def _supply(self,rack_name):
+		#Racks of a type that can be swapped in without a pause
+		return len(self._supply_maps(rack_name)[1]) + self.stacker_inventory(rack_name)
 
-	def clear_old(self,name : str ,slots_to_clear : None | list = None,save_tips = True, waste_expansion : bool = False):
+	def _substitute(self,pip,rack_name):
+		#Switch a pipette to the best substitute with tips on deck, or else the best one with a supply to swap in. Returns (rack load name, well or None) or None
+		names = [name for name,weight in self.substitutes[pip] if name != rack_name]
+		for name in names:
+			well = next((well for well in (self.next_tip(pip,rack) for rack in self._racks(name)) if well != None),None)
+			if well != None:
+				self._switch(pip,rack_name,name)
+				return name,well
+		for name in names:
+			if self._supply(name) > 0 and name in self.rack_assignments.keys():
+				self._switch(pip,rack_name,name)
+				pip.tip_racks = self._racks(name)
+				return name,self.next_tip(pip)
+		return None
+
+	def _switch(self,pip,old_name,new_name):
+		if self._logging:
+			self._emit('substitute','Out of {old} for pipette {pipette}, switching to {rack}',pipette=self.pipette_numbers[pip],rack=new_name,old=old_name)
+		self.assign_tipracks(pip,new_name)
+
+	def clear_old(self,name : str ,slots_to_clear : None | list = None,save_tips = True, waste_expansion : bool = False, prompt : bool = True):
 		'''Remove old tipracks from internal data to replace with new tipracks in another function. This should generally only be used internally.\
 		Only use if you are sure you want to remove the tipracks from the internal data without moving them off deck physically. Keeps protocol from trying to move labware not on the deck anymore
 		name = Tiprack load name
-		slots_to_clear = List of slots to clear, if None will clear all tipracks of that type'''
-		if self.print_comments:
-			self.ctx.comment(f'Clearing old tipracks of {name}')
-		if self.debug:
-			print(f'Clearing old tipracks of {name}')
+		slots_to_clear = List of slots to clear, if None will clear all tipracks of that type
+		prompt = bool, if False will not pause to ask for the racks to be removed, used when the caller already prompted for them'''
+		if self._logging:
+			self._emit('waste','Clearing old tipracks of {rack}',rack=name)
 		if save_tips == False and self.use_chute == True and self.use_gripper == True:
-			if self.print_comments:
-				self.ctx.comment('Using Gripper to remove tips')
-			if self.debug:
-				print('Using Gripper to remove tips')
+			if self._debug_logging:
+				self._emit('waste','Using Gripper to remove tips',level='debug')
 			toss_tips = True
 			toss_location = self.waste
 		else:
 			slots_message = 'All slots' if slots_to_clear == None else str(slots_to_clear)
-			self.ctx.pause(f'Please remove all {name} from {slots_message}')
+			if prompt:
+				self._pause(f'Please remove all {name} from {slots_message}',name)
 			toss_tips = False
 			toss_location = protocol_api.OFF_DECK
 		if slots_to_clear == None:
-			if name in self.rack_assignments.keys():
-				for rack in self.tipracks.get(name,[]):
-					self.ctx._core.move_labware(
-						labware_core=rack._core,
-						new_location=toss_location,
-						use_gripper=toss_tips,
-						pause_for_manual_move=False,
-						pick_up_offset=(0.0,0.0,0.0),
-						drop_offset=(0.0,0.0,0.0))
-				self.tipracks[name] = []
-				for rack in self.ex_racks.get(name,[]):
-					self.ctx._core.move_labware(
-						labware_core=rack._core,
-						new_location=toss_location,
-						use_gripper=toss_tips,
-						pause_for_manual_move=False,
-						pick_up_offset=(0.0,0.0,0.0),
-						drop_offset=(0.0,0.0,0.0))
-				self.ex_racks[name] = []
-			else:
-				raise KeyError(f"Tiprack {name} not found in tiprack list")
-		else:
-			pop_these_active_deck = []
-			pop_these_expansion_slots = []
-			if name in self.tipracks.keys():
-				for x,rack in enumerate(self.tipracks[name]):
-					if type(rack.parent) == str:
-						slot_check = rack.parent
-					else:
-						slot_check = rack.parent.parent
-					if slot_check in slots_to_clear:
-						pop_these_active_deck.append(x)
-				pop_these_active_deck.sort(reverse=True)
-				for x in pop_these_active_deck:
-					self.ctx._core.move_labware(
-						labware_core=self.tipracks[name][x]._core,
-						new_location=toss_location,
-						use_gripper=toss_tips,
-						pause_for_manual_move=False,
-						pick_up_offset=(0.0,0.0,0.0),
-						drop_offset=(0.0,0.0,0.0))
-					self.tipracks[name].pop(x)
-				for x,rack in enumerate(self.ex_racks[name]):
-					if type(rack.parent) == str:
-						slot_check = rack.parent
-					else:
-						slot_check = rack.parent.parent
-					
-					if slot_check in slots_to_clear:
-						pop_these_expansion_slots.append(x)
-				pop_these_expansion_slots.sort(reverse=True)
-				for x in pop_these_expansion_slots:
-					self.ctx._core.move_labware(
-						labware_core=self.ex_racks[name][x]._core,
-						new_location=toss_location,
-						use_gripper=toss_tips,
-						pause_for_manual_move=False,
-						pick_up_offset=(0.0,0.0,0.0),
-						drop_offset=(0.0,0.0,0.0))
-					self.ex_racks[name].pop(x)
-			else:
+			if name not in self.rack_assignments.keys():
 				raise KeyError(f"Tiprack {name} not found in tiprack list")
+			slots_to_clear = list(self.rack_slots.get(name,{}).keys())
+		elif name not in self.rack_slots.keys():
+			raise KeyError(f"Tiprack {name} not found in tiprack list")
+		for slot in [slot for slot in slots_to_clear if slot in self.rack_slots.get(name,{})]:
+			rack = self._index_remove(slot)
+			self.ctx._core.move_labware(
+				labware_core=rack._core,
+				new_location=toss_location,
+				use_gripper=toss_tips,
+				pause_for_manual_move=False,
+				pick_up_offset=(0.0,0.0,0.0),
+				drop_offset=(0.0,0.0,0.0))
+			self._tick('gripper_move' if toss_tips else 'manual_move')
 			
 	def carousel(self, tiprack_to_move_away : protocol_api.Labware | str,tiprack_to_move_in : protocol_api.Labware | str):
-		
-		if self.open_slot != None:
-			open_slot = self.open_slot
-		else:
-			raise ValueError("No open slot defined, please define an open slot to move the tiprack to")
-		
+		'''Swap one rack off the active deck for another without a waste chute. The rack moving away goes to the closest free open slot, \
+		expansion slot of its type or unassigned expansion slot and the rack moving in takes its place.
+		tiprack_to_move_away = rack or the slot it is on
+		tiprack_to_move_in = rack or the slot it is on'''
 		if type(tiprack_to_move_away) == str:
-			intermediate_slot = tiprack_to_move_away
-			tiprack_to_move_away = self.ctx.deck[intermediate_slot]
-		elif type(tiprack_to_move_away) == protocol_api.Labware:
-			intermediate_slot = tiprack_to_move_away.parent
-		
+			tiprack_to_move_away = self.slot_racks[tiprack_to_move_away]
 		if type(tiprack_to_move_in) == str:
-			leaving_open_slot = tiprack_to_move_in
-			tiprack_to_move_in = self.ctx.deck[leaving_open_slot]
-		elif type(tiprack_to_move_in) == protocol_api.Labware:
-			leaving_open_slot = tiprack_to_move_in.parent
-		
-		
-		if self.debug:
-			print(f' Carousel from {tiprack_to_move_away} on {intermediate_slot} to {self.open_slot}')
-		self._shuttle_labware(tiprack_to_move_away,open_slot)
-		if self.debug:
-			print(f' Carousel from {tiprack_to_move_in} on {leaving_open_slot} to {intermediate_slot}')
-		self._shuttle_labware(tiprack_to_move_in,intermediate_slot)
-		if self.debug:
-			print(f'----->Assigning open_slot to {leaving_open_slot}')
-		self.open_slot = leaving_open_slot
-				
-	def move_from_stacker(self,rackname,):
-		stacker = self.stackers[rackname][0]
-		self.stackers[rackname][1] = self.stackers[rackname][1] - 1 #Change Quantity of stacker
-		labware = stacker.retreive()
-		if labware.child != None: #Throw away lid 
-			self.ctx.move_labware(labware.child,self.waste,use_gripper=self.use_gripper)
+			tiprack_to_move_in = self.slot_racks[tiprack_to_move_in]
+		slot = self.rack_locations[tiprack_to_move_away]
+		holes = self._carousel_holes(tiprack_to_move_away.load_name)
+		if holes == []:
+			raise ValueError("No open slot defined, please define an open slot to move the tiprack to")
+		hole = min(holes,key=lambda hole : _slot_distance(slot,hole))
+		self._run_carousel([(tiprack_to_move_away,hole),(tiprack_to_move_in,slot)])
+
+	def add_open_slots(self, slots : str | list[str]):
+		'''Keep more slots empty for carouseling racks without a waste chute, on top of open_slot. \
+		A full rack from an expansion slot goes straight onto a free open slot on the active deck and the empty rack stays where it is until the next refill, \
+		so with K open slots K exhausted racks are replaced in K gripper moves instead of 2K.
+		slots = ['D1','D2'] as list of strings or 'D1' as string'''
+		if type(slots) == str:
+			slots = [slots]
+		elif type(slots) != list:
+			raise TypeError("Open slots must be a string or list of strings")
+		self.open_slots.extend([slot for slot in slots if slot not in self.open_slots and slot != self.open_slot])
+
+	def carousel_racks(self, rack_name : str) -> int:
+		'''Bring every full expansion rack of a type onto the active deck in as few gripper moves as possible, see _plan_carousel. \
+		pick_up does this when a type runs out and there is no waste chute.
+		rack_name = rack load name
+		Returns the number of full racks brought onto the active deck'''
+		moves = self._plan_carousel(rack_name)
+		if moves != []:
+			self._run_carousel(moves)
+		return len([rack for rack,slot in moves if self.tips_in_rack(rack) == 96])
+
+	def _plan_carousel(self, rack_name):
+		#Moves bringing the full expansion racks of a type in, in order. A full rack goes straight onto a free active slot when there is one,
+		#one move and the empty rack stays parked. Otherwise swaps are chained: an empty rack goes to the closest hole and the full rack takes its slot,
+		#the slot it leaves is the next hole. Each rack moves once, so K swaps take K moves with K free active slots and 2K through holes off the active deck,
+		#fewer is not possible while the empty racks have to leave the active deck
+		holes = self._carousel_holes(rack_name)
+		active_holes = [slot for slot in holes if self.slot_tiers.get(slot,'active') == 'active']
+		empties = sorted(self._racks(rack_name),key=self.tips_in_rack)
+		moves = []
+		for rack in [rack for rack in self._racks(rack_name,'expansion') if self.tips_in_rack(rack) == 96]:
+			source = self.rack_locations[rack]
+			if active_holes != []:
+				slot = min(active_holes,key=lambda hole : _slot_distance(source,hole))
+				active_holes.remove(slot)
+				holes.remove(slot)
+				moves.append((rack,slot))
+			elif empties != [] and holes != []:
+				#Closest pair of empty rack and hole for this full rack
+				empty,hole = min([(empty,hole) for empty in empties for hole in holes],key=lambda pair : _slot_distance(self.rack_locations[pair[0]],pair[1]) + _slot_distance(source,self.rack_locations[pair[0]]))
+				empties.remove(empty)
+				holes.remove(hole)
+				moves.extend([(empty,hole),(rack,self.rack_locations[empty])])
+			else:
+				break
+			holes.insert(0,source)
+		return moves
+
+	def _carousel_holes(self, rack_name):
+		#Free slots racks of a type can be carouseled through: open slots, its own slots, unassigned expansion slots, then other types' expansion slots.
+		#refill_batch clears an empty rack left on another type's slot before loading onto it
+		owners = {slot : name for name,slots in self.rack_assignments.items() for slot in slots}
+		ex_slots = self.ex_slots if self.ex_slots != None else []
+		holes = ([self.open_slot] if self.open_slot != None else []) + self.open_slots + self.rack_assignments.get(rack_name,[]) \
+			+ [slot for slot in ex_slots if owners.get(slot,rack_name) == rack_name] + [slot for slot in ex_slots if owners.get(slot,rack_name) != rack_name]
+		return [slot for i,slot in enumerate(holes) if slot not in holes[:i] and self._slot_free(slot)]
+
+	def _run_carousel(self, moves):
+		started = self._start()
+		for rack,slot in moves:
+			if self._logging:
+				self._emit('carousel','Carousel {moved} from {source} to {slot}',rack=rack.load_name,slot=slot,moved=rack,source=self.rack_locations[rack])
+			self._shuttle_labware(rack,slot)
+		self._record('carousel',started,moves[0][0].load_name)
+
+	def prefetch(self, rack_name : str | None = None, threshold : int | None = None) -> int:
+		'''Stage the next rack of any type running low onto the active deck ahead of time so the swap at exhaustion costs nothing. \
+		Call this at natural idle points in the protocol, i.e. during incubations or while a module is heating. \
+		A rack is pulled from an expansion slot first, then from a stacker, onto an empty assigned slot. If none is empty an empty rack on an assigned slot is \
+		wasted first when using the chute, or a free open slot is used when carouseling.
+		rack_name = optional rack load name to check, if None will check all tracked rack types
+		threshold = optional low-water mark to use instead of prefetch_threshold
+		Returns the number of racks staged'''
+		threshold = self.prefetch_threshold if threshold == None else threshold
+		if threshold == None:
+			return 0
+		staged = 0
+		for name in ([rack_name] if rack_name != None else list(self.rack_assignments.keys())):
+			if self.tips_remaining(name) >= threshold:
+				continue
+			source = next((rack for rack in self._racks(name,'expansion') if self.tips_in_rack(rack) > 0),None)
+			from_stacker = source == None and self.stacker_inventory(name) > 0
+			if source == None and not from_stacker:
+				continue
+			deck_slots = [slot for slot in self.rack_assignments.get(name,[]) if slot not in self.ex_slots]
+			target = next((slot for slot in deck_slots if self._slot_free(slot)),None)
+			if target == None and not self.carousel_tips:
+				target = next((slot for slot in deck_slots if slot in self.rack_slots.get(name,{}) and self.tips_in_rack(self.slot_racks[slot]) == 0),None)
+				if target != None:
+					if from_stacker: #Lid rides to the waste on the empty rack
+						source = self.move_from_stacker(name,target,self.slot_racks[target])
+					self.waste_tips(target)
+			if target == None and self.carousel_tips:
+				target = next((slot for slot in self._carousel_holes(name) if self.slot_tiers.get(slot,'active') == 'active'),None)
+			if target == None:
+				continue
+			started = self._start()
+			if self._logging:
+				self._emit('swap','Prefetching {rack} onto {slot}, {tips} tips left',rack=name,slot=target,tips=self.tips_remaining(name))
+			if from_stacker:
+				if source == None:
+					source = self.move_from_stacker(name,target)
+				self._shuttle_labware(source,target)
+			else:
+				self._shuttle_labware(source,target)
+			for pip in self.pick_up_count.keys():
+				if pip.tip_racks != [] and pip.tip_racks[0].load_name == name:
+					pip.tip_racks = self._racks(name)
+			self._record('prefetch',started,name)
+			staged = staged + 1
+		if staged > 0 and self.checkpoint_file != None:
+			self.save_checkpoint()
+		if staged > 0 and self.inventory_sinks != []:
+			self.publish_inventory()
+		return staged
+
+	def consolidate(self, rack_name : str | None = None, pipette : int | str | protocol_api.InstrumentContext | None = None, max_transfers : int = 24, slots : list[str] | None = None) -> int:
+		'''Move the tips left in the emptiest racks of a type into the gaps of its other racks on the active deck, one tip at a time with a single channel, \
+		then waste the emptied racks to free their slots for the next swap or prefetch. Call this at idle points when returned or reused tips have left racks sparse. \
+		Gaps in the fullest columns are filled first so multichannel pipettes get whole columns back. Racks with reserved wells or tips waiting for reuse are left alone. \
+		Without a waste chute and gripper the emptied racks stay on deck and are carouseled or refilled like any other empty rack.
+		rack_name = optional rack load name, if None will consolidate every tracked rack type
+		pipette = optional pipette to move tips with, must have one active channel and no tip on it. If None uses the first single channel pipette assigned to the rack type
+		max_transfers = most tips moved in this call, each one is a pick up and a drop
+		slots = optional slots of the racks to empty, their tips go into the other racks of the type and never into each other. If None the emptiest racks are emptied first
+		Returns the number of racks emptied'''
+		emptied = 0
+		for name in ([rack_name] if rack_name != None else list(self.rack_slots.keys())):
+			pip = self._pipette(pipette) if pipette != None else next((pip for pip in self.pipette_numbers.keys() if pip.active_channels == 1 and pip not in self._attached and pip.tip_racks != [] and pip.tip_racks[0].load_name == name),None)
+			if pip == None:
+				continue
+			if pip.active_channels != 1 or pip in self._attached:
+				raise ValueError(f'Pipette {self.pipette_numbers[pip]} must have one active channel and no tip on it to consolidate tips')
+			held = {entry[0] for pool in self.reuse_pool.values() for entry in pool} | {attached[0] for attached in self._attached.values()}
+			racks = [rack for rack in self._racks(name) if rack not in self.reserved and rack not in held]
+			sources = [self.slot_racks[slot] for slot in slots if self.slot_racks.get(slot,None) in racks] if slots != None else sorted([rack for rack in racks if self.tips_in_rack(rack) > 0],key=self.tips_in_rack)
+			for source in sources:
+				#Racks on the given slots are all being emptied, tips only go into the racks that stay
+				targets = [rack for rack in racks if rack is not source and (slots == None or rack not in sources) and self.tips_in_rack(rack) > 0]
+				tips = self.tips_in_rack(source)
+				gaps = sum(96 - self.tips_in_rack(rack) for rack in targets)
+				if tips == 0 or tips > gaps or tips > max_transfers:
+					break
+				self._transfer_tips(pip,source,sorted(targets,key=self.tips_in_rack,reverse=True))
+				max_transfers = max_transfers - tips
+				racks.remove(source)
+				if self.use_chute and self.use_gripper:
+					self.waste_tips(self.rack_locations[source])
+				emptied = emptied + 1
+			for other_pip in self.pick_up_count.keys():
+				if other_pip.tip_racks != [] and other_pip.tip_racks[0].load_name == name:
+					other_pip.tip_racks = self._racks(name)
+		if emptied > 0 and self.checkpoint_file != None:
+			self.save_checkpoint()
+		if emptied > 0 and self.inventory_sinks != []:
+			self.publish_inventory()
+		return emptied
+
+	def _transfer_tips(self,pip,source,targets):
+		#Move every tip of source into the gaps of targets, fullest column of the fullest rack first
+		started = self._start()
+		source_map = self.tip_maps[source]
+		gaps = [(rack,column * 8 + row) for rack in targets
+			for column in sorted(range(12),key=lambda column : 8 - ((self.tip_maps[rack] >> (column * 8)) & 0xFF).bit_count())
+			for row in range(8) if not self.tip_maps[rack] >> (column * 8 + row) & 1]
+		if self._logging:
+			self._emit('consolidate','Moving {tips} tips of {rack} from {slot} into other racks',rack=source.load_name,slot=self.rack_locations[source],tips=source_map.bit_count(),pipette=self.pipette_numbers[pip])
+		well_bit = 0
+		for rack,gap in gaps[:source_map.bit_count()]:
+			while not source_map >> well_bit & 1:
+				well_bit = well_bit + 1
+			pip.pick_up_tip(source.wells()[well_bit])
+			pip.drop_tip(rack.wells()[gap])
+			self._tick('tip_transfer')
+			self.tip_maps[rack] = self.tip_maps[rack] | (1 << gap)
+			source_map = source_map & ~(1 << well_bit)
+		self.tip_maps[source] = source_map
+		self._record('consolidate',started,source.load_name,pip)
+
+	def move_from_stacker(self, rackname : str, target : str | None = None, lid_rack : protocol_api.Labware | None = None) -> protocol_api.Labware:
+		'''Retrieve the next rack of a type from its stackers. When several stackers hold the type, the one closest to target is used. \
+		The rack is left on the stacker, move it with the gripper. A lid on the rack is stacked on lid_rack or another empty rack waiting to be thrown out \
+		so it leaves with that rack, or goes to the waste on its own if there is none.
+		rackname = tiprack load name
+		target = optional slot the rack is headed to
+		lid_rack = optional empty rack about to be thrown out to put the lid on
+		Returns the retrieved rack'''
+		started = self._start()
+		stocked = [entry for entry in self.stackers.get(rackname,[]) if entry[1] > 0]
+		if stocked == []:
+			raise ValueError(f'No {rackname} left in stackers')
+		entry = min(stocked,key=lambda entry : (_slot_distance(entry[0].parent,target) if target != None else 0,-entry[1]))
+		entry[1] = entry[1] - 1
+		labware = entry[0].retrieve()
+		self._tick('stacker_retrieve')
+		if labware.child != None:
+			self._discard_lid(labware.child,lid_rack)
+		self._record('stacker',started,rackname)
 		return labware
 
-	def load_tips_in_stacker(self,stacker,rackname,quantity,lid : bool = False):
-		self._using_stackers == True
+	def load_tips_in_stacker(self, stacker : protocol_api.ModuleContext, rackname : str, quantity : int, lid : bool = False):
+		'''Store tipracks in a stacker for pick_up and prefetch to pull from. Several stackers can hold the same rack type, \
+		they are used as one pool and refilled together once all of them are empty.
+		stacker = stacker module context
+		rackname = tiprack load name
+		quantity = number of racks loaded into the stacker, also how many it is refilled to
+		lid = bool, True if the racks have lids'''
+		self._using_stackers = True
 		stacker.set_stored_labware(load_name=rackname,count=quantity,lid=lid)
 		if rackname not in self.tip_rack_counts.keys():
 			self.tip_rack_counts[rackname] = quantity
 		else:
 			self.tip_rack_counts[rackname] = self.tip_rack_counts[rackname] + quantity
-		self.stackers[rackname] = [stacker,quantity]
+		if rackname not in self.stackers.keys():
+			self.stackers[rackname] = []
+		self.stackers[rackname].append([stacker,quantity,quantity,lid])
+		self.stacker_loaded[rackname] = self.stacker_loaded.get(rackname,0) + quantity
+
+	def stacker_inventory(self, rack_name : str | None = None) -> int | dict[str : int]:
+		'''Racks left in stackers
+		rack_name = optional tiprack load name, if None returns a dict of every rack type
+		Returns the racks left of the type across all its stackers, or a dict of rack load name to racks left'''
+		if rack_name == None:
+			return {name : sum(entry[1] for entry in entries) for name,entries in self.stackers.items()}
+		return sum(entry[1] for entry in self.stackers.get(rack_name,[]))
+
+	def fill_stackers(self, rack_name : str) -> int:
+		'''Pause for the operator to refill every stacker of a rack type back to the quantity it was loaded with, capped by max_racks_count. \
+		pick_up does this once the stackers of a type run out.
+		rack_name = tiprack load name
+		Returns the number of racks added'''
+		added = 0
+		for entry in self.stackers.get(rack_name,[]):
+			count = entry[2] - entry[1]
+			if self.max_racks_count.get(rack_name,None) != None:
+				count = min(count,max(self.max_racks_count[rack_name] - self.tip_rack_counts.get(rack_name,0),0))
+			if count <= 0:
+				continue
+			started = self._start()
+			message = f'Load {count} {rack_name} into the stacker on {entry[0].parent}'
+			if self._logging:
+				self._emit('pause','{prompt}',rack=rack_name,slot=entry[0].parent,prompt=message)
+			self.ctx.home()
+			self._tick('home')
+			entry[0].fill(count=entry[1] + count,message=message)
+			self._tick('pause')
+			self._record('pause',started,rack_name)
+			entry[1] = entry[1] + count
+			self.tip_rack_counts[rack_name] = self.tip_rack_counts.get(rack_name,0) + count
+			added = added + count
+		return added
+
+	def _stacker_target(self,rack_name):
+		#Slot a rack from a stacker goes to, an empty rack of the type is taken off its slot if none are free
+		deck_slots = [slot for slot in self.rack_assignments[rack_name] if slot not in self.ex_slots]
+		target = next((slot for slot in deck_slots if self._slot_free(slot)),None)
+		if target == None:
+			target = next((slot for slot in deck_slots if slot in self.rack_slots.get(rack_name,{}) and self.tips_in_rack(self.slot_racks[slot]) == 0),None)
+			if target == None:
+				raise ValueError(f'No slot for {rack_name} from the stacker, all of {deck_slots} hold racks with tips')
+			self.waste_tips(target)
+		return target
+
+	def _discard_lid(self,lid,lid_rack):
+		#Stack the lid on an empty rack that is going to the waste anyway, or send it to the waste on its own
+		if lid_rack == None:
+			lid_rack = next((rack for rack in self.slot_racks.values() if self._can_hold_lid(rack)),None)
+		if lid_rack == None:
+			self._move(lid,self.waste if self.use_chute else protocol_api.OFF_DECK)
+			return
+		lids = self.rack_lids.get(lid_rack,[])
+		self._move(lid,lids[-1] if lids != [] else lid_rack)
+		self.rack_lids[lid_rack] = lids + [lid]
+
+	def _can_hold_lid(self,rack):
+		#Empty racks with nothing reserved or waiting for reuse, and room on the lid stack
+		return self.tips_in_rack(rack) == 0 and rack not in self.reserved and len(self.rack_lids.get(rack,[])) < LID_STACK_MAX \
+			and not any(entry[0] is rack for pool in self.reuse_pool.values() for entry in pool)
+
+	def plan_config(self) -> dict:
+		'''Export the pick ups recorded so far with the deck configuration as a dict for TipPlanner. \
+		Run one simulation, save json.dumps(TrackerObject.plan_config()) and use TipPlanner.plan_config to find max_racks and pauses for other layouts'''
+		return {
+			'pickups' : [list(pickup) for pickup in self.pickup_history],
+			'rack_assignments' : {name : list(slots) for name,slots in self.rack_assignments.items()},
+			'starting_slots' : {name : list(slots) for name,slots in self.starting_slots.items()},
+			'ex_slots' : list(self.ex_slots) if self.ex_slots != None else [],
+			'stackers' : dict(self.stacker_loaded),
+			'stacker_lids' : {name : any(entry[3] for entry in entries) for name,entries in self.stackers.items()},
+			'max_racks' : dict(self.max_racks_count),
+			'use_chute' : self.use_chute,
+			'use_gripper' : self.use_gripper,
+			'open_slots' : ([self.open_slot] if self.open_slot != None else []) + list(self.open_slots)}
+
+	def checkpoint(self) -> dict:
+		'''Snapshot of the tracker state as a json friendly dict, every tracked rack with its slot and the wells still holding tips as a hex bitmask \
+		(bit i is rack.wells()[i]), plus slot assignments, stacker counts, the open slot, counts and pick up history. Use TipTracker.restore to rebuild a tracker from it'''
+		return {
+			'version' : CHECKPOINT_VERSION,
+			'racks' : [[slot,name,format(self.tip_maps[self.slot_racks[slot]] if self.slot_racks[slot] in self.tip_maps else self._track_rack(self.slot_racks[slot]),'x')] for name,slots in self.rack_slots.items() for slot in slots],
+			'reserved' : {self.rack_locations[rack] : format(reserved_map,'x') for rack,reserved_map in self.reserved.items() if rack in self.rack_locations},
+			'reuse_pool' : [[tag,channels,self.rack_locations[rack],well.well_name,format(used_map,'x')] for (tag,channels),pool in self.reuse_pool.items() for rack,used_map,well in pool if rack in self.rack_locations],
+			'slot_tiers' : dict(self.slot_tiers),
+			'slot_adapters' : {slot : adapter.load_name for slot,adapter in self.slot_adapters.items()},
+			'rack_adapters' : dict(self.rack_adapters),
+			'rack_assignments' : {name : list(slots) for name,slots in self.rack_assignments.items()},
+			'starting_slots' : {name : list(slots) for name,slots in self.starting_slots.items()},
+			'ex_slots' : list(self.ex_slots) if self.ex_slots != None else [],
+			'empty_ex_slots' : {name : list(slots) for name,slots in self.empty_ex_slots.items()},
+			'stackers' : {name : [entry[1:] for entry in entries] for name,entries in self.stackers.items()},
+			'stacker_loaded' : dict(self.stacker_loaded),
+			'open_slot' : self.open_slot,
+			'original_open_slot' : self.original_open_slot,
+			'open_slots' : list(self.open_slots),
+			'tip_counts' : dict(self.tip_counts),
+			'tip_rack_counts' : dict(self.tip_rack_counts),
+			'max_racks' : dict(self.max_racks_count),
+			'ignore_slots' : list(self.ignore_slots),
+			'pipettes' : {number : (pip.tip_racks[0].load_name if pip.tip_racks != [] else None) for pip,number in self.pipette_numbers.items()},
+			'substitutes' : {self.pipette_numbers[pip] : [list(pair) for pair in pairs] for pip,pairs in self.substitutes.items()},
+			'pick_up_count' : {self.pipette_numbers[pip] : count for pip,count in self.pick_up_count.items()},
+			'drop_count' : {self.pipette_numbers[pip] : count for pip,count in self.drop_count.items()},
+			'pickup_history' : [list(pickup) for pickup in self.pickup_history],
+			'pickup_total' : self.pickup_total,
+			'sim_time' : self.sim_time,
+			'gripper_moves' : self.gripper_moves}
+
+	def save_checkpoint(self, path : str | None = None):
+		'''Write checkpoint() to a json file, the file is replaced in one step so a run stopped mid write keeps the last good checkpoint
+		Skipped while the protocol is analyzed (ctx.is_simulating()), so analysis of a restarted run does not replace the state it is about to restore
+		path = file to write, if None uses checkpoint_file'''
+		if self.simulating:
+			return
+		path = self.checkpoint_file if path == None else path
+		with open(path + '.tmp','w') as checkpoint_file:
+			json.dump(self.checkpoint(),checkpoint_file)
+		os.replace(path + '.tmp',path)
+
+	@classmethod
+	def restore(cls, ctx : protocol_api.ProtocolContext, pipette1 : protocol_api.InstrumentContext, pipette2 : protocol_api.InstrumentContext, waste_bin : protocol_api.WasteChute | protocol_api.TrashBin, state : dict | str, stackers : dict[str : protocol_api.ModuleContext | list[protocol_api.ModuleContext]] | None = None, setup = None, **kwargs) -> 'TipTracker':
+		'''Rebuild a tracker from a checkpoint so a restarted run carries on where the stopped one left off. Use it in place of TipTracker(...) and \
+		add_starting_tipracks, the racks are loaded on the slots they were on and the used wells are taken from the checkpoint without scanning the deck. \
+		Put the partly used racks back on those slots before starting the run.
+		ctx, pipette1, pipette2, waste_bin = same as TipTracker, pipettes must be passed in the same order as the stopped run
+		state = dict from checkpoint() or path to a file written by save_checkpoint
+		stackers = dict of rack load name to the stacker module holding it, or a list of modules in the order they were loaded, needed for every rack type that was in a stacker
+		setup = optional function taking the new tracker that loads the starting tipracks, i.e. lambda tracker : tracker.add_starting_tipracks(...). \
+		Used instead of the checkpoint file while the protocol is analyzed (ctx.is_simulating()) and when the file does not exist yet, \
+		so one protocol both starts and resumes a run
+		kwargs = any other TipTracker arguments, i.e. use_gripper=True, pipettes=[pip_96]
+		Returns the restored TipTracker'''
+		if type(state) == str and setup != None and (ctx.is_simulating() or not os.path.exists(state)):
+			tracker = cls(ctx,pipette1,pipette2,waste_bin,**kwargs)
+			setup(tracker)
+			return tracker
+		if type(state) == str:
+			with open(state) as checkpoint_file:
+				state = json.load(checkpoint_file)
+		if state.get('version',None) != CHECKPOINT_VERSION:
+			raise ValueError(f"Checkpoint version {state.get('version',None)} cannot be restored, expected {CHECKPOINT_VERSION}")
+		tracker = cls(ctx,pipette1,pipette2,waste_bin,**kwargs)
+		tracker.ex_slots = list(state['ex_slots'])
+		tracker.slot_tiers = dict(state['slot_tiers'])
+		tracker.rack_adapters = dict(state['rack_adapters'])
+		for slot,name,tip_map in state['racks']:
+			if slot in state['slot_adapters'].keys():
+				rack = ctx.load_labware(name,slot,adapter=state['slot_adapters'][slot])
+				tracker.slot_adapters[slot] = rack.parent
+			else:
+				rack = ctx.load_labware(name,slot)
+			tracker._index_add(rack,slot)
+			tracker.tip_maps[rack] = int(tip_map,16)
+			if slot in state['reserved'].keys():
+				tracker.reserved[rack] = int(state['reserved'][slot],16)
+		for tag,channels,slot,well,used_map in state['reuse_pool']:
+			if (tag,channels) not in tracker.reuse_pool.keys():
+				tracker.reuse_pool[(tag,channels)] = deque()
+			tracker.reuse_pool[(tag,channels)].append((tracker.slot_racks[slot],int(used_map,16),tracker.slot_racks[slot][well]))
+		for slot,adapter in state['slot_adapters'].items():
+			if slot not in tracker.slot_adapters.keys():
+				tracker.slot_adapters[slot] = ctx.load_labware(adapter,slot)
+		for name,entries in state['stackers'].items():
+			modules = stackers.get(name,[]) if stackers != None else []
+			modules = modules if type(modules) == list else [modules]
+			if len(modules) != len(entries):
+				raise ValueError(f'Checkpoint has {name} in {len(entries)} stackers, pass the same number of stacker modules in stackers')
+			tracker.stackers[name] = []
+			for module,(count,capacity,lid) in zip(modules,entries):
+				module.set_stored_labware(load_name=name,count=count,lid=lid)
+				tracker.stackers[name].append([module,count,capacity,lid])
+			tracker._using_stackers = True
+		tracker.rack_assignments = {name : list(slots) for name,slots in state['rack_assignments'].items()}
+		tracker.starting_slots = {name : list(slots) for name,slots in state['starting_slots'].items()}
+		tracker.empty_ex_slots = {name : list(slots) for name,slots in state['empty_ex_slots'].items()}
+		tracker.stacker_loaded = dict(state['stacker_loaded'])
+		tracker.open_slot = state['open_slot']
+		tracker.original_open_slot = state['original_open_slot']
+		tracker.open_slots = list(state.get('open_slots',[]))
+		tracker.tip_counts = dict(state['tip_counts'])
+		tracker.tip_rack_counts = dict(state['tip_rack_counts'])
+		tracker.max_racks_count = dict(state['max_racks'])
+		tracker.ignore_slots = list(state['ignore_slots'])
+		for number,name in state['pipettes'].items():
+			pip = tracker._pipette(number)
+			tracker.pick_up_count[pip] = state['pick_up_count'][number]
+			tracker.drop_count[pip] = state['drop_count'][number]
+			if name != None:
+				tracker.assign_tipracks(pip,name)
+		for number,pairs in state.get('substitutes',{}).items():
+			tracker.set_substitutes(number,pairs)
+		tracker.pickup_history = deque([tuple(pickup) for pickup in state['pickup_history']],maxlen=tracker.pickup_history.maxlen)
+		tracker.pickup_total = state.get('pickup_total',len(state['pickup_history']))
+		tracker.sim_time = state['sim_time']
+		tracker.gripper_moves = state['gripper_moves']
+		if tracker._logging:
+			tracker._emit('load','Restored {racks} tipracks from checkpoint, {tips} tips left on deck',racks=len(state['racks']),tips=sum(tip_map.bit_count() for tip_map in tracker.tip_maps.values()))
+		return tracker
 
 	def _shuttle_labware(self,labware,location):
-		self.ctx.move_labware(labware,location,use_gripper=self.use_gripper)
+		started = self._start()
+		#Racks going to a slot with an adapter are set back onto the adapter
+		self._move(labware,self.slot_adapters.get(location,location) if type(location) == str else location)
+		self._index_move(labware,location)
+		self._record('shuttle',started,labware.load_name)
+
+	def _move(self,labware,location,use_gripper=None):
+		use_gripper = self.use_gripper if use_gripper == None else use_gripper
+		self.ctx.move_labware(labware,location,use_gripper=use_gripper)
+		self._tick('gripper_move' if use_gripper else 'manual_move')
+
+	def _pause(self,message,rack=None):
+		started = self._start()
+		if self._logging:
+			self._emit('pause','{prompt}',rack=rack,prompt=message)
+		self.ctx.pause(message)
+		self._tick('pause')
+		self._record('pause',started,rack)
+
+	def _tick(self,action):
+		#Advance the simulated clock by one robot action
+		self.sim_time = self.sim_time + self.sim_seconds[action]
+		if action == 'gripper_move':
+			self.gripper_moves = self.gripper_moves + 1
+
+	def _start(self):
+		return (time.perf_counter(),self.sim_time)
+
+	def _record(self,operation,started,rack=None,pip=None):
+		key = (operation,rack,self.pipette_numbers[pip] if pip != None else None)
+		timing = self.timings.get(key,None)
+		if timing == None:
+			timing = self.timings[key] = _Timing()
+		timing.add(time.perf_counter() - started[0],self.sim_time - started[1])
+
+	def metrics(self) -> dict:
+		'''Timing of the tip handling so far, wall clock seconds spent in the tracker and simulated seconds estimated from sim_seconds. \
+		Returns a dict with
+		operations = stats for each of pick_up, swap, refill, carousel, shuttle, stacker, waste, pause and prefetch
+		by_rack = stats for each operation split by rack load name, by_pipette = split by pipette number
+		swap_time, pause_time, prefetch_time = simulated seconds lost to swaps at pick up, manual pauses and prefetching
+		swap_latency = p50 and p95 simulated and wall seconds of the pick ups that had to swap or carousel
+		gripper_moves, gripper_moves_per_1000_tips, tips, sim_time
+		Stats have count, total wall and sim seconds, p50 and p95 of both, the longest sim time and a histogram of sim times keyed by SIM_BUCKETS edge. \
+		Percentiles are taken from at most TIMING_SAMPLES * 2 evenly spaced calls of each operation, the rest are exact'''
+		operations = {}
+		by_rack = {}
+		by_pipette = {}
+		for (operation,rack,pipette),timing in self.timings.items():
+			operations.setdefault(operation,[]).append(timing)
+			if rack != None:
+				by_rack.setdefault(operation,{}).setdefault(rack,[]).append(timing)
+			if pipette != None:
+				by_pipette.setdefault(operation,{}).setdefault(pipette,[]).append(timing)
+		operations = {operation : _timing_stats(timings) for operation,timings in operations.items()}
+		swaps = operations.get('swap',_timing_stats([]))
+		tips = sum(self.tip_counts.values())
+		return {
+			'operations' : operations,
+			'by_rack' : {operation : {rack : _timing_stats(timings) for rack,timings in racks.items()} for operation,racks in by_rack.items()},
+			'by_pipette' : {operation : {pipette : _timing_stats(timings) for pipette,timings in pipettes.items()} for operation,pipettes in by_pipette.items()},
+			'swap_time' : swaps['sim'],
+			'pause_time' : operations.get('pause',{}).get('sim',0.0),
+			'prefetch_time' : operations.get('prefetch',{}).get('sim',0.0),
+			'swap_latency' : {'sim_p50' : swaps['sim_p50'], 'sim_p95' : swaps['sim_p95'], 'wall_p50' : swaps['wall_p50'], 'wall_p95' : swaps['wall_p95']},
+			'gripper_moves' : self.gripper_moves,
+			'gripper_moves_per_1000_tips' : self.gripper_moves * 1000 / tips if tips > 0 else 0.0,
+			'tips' : tips,
+			'sim_time' : self.sim_time}
+
+	def metrics_summary(self, comment : bool = False) -> str:
+		'''End of run summary of metrics() as text, use it to see if a protocol is held up by tip handling rather than liquid handling
+		comment = bool, if True will also write the summary to the run log'''
+		metrics = self.metrics()
+		latency = metrics['swap_latency']
+		lines = [f"Tips picked up: {metrics['tips']}, simulated tip handling time: {metrics['sim_time']:.0f} s",
+			f"Lost to swaps: {metrics['swap_time']:.0f} s, to pauses: {metrics['pause_time']:.0f} s, prefetching: {metrics['prefetch_time']:.0f} s",
+			f"Gripper moves: {metrics['gripper_moves']} ({metrics['gripper_moves_per_1000_tips']:.1f} per 1000 tips)"]
+		if latency['sim_p50'] != None:
+			lines.append(f"Swap latency p50/p95: {latency['sim_p50']:.0f}/{latency['sim_p95']:.0f} s simulated, {latency['wall_p50'] * 1000:.1f}/{latency['wall_p95'] * 1000:.1f} ms wall")
+		for rack,stats in metrics['by_rack'].get('swap',{}).items():
+			lines.append(f"  {rack}: {stats['count']} swaps, {stats['sim']:.0f} s")
+		for rack,stats in metrics['by_rack'].get('refill',{}).items():
+			lines.append(f"  {rack}: {stats['count']} manual refills, {stats['sim']:.0f} s")
+		summary = '\n'.join(lines)
+		if comment:
+			for line in lines:
+				self.ctx.comment(line)
+		return summary
+
+	def _slot_free(self,slot):
+		#Slot has no tiprack, an empty adapter counts as free
+		return slot not in self.slot_racks and (slot in self.slot_adapters or self.ctx.deck[slot] == None)
+
+	def _racks(self,name,tier = 'active'):
+		#Racks of a type on one tier, in the order their slots were filled
+		return [self.slot_racks[slot] for slot in self.rack_slots.get(name,{}) if self.slot_tiers.get(slot,'active') == tier]
+
+	def _index_add(self,rack,slot):
+		self.slot_racks[slot] = rack
+		self.rack_locations[rack] = slot
+		if rack.load_name not in self.rack_slots.keys():
+			self.rack_slots[rack.load_name] = {}
+		self.rack_slots[rack.load_name][slot] = None
+
+	def _reuse_tip(self,pip,reuse_tag,started):
+		#Pick up the most recently returned tip with the tag, the tip is not counted as a fresh tip
+		rack,used_map,well = self.reuse_pool[(reuse_tag,pip.active_channels)].pop()
+		pip.pick_up_tip(well)
+		self._tick('pick_up')
+		self._attached[pip] = (rack,used_map,well)
+		#The tip left the reuse pool, a restored run must not hand it out again
+		if self.checkpoint_file != None:
+			self.save_checkpoint()
+		if self.inventory_sinks != []:
+			self.publish_inventory()
+		self._record('reuse',started,rack.load_name,pip)
+		if self._debug_logging:
+			self._emit('pickup','Reused {tag} tip from {well} with pipette {pipette}',level='debug',pipette=self.pipette_numbers[pip],rack=rack.load_name,slot=self.rack_locations.get(rack,None),code=0,tag=reuse_tag,well=well.well_name)
+		return 0
+
+	def reusable_tips(self, reuse_tag : str, pipette : int | str | protocol_api.InstrumentContext | None = None) -> int:
+		'''Number of returned tips with a reuse tag that are waiting to be picked up again
+		reuse_tag = tag given to drop_tip
+		pipette = optional pipette, if given only counts tips that fit its active nozzles'''
+		channels = self._pipette(pipette).active_channels if pipette != None else None
+		return sum(len(pool) for (tag,pool_channels),pool in self.reuse_pool.items() if tag == reuse_tag and channels in (None,pool_channels))
+
+	def _forget_rack(self,rack):
+		#Rack left the deck, drop its occupancy, reservations and any returned tips waiting in it
+		self.tip_maps.pop(rack,None)
+		self.reserved.pop(rack,None)
+		self.rack_lids.pop(rack,None)
+		for key,pool in self.reuse_pool.items():
+			if any(entry[0] is rack for entry in pool):
+				self.reuse_pool[key] = deque(entry for entry in pool if entry[0] is not rack)
+
+	def _index_remove(self,slot,forget_tips = True):
+		#Take the rack on a slot out of the index, returns the rack or None if the slot was not tracked
+		rack = self.slot_racks.pop(slot,None)
+		if rack == None:
+			return None
+		self.rack_locations.pop(rack,None)
+		self.rack_slots[rack.load_name].pop(slot,None)
+		if forget_tips:
+			self._forget_rack(rack)
+		return rack
+
+	def _index_move(self,rack,location):
+		#Follow a rack moved by the gripper, recording expansion slots it leaves empty
+		source = self.rack_locations.get(rack,None)
+		if source != None:
+			self._index_remove(source,forget_tips=False)
+			if self.slot_tiers.get(source,'active') == 'expansion':
+				if rack.load_name in self.empty_ex_slots.keys():
+					self.empty_ex_slots[rack.load_name].append(source)
+				else:
+					self.empty_ex_slots[rack.load_name] = [source]
+		if type(location) == str:
+			self._index_add(rack,location)
+		else:
+			self._forget_rack(rack)
+
+	def tips_in_rack(self, rack : protocol_api.Labware) -> int:
+		'''Number of tips left in a tracked rack, read from the occupancy index instead of checking every well. \
+		Racks the tracker has not seen yet (i.e. moved in from a stacker) are scanned once and then tracked.
+		rack = tiprack labware object'''
+		tip_map = self.tip_maps.get(rack,None)
+		if tip_map == None:
+			tip_map = self._track_rack(rack)
+		return tip_map.bit_count()
+
+	def _track_rack(self,rack):
+		tip_map = 0
+		for x,well in enumerate(rack.wells()):
+			if well.has_tip:
+				tip_map = tip_map | (1 << x)
+		self.tip_maps[rack] = tip_map
+		return tip_map
+
+	def _pick_up_tip(self,pip,locus):
+		well = locus if type(locus) == protocol_api.Well else self.next_tip(pip,locus)
+		if well == None:
+			raise _labware.OutOfTipsError(f'No tips left for {pip} in {locus if locus != None else pip.tip_racks}')
+		pip.pick_up_tip(well)
+		self._tick('pick_up')
+		rack = well.parent
+		if rack not in self.tip_maps:
+			return
+		used_map = self._tip_block(pip,_well_bit(well.well_name))
+		self.tip_maps[rack] = self.tip_maps[rack] & ~used_map
+		self._attached[pip] = (rack,used_map,well)
+
+	def add_sink(self, sink):
+		'''Send every following event to sink as well
+		sink = any callable taking a TipEvent, i.e. RunLogSink(ctx), PrintSink(), JsonlSink(path,ctx) or MemorySink()'''
+		self.sinks.append(sink)
+		self._update_logging()
+
+	def remove_sink(self, sink):
+		'''Stop sending events to sink'''
+		self.sinks.remove(sink)
+		self._update_logging()
+
+	def _update_logging(self):
+		#Sinks with debug = False, like RunLogSink, drop debug events so they are not built for them
+		self._logging = self.sinks != [] or self.events.maxlen > 0
+		self._debug_logging = self.events.maxlen > 0 or any(getattr(sink,'debug',True) for sink in self.sinks)
+
+	def _emit(self, kind, text, level='info', **fields):
+		if level == 'debug' and not self._debug_logging:
+			return
+		event = TipEvent(kind,text,level,time.time(),**fields)
+		self.events.append(event)
+		for sink in self.sinks:
+			sink(event)
+
+	def register_pipette(self, pipette : protocol_api.InstrumentContext, aliases : list | None = None) -> int:
+		'''Add a pipette to the tracker, pipettes passed to TipTracker are registered automatically. Any number of pipettes can be registered, \
+		including a 96 channel (rack types assigned to it are loaded on the tiprack adapter). The pipette can then be passed to any method as the object, \
+		its number (3,'3','three','Three') or one of its aliases.
+		pipette = protocol_api.InstrumentContext to register
+		aliases = optional list of extra names for the pipette, i.e. ['p1000','left']
+		Returns the number given to the pipette'''
+		if pipette in self.pipette_numbers.keys():
+			number = self.pipette_numbers[pipette]
+		else:
+			number = len(self.pipette_numbers) + 1
+			self.pipette_numbers[pipette] = number
+			self.pick_up_count[pipette] = 0
+			self.drop_count[pipette] = 0
+		keys = [pipette,number,str(number)]
+		if number <= len(NUMBER_WORDS):
+			keys = keys + [NUMBER_WORDS[number - 1],NUMBER_WORDS[number - 1].capitalize()]
+		for key in keys + (aliases if aliases != None else []):
+			self.pipettes[key] = pipette
+		return number
+
+	def _pipette(self,pipette):
+		pip = self.pipettes.get(pipette,None)
+		if pip == None:
+			raise ValueError(f"Invalid pipette: {pipette}, must be a registered pipette object, its number (1,'1','one','One') or an alias")
+		return pip
+
+	def next_tip(self, pipette : int | str | protocol_api.InstrumentContext, rack : protocol_api.Labware | None = None) -> protocol_api.Well | None:
+		'''Plan the next tip for a pipette from the occupancy index without asking the pipette to pick up. pick_up passes this well as the locus \
+		so an exhausted rack type is found before the pickup instead of by catching OutOfTipsError. Accounts for pip.active_channels and partial column layouts.
+		pipette = the pipette object, its number or an alias
+		rack = optional tiprack to search, if None will search the racks assigned to the pipette
+		Returns the well to pick up from, or None if the active deck has no usable tips for the pipette'''
+		pip = self._pipette(pipette)
+		if pip.active_channels < 8:
+			return self._allocate(pip,[rack] if rack != None else pip.tip_racks)
+		for tiprack in ([rack] if rack != None else pip.tip_racks):
+			tip_map = self.tip_maps.get(tiprack,None)
+			if tip_map == None:
+				tip_map = self._track_rack(tiprack)
+			well_bit = self._find_tips(pip,tip_map)
+			if well_bit != None:
+				return tiprack.wells()[well_bit]
+		return None
+
+	def tips_remaining(self, rack_name : str) -> int:
+		'''Number of tips of a rack type left on the active deck, not counting racks in expansion slots or stackers.
+		rack_name = str of the rack load name, i.e. opentrons_flex_96_tiprack_50ul'''
+		return sum([self.tips_in_rack(rack) for rack in self._racks(rack_name)])
+
+	def pickups_until_swap(self, pipette : int | str | protocol_api.InstrumentContext) -> int:
+		'''Number of pick ups a pipette can make from the active deck before pick_up has to swap, carousel or refill its rack type. \
+		Useful for protocols to see a swap coming N pickups ahead.
+		pipette = the pipette object, its number or an alias'''
+		pip = self._pipette(pipette)
+		return self._pickups_in(pip,[self._tip_map(rack) for rack in pip.tip_racks])
+
+	def pickups_until_pause(self, pipette : int | str | protocol_api.InstrumentContext) -> int:
+		'''Number of pick ups a pipette can make before pick_up has to pause for a manual refill, counting the racks on the active deck, \
+		the ones it can bring in from expansion slots (only full ones when carouseling) and the racks left in stackers. \
+		Other pipettes on the same rack type are not counted, so with shared racks the pause comes sooner.
+		pipette = the pipette object, its number or an alias'''
+		pip = self._pipette(pipette)
+		if pip.tip_racks == []:
+			return 0
+		name = pip.tip_racks[0].load_name
+		active,waiting = self._supply_maps(name)
+		return self._pickups_until_pause(pip,name,active + waiting)
+
+	def inventory(self) -> dict:
+		'''Compact snapshot of the tips left for monitoring a run from outside the protocol, the dict sent to inventory sinks.
+		Returns dict with
+		time - time.time() of the snapshot
+		pickups - pick ups made so far
+		tips - tips left on the active deck for each rack type
+		reserve - tips pick_up can still bring in from expansion slots and stackers for each rack type without a pause
+		tip_rack_counts - racks loaded for each rack type
+		max_racks - max_racks_count, rack types without a limit are left out
+		stackers - racks left in stackers for each rack type
+		until_pause - pick ups each pipette (by number) can make before a manual refill, see pickups_until_pause
+		next_pause - fewest pick ups before any pipette pauses, None if no pipette has tips assigned'''
+		stackers = self.stacker_inventory() if self._using_stackers else {}
+		supply = {name : self._supply_maps(name) for name in self.rack_slots.keys()}
+		until_pause = {}
+		for pip,number in self.pipette_numbers.items():
+			if pip.tip_racks != []:
+				name = pip.tip_racks[0].load_name
+				active,waiting = supply.get(name,([],[]))
+				until_pause[number] = self._pickups_until_pause(pip,name,active + waiting)
+		return {
+			'time' : time.time(),
+			'pickups' : self.pickup_total,
+			'tips' : {name : sum([tip_map.bit_count() for tip_map in active]) for name,(active,waiting) in supply.items()},
+			'reserve' : {name : sum([tip_map.bit_count() for tip_map in waiting]) + stackers.get(name,0) * 96 for name,(active,waiting) in supply.items()},
+			'tip_rack_counts' : dict(self.tip_rack_counts),
+			'max_racks' : {name : count for name,count in self.max_racks_count.items() if count != None},
+			'stackers' : stackers,
+			'until_pause' : until_pause,
+			'next_pause' : min(until_pause.values()) if until_pause != {} else None}
+
+	def publish_inventory(self):
+		'''Send inventory() to every inventory sink, pick_up does this after every inventory_every pick ups and after every swap or refill. \
+		Skipped while the protocol is analyzed, so analysis does not replace the snapshots of a run'''
+		if self.simulating:
+			return
+		snapshot = self.inventory()
+		for sink in self.inventory_sinks:
+			sink(snapshot)
+
+	def add_inventory_sink(self, sink):
+		'''Send the inventory snapshot to sink as well, starting with the current one unless the protocol is being analyzed
+		sink = any callable taking the inventory() dict, i.e. InventoryFileSink(path), InventorySocketSink(host,port) or InventoryQueueSink()'''
+		self.inventory_sinks.append(sink)
+		if not self.simulating:
+			sink(self.inventory())
+
+	def _supply_maps(self,name):
+		#Bitmaps of a type's racks on the active deck and of the expansion racks pick_up can still swap in, one pass over the slot index.
+		#Carousel only brings in full racks, empty racks parked on expansion slots never come back
+		active = []
+		waiting = []
+		for slot in self.rack_slots.get(name,{}):
+			tip_map = self._tip_map(self.slot_racks[slot])
+			tier = self.slot_tiers.get(slot,'active')
+			if tier == 'active':
+				active.append(tip_map)
+			elif tier == 'expansion' and (tip_map == FULL_RACK if self.carousel_tips else tip_map != 0):
+				waiting.append(tip_map)
+		return active,waiting
+
+	def _pickups_until_pause(self,pip,name,tip_maps):
+		stacked = self.stacker_inventory(name) if self._using_stackers else 0
+		return self._pickups_in(pip,tip_maps) + (stacked * self._pickups_in(pip,[FULL_RACK]) if stacked > 0 else 0)
+
+	def _tip_map(self,rack):
+		tip_map = self.tip_maps.get(rack,None)
+		return self._track_rack(rack) if tip_map == None else tip_map
+
+	def _pickups_in(self,pip,tip_maps):
+		#Pick ups a pipette can make from racks with these occupancy bitmaps, each distinct column pattern is only walked once
+		if pip.channels == 1:
+			return sum([tip_map.bit_count() for tip_map in tip_maps])
+		if pip.active_channels == 96:
+			return tip_maps.count(FULL_RACK)
+		if pip.active_channels == 12:
+			pickups = 0
+			for tip_map in tip_maps:
+				well_bit = self._find_tips(pip,tip_map)
+				while well_bit != None:
+					pickups = pickups + 1
+					tip_map = tip_map & ~self._tip_block(pip,well_bit)
+					well_bit = self._find_tips(pip,tip_map)
+			return pickups
+		columns = b''.join([tip_map.to_bytes(12,'little') for tip_map in tip_maps]) #One byte per column
+		pickups = 0
+		for column_map in set(columns):
+			count = 0
+			left = column_map
+			well_bit = self._find_tips(pip,left)
+			while well_bit != None:
+				count = count + 1
+				left = left & ~self._tip_block(pip,well_bit)
+				well_bit = self._find_tips(pip,left)
+			pickups = pickups + count * columns.count(column_map)
+		return pickups
+
+	def configure_nozzle_layout(self, pipette : int | str | protocol_api.InstrumentContext, style, start : str | None = None, end : str | None = None):
+		'''Configure a partial nozzle layout on a pipette and record it so the planner knows which tips the active nozzles will land on. \
+		Use this instead of pip.configure_nozzle_layout when the pipette picks up through the tracker.
+		pipette = the pipette object, its number or an alias
+		style = protocol_api.ALL, COLUMN, ROW, SINGLE or PARTIAL_COLUMN
+		start = primary nozzle, i.e. 'H1' to pick up from the back of the rack first or 'A1' to pick up from the front first. \
+		ROW layouts on a 96 channel take whole rows the same way, A1 or H1 for a row of nozzles over column 1, A12 or H12 over column 12
+		end = last nozzle for PARTIAL_COLUMN layouts'''
+		pip = self._pipette(pipette)
+		pip.configure_nozzle_layout(style=style,start=start,end=end,tip_racks=pip.tip_racks)
+		if style == protocol_api.ALL or start == None:
+			self.nozzle_starts.pop(pip,None)
+		else:
+			self.nozzle_starts[pip] = start
+		self._open_columns.pop(pip,None)
+
+	def _allocate(self,pip,racks):
+		#Column aware pick for singles and partial columns. The broken column with the fewest tips that fits the nozzles is finished first so whole columns
+		#are left for multichannels, then a full column is opened, from the back of the first rack when a multichannel shares the rack type
+		cached = self._open_columns.get(pip,None)
+		if cached != None and cached[0] in self.tip_maps and cached[0] in racks:
+			row = self._fit_column(pip,(self.tip_maps[cached[0]] >> (cached[1] * 8)) & 0xFF)
+			if row != None:
+				return cached[0].wells()[cached[1] * 8 + row]
+		shared = None
+		best = None
+		full = None
+		for rack in racks:
+			tip_map = self.tip_maps.get(rack,None)
+			if tip_map == None:
+				tip_map = self._track_rack(rack)
+			for column in range(tip_map.bit_length() + 7 >> 3):
+				column_map = (tip_map >> (column * 8)) & 0xFF
+				if column_map == 0:
+					continue
+				if column_map == 0xFF:
+					if full == None:
+						full = (rack,column)
+						shared = any(other.channels > 1 and other.tip_racks != [] and other.tip_racks[0].load_name == rack.load_name for other in self.pipette_numbers.keys())
+					elif shared and rack is full[0]:
+						full = (rack,column)
+					continue
+				if best != None and column_map.bit_count() >= best[0]:
+					continue
+				row = self._fit_column(pip,column_map)
+				if row != None:
+					best = (column_map.bit_count(),rack,column,row)
+		if best != None:
+			self._open_columns[pip] = (best[1],best[2])
+			return best[1].wells()[best[2] * 8 + best[3]]
+		if full != None:
+			self._open_columns[pip] = full
+			return full[0].wells()[full[1] * 8 + self._fit_column(pip,0xFF)]
+		return None
+
+	def _fit_column(self,pip,column_map):
+		#Row of the well in one column the primary nozzle should go to, or None if the active nozzles do not fit the tips left in it
+		if column_map == 0:
+			return None
+		channels = pip.active_channels
+		if channels == 1:
+			return (column_map & -column_map).bit_length() - 1
+		nozzle_block = (1 << channels) - 1
+		#Partial layouts starting on the back nozzle take tips from the back of a column first, otherwise from the front
+		if channels < 8 and self.nozzle_starts.get(pip,'H1')[0] == 'H':
+			top = (column_map & -column_map).bit_length() - 1
+			if top + channels <= 8 and (column_map >> top) & nozzle_block == nozzle_block:
+				return top + channels - 1
+		else:
+			top = column_map.bit_length() - channels
+			if top >= 0 and (column_map >> top) & nozzle_block == nozzle_block:
+				return top
+		return None
+
+	def _find_tips(self,pip,tip_map):
+		#Returns the bit of the well the primary nozzle should go to, or None if no tips fit the active nozzles
+		if tip_map == 0:
+			return None
+		if pip.channels == 1:
+			return (tip_map & -tip_map).bit_length() - 1
+		if pip.active_channels == 96:
+			return 0 if tip_map == FULL_RACK else None
+		if pip.active_channels == 12:
+			#ROW layout, the row at the end of the rack the primary nozzle starts from has to be full so the other nozzles only pass over empty wells
+			rows = 0
+			for column in range(12):
+				rows = rows | (tip_map >> (column * 8)) & 0xFF
+			start = self.nozzle_starts.get(pip,'H1')
+			row = (rows & -rows).bit_length() - 1 if start[0] == 'H' else rows.bit_length() - 1
+			if (tip_map >> row) & RACK_ROW != RACK_ROW:
+				return None
+			return (88 if start[1:] == '12' else 0) + row
+		for column in range(tip_map.bit_length() // 8 + 1):
+			row = self._fit_column(pip,(tip_map >> (column * 8)) & 0xFF)
+			if row != None:
+				return column * 8 + row
+		return None
+
+	def _tip_block(self,pip,well_bit):
+		#Bitmap of the wells under the active nozzles when the primary nozzle is on well_bit
+		if pip.channels == 1:
+			return 1 << well_bit
+		if pip.active_channels == 96:
+			return FULL_RACK
+		if pip.active_channels == 12:
+			return RACK_ROW << (well_bit % 8)
+		channels = pip.active_channels
+		if channels < 8 and self.nozzle_starts.get(pip,'H1')[0] == 'H':
+			return ((1 << channels) - 1) << max(well_bit - channels + 1, well_bit - well_bit % 8)
+		return ((1 << channels) - 1) << well_bit
@@ -0,0 +1,92 @@
+'''
+Load time and size benchmark for TipTracker, the cost a protocol pays every time the robot analyzes it.
+Compares pasting TipTracker into the protocol file (compiled from source on every analysis) with importing it as a module
+(bytecode cached in __pycache__), checks that importing it leaves opentrons alone, and times and measures creating trackers
+as shipped (rarely used subsystems created lazily) and with every lazy subsystem created up front, all against the in-process deck model in TipDryRun.py.
+
+	python benchmarks/bench_import.py
+	python benchmarks/bench_import.py --repeats 50
+'''
+import argparse
+import marshal
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REPO)
+import TipDryRun
+TipDryRun.install()
+import TipTracker
+
+SOURCE_FILE = os.path.join(REPO,'TipTracker.py')
+LAZY = [name for name,value in vars(TipTracker.TipTracker).items() if type(value) == TipTracker._Lazy]
+DECK = (TipDryRun.ProtocolContext(),TipDryRun.InstrumentContext(1),TipDryRun.InstrumentContext(8),TipDryRun.WasteChute())	#Shared by every tracker so only the tracker is measured
+
+
+def _best(run, repeats):
+	#Best wall time of repeats calls in ms
+	best = None
+	for _ in range(repeats):
+		start = time.perf_counter()
+		run()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best == None else min(best,elapsed)
+	return best * 1000
+
+def _create(eager):
+	#One tracker, with eager every lazy subsystem is created as if it was a plain attribute
+	tracker = TipTracker.TipTracker(*DECK)
+	if eager:
+		for name in LAZY:
+			getattr(tracker,name)
+	return tracker
+
+def _size(eager, count):
+	#Bytes kept per tracker
+	tracemalloc.start()
+	trackers = [_create(eager) for _ in range(count)]
+	kept = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	del trackers
+	return kept / count
+
+def _fresh_import():
+	#Import TipTracker in a new interpreter without the deck model, returns ms and whether opentrons got imported
+	script = 'import sys,time;start = time.perf_counter();import TipTracker;print((time.perf_counter() - start) * 1000,"opentrons" in sys.modules)'
+	output = subprocess.run([sys.executable,'-c',script],cwd=REPO,capture_output=True,text=True)
+	if output.returncode != 0:
+		return None,output.stderr.strip().splitlines()[-1]
+	elapsed,loaded = output.stdout.split()
+	return float(elapsed),loaded == 'True'
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description='Time loading TipTracker embedded in a protocol and as an imported module, and the cost of creating trackers')
+	parser.add_argument('--repeats',type=int,default=20,help='timed runs of each measurement, the best is kept')
+	parser.add_argument('--trackers',type=int,default=1000,help='trackers created to time and measure __init__')
+	args = parser.parse_args(argv)
+
+	with open(SOURCE_FILE) as source_file:
+		source = source_file.read()
+	code = compile(source,SOURCE_FILE,'exec')
+	cached = marshal.dumps(code)
+	embedded = _best(lambda : exec(compile(source,SOURCE_FILE,'exec'),{'__name__' : 'protocol'}),args.repeats)
+	imported = _best(lambda : exec(marshal.loads(cached),{'__name__' : 'TipTracker'}),args.repeats)
+	fresh,opentrons_loaded = _fresh_import()
+	create = {eager : _best(lambda : [_create(eager) for _ in range(args.trackers)],max(args.repeats // 4,1)) / args.trackers * 1000 for eager in (False,True)}
+	size = {eager : _size(eager,args.trackers) for eager in (False,True)}
+	print(f'embedded in protocol  {embedded:8.2f} ms per analysis (compile and run the source)')
+	print(f'imported module       {imported:8.2f} ms per analysis (load cached bytecode and run it)')
+	if fresh != None:
+		print(f'fresh import          {fresh:8.2f} ms in a new interpreter, mostly json and the rest of the standard library, opentrons {"imported" if opentrons_loaded else "not imported"}')
+	else:
+		print(f'fresh import          failed without the deck model: {opentrons_loaded}')
+	print(f'TipTracker() lazy     {create[False]:8.2f} us {size[False]:8.0f} bytes per tracker')
+	print(f'TipTracker() eager    {create[True]:8.2f} us {size[True]:8.0f} bytes per tracker (every lazy subsystem created: {", ".join(LAZY)})')
+	print(f'instance              {sys.getsizeof(_create(False)):8d} bytes, {len(TipTracker.TipTracker.__slots__)} slots and no __dict__: {not hasattr(_create(False),"__dict__")}')
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,180 @@
+'''
+Throughput benchmarks for TipTracker against the in-process deck model in TipDryRun.py.
+Each scenario sets up a deck, then times a scripted workload of pick ups and drops (or reset_rack_list calls) and reports
+ops/sec (best of --repeats), plus the memory the workload leaves allocated and its peak from a separate tracemalloc run.
+
+	python benchmarks/bench_tracker.py						#Run every scenario and compare against baselines.json
+	python benchmarks/bench_tracker.py --save				#Run and save the results as the new baselines
+	python benchmarks/bench_tracker.py --scenario carousel --pickups 2000
+
+Scenarios that raise are reported as failed instead of stopping the run. Baselines are machine specific, save them on the machine you compare on.
+'''
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import TipDryRun
+TipDryRun.install()
+from TipTracker import TipTracker
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),'baselines.json')
+RACKS = ['opentrons_flex_96_tiprack_50ul','opentrons_flex_96_tiprack_200ul','opentrons_flex_96_tiprack_1000ul']
+
+
+def _tracker(waste, ex_slots = None, open_slot = None):
+	#Three pipettes, one per rack type, so every scenario cycles all three rack types
+	ctx = TipDryRun.ProtocolContext()
+	pipettes = [TipDryRun.InstrumentContext(1),TipDryRun.InstrumentContext(8),TipDryRun.InstrumentContext(8)]
+	tracker = TipTracker(ctx,pipettes[0],pipettes[1],waste,use_gripper=True,suppress_comments=True,pipettes=pipettes[2:])
+	if ex_slots != None:
+		tracker.add_expansion_slots(ex_slots)
+	tracker.open_slot = open_slot
+	return ctx,tracker
+
+def _workload(tracker, pickups, refill_all = False):
+	#Single channel every time, first multi every 4th and second multi every 8th pick up, some returned
+	def run():
+		for i in range(pickups):
+			pipette = 3 if i % 8 == 7 else 2 if i % 4 == 3 else 1
+			tracker.pick_up(pipette,refill_all=refill_all)
+			tracker.drop_tip(pipette,return_tip=i % 50 == 0)
+		return pickups
+	return run
+
+def scenario_expansion(pickups):
+	'''Waste chute and gripper, every rack type backed by an expansion slot'''
+	ctx,tracker = _tracker(TipDryRun.WasteChute(),['A4','B4','C4'])
+	tracker.add_starting_tipracks(RACKS[0],['A1','A2','B1','A4'],RACKS[1],['B2','C1','B4'],RACKS[2],['C2','C4'])
+	tracker.assign_slots(RACKS[0],['A1','A2','B1'],RACKS[1],['B2','C1'],RACKS[2],['C2'])
+	for pipette,rack in zip([1,2,3],RACKS):
+		tracker.assign_tipracks(pipette,rack)
+	return _workload(tracker,pickups)
+
+def scenario_stacker(pickups):
+	'''Waste chute and gripper, every rack type backed by its own stacker'''
+	ctx,tracker = _tracker(TipDryRun.WasteChute())
+	for slot,rack in zip(['A4','B4','C4'],RACKS):
+		tracker.load_tips_in_stacker(ctx.load_module('flexStackerModuleV1',slot),rack,6)
+	tracker.add_starting_tipracks(RACKS[0],['A1','A2'],RACKS[1],['B1'],RACKS[2],['C1'])
+	for pipette,rack in zip([1,2,3],RACKS):
+		tracker.assign_tipracks(pipette,rack)
+	return _workload(tracker,pickups)
+
+def scenario_carousel(pickups):
+	'''Trash bin, empty racks are carouseled through the open slot and refilled by hand'''
+	ctx,tracker = _tracker(TipDryRun.TrashBin(),['A4','B4','C4'],'D1')
+	tracker.add_starting_tipracks(RACKS[0],['A1','A2','A4'],RACKS[1],['B1','B4'],RACKS[2],['C1','C4'])
+	tracker.assign_slots(RACKS[0],['A1','A2','A4'],RACKS[1],['B1','B4'],RACKS[2],['C1','C4'])
+	for pipette,rack in zip([1,2,3],RACKS):
+		tracker.assign_tipracks(pipette,rack)
+	return _workload(tracker,pickups)
+
+def scenario_refill_all(pickups):
+	'''Waste chute, no expansion slots, every manual refill also refills the other rack types'''
+	ctx,tracker = _tracker(TipDryRun.WasteChute())
+	tracker.add_starting_tipracks(RACKS[0],['A1','A2','A3'],RACKS[1],['B1','B2'],RACKS[2],['C1'])
+	for pipette,rack in zip([1,2,3],RACKS):
+		tracker.assign_tipracks(pipette,rack)
+	return _workload(tracker,pickups,refill_all=True)
+
+def scenario_reset_rack_list(pickups):
+	'''Rebuild the slot index of one rack type from a full deck, once per op'''
+	ctx,tracker = _tracker(TipDryRun.WasteChute(),['A4','B4','C4','D4'])
+	tracker.add_starting_tipracks(RACKS[0],['A1','A2','A3','B1','A4','B4'],RACKS[1],['B2','B3','C1','C4'],RACKS[2],['C2','C3','D4'])
+	def run():
+		for i in range(pickups):
+			tracker.reset_rack_list(RACKS[i % 3])
+		return pickups
+	return run
+
+SCENARIOS = {
+	'expansion' : scenario_expansion,
+	'stacker' : scenario_stacker,
+	'carousel' : scenario_carousel,
+	'refill_all' : scenario_refill_all,
+	'reset_rack_list' : scenario_reset_rack_list}
+
+
+def measure(scenario, pickups, repeats):
+	'''Run one scenario, returns ops_per_sec, alloc_kib and alloc_blocks left allocated by the workload and peak_kib while it ran'''
+	best = None
+	for _ in range(repeats):
+		run = scenario(pickups)
+		start = time.perf_counter()
+		ops = run()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best == None else min(best,elapsed)
+	run = scenario(pickups)
+	gc.collect()
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+	tracemalloc.reset_peak()
+	run()
+	peak = tracemalloc.get_traced_memory()[1]
+	gc.collect()
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+	diff = after.compare_to(before,'filename')
+	return {
+		'ops' : ops,
+		'ops_per_sec' : round(ops / best,1),
+		'alloc_kib' : round(sum(stat.size_diff for stat in diff) / 1024,1),
+		'alloc_blocks' : sum(stat.count_diff for stat in diff),
+		'peak_kib' : round(peak / 1024,1)}
+
+def compare(results, baselines, tolerance):
+	'''Lines comparing results to baselines, a scenario regresses if ops/sec drops or peak memory grows by more than tolerance'''
+	lines = []
+	regressions = []
+	for name,result in results.items():
+		if 'error' in result:
+			lines.append(f'{name:<16} failed: {result["error"]}')
+			continue
+		line = f'{name:<16} {result["ops_per_sec"]:>12,.0f} ops/s {result["alloc_kib"]:>10,.1f} KiB kept {result["alloc_blocks"]:>8} blocks {result["peak_kib"]:>10,.1f} KiB peak'
+		base = baselines.get(name,None)
+		if base != None and 'ops_per_sec' in base:
+			speed = result['ops_per_sec'] / base['ops_per_sec'] - 1
+			memory = result['peak_kib'] / base['peak_kib'] - 1 if base['peak_kib'] > 0 else 0.0
+			line = line + f'   vs baseline {speed:+.1%} ops/s {memory:+.1%} peak'
+			if speed < -tolerance or memory > tolerance:
+				line = line + '  REGRESSION'
+				regressions.append(name)
+		lines.append(line)
+	return lines,regressions
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description='Benchmark TipTracker against the TipDryRun deck model')
+	parser.add_argument('--scenario',action='append',choices=list(SCENARIOS.keys()),help='scenario to run, can be given more than once, default all')
+	parser.add_argument('--pickups',type=int,default=10000,help='pick ups (or reset_rack_list calls) per scenario')
+	parser.add_argument('--repeats',type=int,default=5,help='timed runs per scenario, the best is kept')
+	parser.add_argument('--tolerance',type=float,default=0.25,help='fraction ops/s can drop or peak memory grow before it counts as a regression')
+	parser.add_argument('--save',action='store_true',help='save the results as the new baselines')
+	parser.add_argument('--baselines',default=BASELINE_FILE,help='baseline json file')
+	args = parser.parse_args(argv)
+
+	results = {}
+	for name in (args.scenario if args.scenario != None else SCENARIOS.keys()):
+		try:
+			results[name] = measure(SCENARIOS[name],args.pickups,args.repeats)
+		except Exception as error:
+			results[name] = {'error' : f'{type(error).__name__}: {error}'}
+	baselines = {}
+	if os.path.exists(args.baselines):
+		with open(args.baselines) as baseline_file:
+			baselines = json.load(baseline_file)
+	lines,regressions = compare(results,{} if args.save else baselines,args.tolerance)
+	print('\n'.join(lines))
+	if args.save:
+		baselines.update(results)
+		with open(args.baselines,'w') as baseline_file:
+			json.dump(baselines,baseline_file,indent=2)
+		print(f'Saved baselines to {args.baselines}')
+	return 1 if regressions != [] else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
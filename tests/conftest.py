@@ -0,0 +1,42 @@
+'''
+Shared setup of the tests, every test runs against the deck model in TipDryRun.py
+
+	python -m pytest tests
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import TipDryRun
+TipDryRun.install()		#Must run before any test imports TipTracker
+from TipTracker import TipTracker
+
+
+def _deck(pipettes, simulating, waste):
+	ctx = TipDryRun.ProtocolContext(simulating=simulating)
+	instruments = [TipDryRun.InstrumentContext(channels) if channels != None else None for channels in pipettes] + [None]
+	return ctx,instruments[0],instruments[1],waste if waste != None else TipDryRun.WasteChute(),instruments[2:-1]
+
+@pytest.fixture
+def make_tracker():
+	'''Factory for a tracker on a fresh deck, with the gripper and without run log comments unless kwargs say otherwise
+	pipettes = channels of pipette1, pipette2 and any more, None leaves pipette2 out
+	simulating = False to model a run on the robot instead of protocol analysis, i.e. for checkpoint and inventory files
+	waste = optional TipDryRun.TrashBin() to carousel, a waste chute if None
+	kwargs = any other TipTracker arguments'''
+	def make(pipettes = (1,), simulating = True, waste = None, **kwargs):
+		ctx,pipette1,pipette2,waste_bin,more = _deck(pipettes,simulating,waste)
+		kwargs = dict({'use_gripper' : True, 'suppress_comments' : True}, **kwargs)
+		return TipTracker(ctx,pipette1,pipette2,waste_bin,pipettes=more if more != [] else None,**kwargs)
+	return make
+
+@pytest.fixture
+def restore_tracker():
+	'''Factory for a tracker restored from a checkpoint on a fresh deck, same arguments as make_tracker plus the checkpoint state or file'''
+	def restore(state, pipettes = (1,), simulating = True, waste = None, **kwargs):
+		ctx,pipette1,pipette2,waste_bin,more = _deck(pipettes,simulating,waste)
+		kwargs = dict({'use_gripper' : True, 'suppress_comments' : True}, **kwargs)
+		return TipTracker.restore(ctx,pipette1,pipette2,waste_bin,state,pipettes=more if more != [] else None,**kwargs)
+	return restore
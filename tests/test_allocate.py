@@ -0,0 +1,63 @@
+'''
+Column by column allocation for single and partial column pick ups
+
+	python -m pytest tests
+'''
+import pytest
+
+import TipDryRun
+
+RACK = 'opentrons_flex_96_tiprack_50ul'
+
+
+def _tracker(make_tracker, pipettes = (8,)):
+	tracker = make_tracker(pipettes)
+	tracker.add_starting_tipracks(RACK,['A1','A2'])
+	for pipette in range(1,len(pipettes) + 1):
+		tracker.assign_tipracks(pipette,RACK)
+	return tracker
+
+@pytest.mark.parametrize('start,channels,column_map,row',[
+	('H1',1,0b00010100,2),			#Single channel takes the frontmost tip left
+	('H1',4,0xFF,3),				#Back nozzle primary takes rows A to D, the nozzle sits on D
+	('H1',4,0xF0,7),
+	('H1',4,0b01111000,6),
+	('H1',4,0b01110111,None),		#Rows A to C are not enough for 4 nozzles and the tips behind them are out of reach
+	('A1',4,0xFF,4),				#Front nozzle primary takes rows E to H
+	('A1',4,0x0F,0),
+	('A1',3,0b11011111,None)])
+def test_fit_column(make_tracker, start, channels, column_map, row):
+	tracker = _tracker(make_tracker)
+	if channels == 1:
+		tracker.configure_nozzle_layout(1,TipDryRun.SINGLE,start=start)
+	else:
+		tracker.configure_nozzle_layout(1,TipDryRun.PARTIAL_COLUMN,start=start,end=f'{chr(ord(start[0]) + (channels - 1 if start[0] == "A" else 1 - channels))}1')
+	assert tracker.pipette1.active_channels == channels
+	assert tracker._fit_column(tracker.pipette1,column_map) == row
+
+def test_broken_column_finished_first(make_tracker):
+	#The single channel finishes the broken column with the fewest tips before it opens a full one
+	tracker = _tracker(make_tracker,(1,))
+	first,second = tracker.slot_racks['A1'],tracker.slot_racks['A2']
+	tracker.tip_maps[first] = tracker._tip_map(first) & ~0xFF & ~(0b11111 << 8)	#Column 2 has 3 tips
+	tracker.tip_maps[second] = tracker._tip_map(second) & ~(0b1111111 << 40)		#Column 6 has 1 tip
+	wells = []
+	for x in range(5):
+		tracker.pick_up(1)
+		wells.append(tracker.pipette1._last_tip_picked_up_from)
+		tracker.drop_tip(1)
+	assert [(well.parent.parent,well.well_name) for well in wells] == [('A2','H6'),('A1','F2'),('A1','G2'),('A1','H2'),('A1','A3')]
+
+def test_partial_column_leftovers(make_tracker):
+	#3 nozzles take 2 pick ups from each column, opening columns from the back of the rack as it is shared with multichannels.
+	#The 2 tips left in a column go to the single channel before it opens a column
+	tracker = _tracker(make_tracker,(8,1))
+	tracker.configure_nozzle_layout(1,TipDryRun.PARTIAL_COLUMN,start='H1',end='F1')
+	assert tracker.pickups_until_swap(1) == 2 * 24
+	for x in range(2):
+		tracker.pick_up(1)
+		tracker.drop_tip(1)
+	rack = tracker.slot_racks['A1']
+	assert tracker.tip_maps[rack] >> 88 == 0b11000000
+	assert tracker.next_tip(2) is rack['G12']
+	assert tracker.pickups_until_swap(1) == 2 * 23
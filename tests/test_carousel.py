@@ -0,0 +1,34 @@
+'''
+Carouseling racks through a pool of open slots without a waste chute, and TipPlanner's count of the same moves
+
+	python -m pytest tests
+'''
+import pytest
+
+import TipDryRun
+import TipPlanner
+
+RACK = 'opentrons_flex_96_tiprack_50ul'
+
+
+@pytest.mark.parametrize('open_slots,moves',[
+	(['D1','D2'],2),		#Both full racks go straight onto open slots
+	(['D1'],3),				#One goes onto the open slot, the other swaps with an empty rack through the free expansion slot
+	([],4)])				#Both swap with an empty rack, chained through the free expansion slot and the slot the first full rack left
+def test_carousel_moves(make_tracker, open_slots, moves):
+	tracker = make_tracker(waste=TipDryRun.TrashBin())
+	if open_slots != []:
+		tracker.open_slot = open_slots[0]
+		tracker.add_open_slots(open_slots[1:])
+	tracker.add_expansion_slots(['A4','B4','C4'])
+	tracker.add_starting_tipracks(RACK,['A1','A2','A4','B4'])
+	tracker.assign_slots(RACK,['A1','A2'])
+	tracker.assign_tipracks(1,RACK)
+	for x in range(192):
+		assert tracker.pick_up(1) == 0
+		tracker.drop_tip(1)
+	assert tracker.pick_up(1) == 1
+	assert tracker.gripper_moves == moves
+	assert tracker.ctx.pauses == 0
+	assert tracker.tips_remaining(RACK) == 191
+	assert TipPlanner.plan_config(tracker.plan_config())['gripper_moves'][RACK] == moves
@@ -0,0 +1,75 @@
+'''
+Resuming a stopped run from the checkpoint file
+
+	python -m pytest tests
+'''
+RACKS = ['opentrons_flex_96_tiprack_50ul','opentrons_flex_96_tiprack_200ul']
+PIPETTES = (1,8)
+
+
+def _setup(tracker):
+	tracker.add_expansion_slots(['A4','B4'])
+	tracker.add_starting_tipracks(RACKS[0],['A1','A2','A4'],RACKS[1],['B1','B4'])
+	tracker.assign_slots(RACKS[0],['A1','A2'],RACKS[1],['B1'])
+	tracker.assign_tipracks(1,RACKS[0])
+	tracker.assign_tipracks(2,RACKS[1])
+
+def _tracker(make_tracker, checkpoint_file = None, checkpoint_every = 1):
+	tracker = make_tracker(PIPETTES,simulating=False,checkpoint_file=checkpoint_file,checkpoint_every=checkpoint_every)
+	_setup(tracker)
+	return tracker
+
+def _restored(restore_tracker, checkpoint_file, simulating = False, setup = None):
+	return restore_tracker(checkpoint_file,PIPETTES,simulating=simulating,setup=setup,checkpoint_file=checkpoint_file)
+
+def _step(tracker, x):
+	#Pick up and drop with one of the two pipettes, returns (slot, well) the tip came from
+	pipette = 2 if x % 4 == 3 else 1
+	tracker.pick_up(pipette)
+	well = tracker.pipettes[pipette]._last_tip_picked_up_from
+	tracker.drop_tip(pipette)
+	return (well.parent.parent,well.well_name)
+
+def test_resume_mid_rack(tmp_path, make_tracker, restore_tracker):
+	#130 pick ups stop part way through a rack, the resumed run has to carry on from the next unused tip
+	expected = _tracker(make_tracker)
+	wells = [_step(expected,x) for x in range(200)]
+	checkpoint_file = str(tmp_path / 'tip_state.json')
+	stopped = _tracker(make_tracker,checkpoint_file)
+	assert [_step(stopped,x) for x in range(130)] == wells[:130]
+	resumed = _restored(restore_tracker,checkpoint_file)
+	assert [_step(resumed,x) for x in range(130,200)] == wells[130:]
+	assert resumed.tip_counts == expected.tip_counts
+
+def test_checkpoint_every(tmp_path, make_tracker, restore_tracker):
+	#With checkpoint_every the file is only as new as the last multiple of it
+	checkpoint_file = str(tmp_path / 'tip_state.json')
+	tracker = _tracker(make_tracker,checkpoint_file,checkpoint_every=10)
+	for x in range(25):
+		_step(tracker,x)
+	assert len(_restored(restore_tracker,checkpoint_file).pickup_history) == 20
+
+def test_analysis_keeps_checkpoint(tmp_path, make_tracker, restore_tracker):
+	#Analysis of the restarted protocol runs it to the end, the checkpoint of the stopped run has to be left as it was
+	checkpoint_file = str(tmp_path / 'tip_state.json')
+	stopped = _tracker(make_tracker,checkpoint_file)
+	for x in range(130):
+		_step(stopped,x)
+	with open(checkpoint_file) as saved:
+		before = saved.read()
+	analyzed = _restored(restore_tracker,checkpoint_file,simulating=True,setup=_setup)
+	assert analyzed.pickup_total == 0
+	for x in range(200):
+		_step(analyzed,x)
+	analyzed.save_checkpoint()
+	with open(checkpoint_file) as saved:
+		assert saved.read() == before
+	assert _restored(restore_tracker,checkpoint_file).pickup_total == 130
+
+def test_setup_starts_first_run(tmp_path, restore_tracker):
+	#With no checkpoint file yet the run starts from setup and saves as it goes
+	checkpoint_file = str(tmp_path / 'tip_state.json')
+	tracker = _restored(restore_tracker,checkpoint_file,setup=_setup)
+	for x in range(5):
+		_step(tracker,x)
+	assert _restored(restore_tracker,checkpoint_file).pickup_total == 5
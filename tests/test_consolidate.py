@@ -0,0 +1,20 @@
+'''
+Moving the tips left in sparse racks into the gaps of the others
+
+	python -m pytest tests
+'''
+RACKS = ['opentrons_flex_96_tiprack_50ul','opentrons_flex_96_tiprack_200ul']
+
+
+def test_replace_keeps_tips_out_of_replaced_racks(make_tracker):
+	#Replacing A1 and A2 moves their tips into A3 only, never from one replaced rack into the other
+	tracker = make_tracker()
+	tracker.add_starting_tipracks(RACKS[0],['A1','A2','A3'])
+	tracker.assign_tipracks(1,RACKS[0])
+	for slot,used in [('A1',90),('A2',20),('A3',70)]:
+		rack = tracker.slot_racks[slot]
+		tracker.tip_maps[rack] = tracker._tip_map(rack) & ~((1 << used) - 1)
+	tracker.replace_tips(RACKS[0],RACKS[1],number_to_replace=2,consolidate=True)
+	#A2 is the fullest rack but is being replaced, the 6 tips of A1 go to A3. A2 has more tips than A3 has gaps so it is not emptied
+	assert tracker.tips_in_rack(tracker.slot_racks['A3']) == 26 + 6
+	assert tracker.slot_racks['A1'].load_name == RACKS[1]
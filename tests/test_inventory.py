@@ -0,0 +1,87 @@
+'''
+Inventory snapshots and the file sinks
+
+	python -m pytest tests
+'''
+import json
+
+from TipTracker import InventoryFileSink, InventoryQueueSink, JsonlSink
+
+RACK = 'opentrons_flex_96_tiprack_50ul'
+STACKED = 'opentrons_flex_96_tiprack_200ul'
+
+
+def _tracker(make_tracker, simulating, events_file = None, inventory_file = None):
+	tracker = make_tracker(simulating=simulating,inventory_sinks=[InventoryFileSink(inventory_file)] if inventory_file != None else [])
+	if events_file != None:
+		tracker.add_sink(JsonlSink(events_file,tracker.ctx))
+	tracker.add_expansion_slots(['A4'])
+	tracker.add_starting_tipracks(RACK,['A1','A4'])
+	tracker.assign_slots(RACK,['A1'])
+	tracker.assign_tipracks(1,RACK)
+	return tracker
+
+def test_analysis_leaves_files(tmp_path, make_tracker):
+	#Analysis runs the protocol too, the files of the last real run have to stay as they were
+	events_file = str(tmp_path / 'events.jsonl')
+	inventory_file = str(tmp_path / 'inventory.json')
+	run = _tracker(make_tracker,False,events_file,inventory_file)
+	for x in range(100):
+		run.pick_up(1)
+		run.drop_tip(1)
+	with open(events_file) as saved:
+		events = saved.read()
+	with open(inventory_file) as saved:
+		inventory = saved.read()
+	analysis = _tracker(make_tracker,True,events_file,inventory_file)
+	for x in range(150):
+		analysis.pick_up(1)
+		analysis.drop_tip(1)
+	with open(events_file) as saved:
+		assert saved.read() == events
+	with open(inventory_file) as saved:
+		assert saved.read() == inventory
+	assert json.loads(inventory)['pickups'] == 100
+
+def test_events_flushed(tmp_path, make_tracker):
+	#Every event is on disk as soon as it is sent, a stopped run never closes the sink
+	events_file = str(tmp_path / 'events.jsonl')
+	tracker = _tracker(make_tracker,False,events_file)
+	for x in range(97):
+		tracker.pick_up(1)
+		tracker.drop_tip(1)
+	with open(events_file) as saved:
+		kinds = [json.loads(line)['kind'] for line in saved]
+	assert kinds.count('pickup') == 97 and 'swap' in kinds
+
+def test_snapshot(make_tracker):
+	#Tips on deck, what can still be brought in without a pause and the pick ups each pipette has before one, published every 5 pick ups and after swaps
+	queue = InventoryQueueSink()
+	tracker = make_tracker((1,8),simulating=False,inventory_sinks=[queue],inventory_every=5)
+	tracker.load_tips_in_stacker(tracker.ctx.load_module('flexStackerModuleV1','B4'),STACKED,2)
+	tracker.add_expansion_slots(['A4'])
+	tracker.add_starting_tipracks(RACK,['A1','A4'],STACKED,['B1'],max_racks_1=5)
+	tracker.assign_slots(RACK,['A1'])
+	tracker.assign_tipracks(1,RACK)
+	tracker.assign_tipracks(2,STACKED)
+	for pipette in [1] * 10 + [2] * 2:
+		tracker.pick_up(pipette)
+		tracker.drop_tip(pipette)
+	snapshot = tracker.inventory()
+	del snapshot['time']
+	assert snapshot == {
+		'pickups' : 12,
+		'tips' : {RACK : 86, STACKED : 80},
+		'reserve' : {RACK : 96, STACKED : 192},
+		'tip_rack_counts' : {RACK : 2, STACKED : 3},
+		'max_racks' : {RACK : 5},
+		'stackers' : {STACKED : 2},
+		'until_pause' : {1 : 86 + 96, 2 : 10 + 2 * 12},
+		'next_pause' : 34}
+	assert [published['pickups'] for published in queue.snapshots] == [5,10]
+	for x in range(10):
+		tracker.pick_up(2)
+		tracker.drop_tip(2)
+	assert queue.latest['pickups'] == 20
+	assert tracker.pick_up(2) == 3
+	assert queue.latest['pickups'] == 23 and queue.latest['stackers'] == {STACKED : 1}
@@ -0,0 +1,27 @@
+'''
+Memory of the pick up history and timings on long runs
+
+	python -m pytest tests
+'''
+from TipTracker import TIMING_SAMPLES
+
+RACK = 'opentrons_flex_96_tiprack_50ul'
+
+
+def test_long_run_is_bounded(make_tracker):
+	#3000 pick ups keep the last history_limit of them and a fixed number of timing samples, counts stay exact
+	tracker = make_tracker(history_limit=100)
+	tracker.add_starting_tipracks(RACK,['A1','A2'])
+	tracker.assign_tipracks(1,RACK)
+	for x in range(3000):
+		tracker.pick_up(1)
+		tracker.drop_tip(1)
+	assert len(tracker.pickup_history) == 100
+	assert tracker.pickup_total == 3000
+	assert tracker.inventory()['pickups'] == 3000
+	assert all(len(timing.samples) < TIMING_SAMPLES * 2 for timing in tracker.timings.values())
+	metrics = tracker.metrics()
+	assert metrics['operations']['pick_up']['count'] == 3000
+	assert metrics['by_pipette']['pick_up'][1]['count'] == 3000
+	assert metrics['by_rack']['refill'][RACK]['count'] == metrics['operations']['refill']['count'] > 0
+	assert sum(metrics['operations']['pick_up']['histogram'].values()) == 3000
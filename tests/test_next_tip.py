@@ -0,0 +1,51 @@
+'''
+Planning the next tip from the occupancy index instead of catching OutOfTipsError
+
+	python -m pytest tests
+'''
+RACK = 'opentrons_flex_96_tiprack_50ul'
+
+
+def test_next_tip_is_picked_up(make_tracker):
+	#The planned well is the one pick_up takes, and planning alone takes nothing
+	tracker = make_tracker((1,8))
+	tracker.add_starting_tipracks(RACK,['A1','A2'])
+	tracker.assign_tipracks(1,RACK)
+	tracker.assign_tipracks(2,RACK)
+	for pipette in [1,2,1,1,2]:
+		well = tracker.next_tip(pipette)
+		assert tracker.next_tip(pipette) is well
+		tracker.pick_up(pipette)
+		assert tracker.pipettes[pipette]._last_tip_picked_up_from is well
+		tracker.drop_tip(pipette)
+
+def test_multichannel_skips_broken_columns(make_tracker):
+	#Singles sharing the rack with an 8 channel break the last column, the 8 channel only plans full columns and leaves it to them
+	tracker = make_tracker((1,8))
+	tracker.add_starting_tipracks(RACK,['A1'])
+	tracker.assign_tipracks(1,RACK)
+	tracker.assign_tipracks(2,RACK)
+	assert tracker.next_tip(1).well_name[1:] == '12'
+	tracker.pick_up(1)
+	tracker.drop_tip(1)
+	for column in range(1,12):
+		assert tracker.next_tip(2).well_name == f'A{column}'
+		tracker.pick_up(2)
+		tracker.drop_tip(2)
+	assert tracker.next_tip(2) == None
+	assert tracker.next_tip(1) != None
+
+def test_none_when_active_deck_is_out(make_tracker):
+	#With the active deck out next_tip returns None and pick_up swaps in the expansion rack instead of raising
+	tracker = make_tracker((8,))
+	tracker.add_expansion_slots(['A4'])
+	tracker.add_starting_tipracks(RACK,['A1','A4'])
+	tracker.assign_slots(RACK,['A1'])
+	tracker.assign_tipracks(1,RACK)
+	for x in range(12):
+		tracker.pick_up(1)
+		tracker.drop_tip(1)
+	assert tracker.next_tip(1) == None
+	assert tracker.pickups_until_swap(1) == 0
+	assert tracker.pick_up(1) == 2
+	assert tracker.next_tip(1).well_name == 'A2'
@@ -0,0 +1,53 @@
+'''
+96 channel pick ups, whole racks on the tiprack adapter and ROW layouts
+
+	python -m pytest tests
+'''
+import pytest
+
+import TipDryRun
+import TipPlanner
+
+RACK = 'opentrons_flex_96_tiprack_200ul'
+
+
+def _tracker(make_tracker):
+	tracker = make_tracker((96,))
+	tracker.add_expansion_slots(['A4','B4'])
+	return tracker
+
+def test_assigned_before_loading(make_tracker):
+	#Racks of a type the 96 channel was given before loading go on the adapter and reach the pipette
+	tracker = _tracker(make_tracker)
+	tracker.assign_tipracks(1,RACK)
+	tracker.add_starting_tipracks(RACK,['A1','A2','A4'])
+	assert all(type(tracker.slot_racks[slot].parent) == TipDryRun.Labware for slot in ['A1','A2','A4'])
+	assert tracker.pipette1.tip_racks == [tracker.slot_racks['A1'],tracker.slot_racks['A2']]
+	assert [tracker.pick_up(1) for x in range(3)] == [0,0,2]
+
+def test_assigned_after_loading(make_tracker):
+	tracker = _tracker(make_tracker)
+	tracker.add_starting_tipracks(RACK,['A1'])
+	with pytest.raises(ValueError):
+		tracker.assign_tipracks(1,RACK)
+
+def test_row_layout(make_tracker):
+	#A ROW layout starting on H1 takes the rows from the back of the rack, 8 pick ups a rack
+	tracker = _tracker(make_tracker)
+	tracker.assign_tipracks(1,RACK)
+	tracker.add_starting_tipracks(RACK,['A1','A4'])
+	tracker.configure_nozzle_layout(1,TipDryRun.ROW,start='H1')
+	assert tracker.pickups_until_swap(1) == 8
+	wells = []
+	for x in range(8):
+		assert tracker.pick_up(1) == 0
+		wells.append(tracker.pipette1._last_tip_picked_up_from.well_name)
+		tracker.drop_tip(1)
+	assert wells == [f'{row}1' for row in 'ABCDEFGH']
+	assert tracker.pick_up(1) == 2
+
+def test_planner_full_racks():
+	#Every 96 channel pick up empties a whole rack, none of them are short
+	plan = TipPlanner.plan([(1,RACK,96)] * 5,{RACK : ['A1','A2','A4','B4']},ex_slots=['A4','B4'])
+	assert plan['racks_used'][RACK] == 5
+	assert plan['short'] == {}
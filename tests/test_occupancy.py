@@ -0,0 +1,41 @@
+'''
+The per rack occupancy index, checked against the tips the deck model says are left
+
+	python -m pytest tests
+'''
+RACK = 'opentrons_flex_96_tiprack_50ul'
+
+
+def _scanned(rack):
+	#Occupancy bitmap read well by well, what the index saves pick_up from doing
+	return sum([1 << x for x,well in enumerate(rack.wells()) if well.has_tip])
+
+def test_index_follows_pick_ups(make_tracker):
+	#Single and 8 channel pick ups, returned tips and a swap leave the index matching the wells of every rack
+	tracker = make_tracker((1,8))
+	tracker.add_expansion_slots(['A4'])
+	tracker.add_starting_tipracks(RACK,['A1','A2','A4'])
+	tracker.assign_slots(RACK,['A1','A2'])
+	tracker.assign_tipracks(1,RACK)
+	tracker.assign_tipracks(2,RACK)
+	for x in range(80):
+		pipette = 2 if x % 3 == 0 else 1
+		tracker.pick_up(pipette)
+		tracker.drop_tip(pipette,return_tip=x % 10 == 0)
+	assert tracker.tip_counts[RACK] == 27 * 8 + 53
+	assert 'A4' not in tracker.slot_racks	#The expansion rack was swapped in
+	for rack,tip_map in tracker.tip_maps.items():
+		assert tip_map == _scanned(rack)
+	assert tracker.tips_remaining(RACK) == sum([_scanned(rack).bit_count() for rack in tracker.tipracks[RACK]])
+
+def test_returned_tip_goes_back(make_tracker):
+	#A returned tip is handed out again before the next fresh one
+	tracker = make_tracker()
+	tracker.add_starting_tipracks(RACK,['A1'])
+	tracker.assign_tipracks(1,RACK)
+	rack = tracker.slot_racks['A1']
+	tracker.pick_up(1)
+	assert tracker.tips_in_rack(rack) == 95
+	tracker.drop_tip(1,return_tip=True)
+	assert tracker.tips_in_rack(rack) == 96
+	assert tracker.next_tip(1) is rack['A1']
@@ -0,0 +1,45 @@
+'''
+Manual refills batched into one home and one operator prompt
+
+	python -m pytest tests
+'''
+import TipDryRun
+
+RACKS = ['opentrons_flex_96_tiprack_50ul','opentrons_flex_96_tiprack_200ul']
+
+
+def _tracker(make_tracker, waste = None):
+	tracker = make_tracker((1,8),waste=waste)
+	tracker.add_starting_tipracks(RACKS[0],['A1','A2'],RACKS[1],['B1'])
+	tracker.assign_tipracks(1,RACKS[0])
+	tracker.assign_tipracks(2,RACKS[1])
+	for x in range(12):
+		tracker.pick_up(2)
+		tracker.drop_tip(2)
+	for x in range(192):
+		tracker.pick_up(1)
+		tracker.drop_tip(1)
+	return tracker
+
+def test_refill_all_is_one_visit(make_tracker):
+	#Both rack types are out, refill_all refills all three racks with one home and one pause
+	tracker = _tracker(make_tracker)
+	ctx = tracker.ctx
+	homes,pauses = ctx.homes,ctx.pauses
+	assert tracker.pick_up(1,refill_all=True) == 4
+	assert (ctx.homes - homes,ctx.pauses - pauses) == (1,1)
+	assert tracker.tips_remaining(RACKS[0]) == 191
+	assert tracker.tips_remaining(RACKS[1]) == 96
+	assert tracker.pick_up(2) == 0
+
+def test_prompt_lists_every_slot(make_tracker):
+	#Without a waste chute the operator removes and places every rack in the same prompt
+	tracker = _tracker(make_tracker,TipDryRun.TrashBin())
+	prompts = []
+	tracker.ctx.pause = prompts.append
+	tracker.refill_batch({RACKS[0] : ['A1','A2'], RACKS[1] : ['B1']})
+	assert len(prompts) == 1
+	for name,slots in [(RACKS[0],['A1','A2']),(RACKS[1],['B1'])]:
+		assert f'remove {name} from {slots}' in prompts[0]
+		assert f'place {name} onto {slots}' in prompts[0]
+	assert tracker.tip_rack_counts == {RACKS[0] : 4, RACKS[1] : 2}
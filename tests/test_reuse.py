@@ -0,0 +1,27 @@
+'''
+Tagged tips returned for reuse
+
+	python -m pytest tests
+'''
+from TipTracker import InventoryQueueSink
+
+RACK = 'opentrons_flex_96_tiprack_50ul'
+
+
+def test_reused_tip_leaves_checkpoint(tmp_path, make_tracker, restore_tracker):
+	#A tip picked up again by its tag and then thrown out is gone from the checkpoint too
+	checkpoint_file = str(tmp_path / 'tip_state.json')
+	inventory = InventoryQueueSink()
+	tracker = make_tracker(simulating=False,checkpoint_file=checkpoint_file,checkpoint_every=100,inventory_sinks=[inventory],inventory_every=100)
+	tracker.add_starting_tipracks(RACK,['A1','A2'])
+	tracker.assign_tipracks(1,RACK)
+	tracker.pick_up(1)
+	tracker.drop_tip(1,reuse_tag='buf')
+	assert restore_tracker(checkpoint_file,simulating=False).reusable_tips('buf') == 1
+	published = len(inventory.snapshots)
+	assert tracker.pick_up(1,reuse_tag='buf') == 0
+	assert len(inventory.snapshots) == published + 1
+	tracker.drop_tip(1)
+	restored = restore_tracker(checkpoint_file,simulating=False)
+	assert restored.reusable_tips('buf') == 0
+	assert restored.tips_remaining(RACK) == 191
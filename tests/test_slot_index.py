@@ -0,0 +1,58 @@
+'''
+The slot index following racks as they are swapped in, wasted and reset
+
+	python -m pytest tests
+'''
+RACK = 'opentrons_flex_96_tiprack_50ul'
+
+
+def _consistent(tracker):
+	for slot,rack in tracker.slot_racks.items():
+		assert tracker.rack_locations[rack] == slot
+		assert slot in tracker.rack_slots[rack.load_name]
+	assert len(tracker.rack_locations) == len(tracker.slot_racks)
+
+def test_swap_follows_rack(make_tracker):
+	#The waste chute takes the empty rack and the expansion rack takes its slot, the expansion slot is left empty
+	tracker = make_tracker()
+	tracker.add_expansion_slots(['A4'])
+	tracker.add_starting_tipracks(RACK,['A1','A4'])
+	tracker.assign_slots(RACK,['A1'])
+	tracker.assign_tipracks(1,RACK)
+	first,second = tracker.slot_racks['A1'],tracker.slot_racks['A4']
+	for x in range(96):
+		tracker.pick_up(1)
+		tracker.drop_tip(1)
+	assert tracker.pick_up(1) == 2
+	assert tracker.slot_racks == {'A1' : second}
+	assert first not in tracker.rack_locations and first not in tracker.tip_maps
+	assert tracker.pipette1.tip_racks == [second] and tracker.tips_in_rack(second) == 95
+	_consistent(tracker)
+
+def test_waste_tips_clears_index(make_tracker):
+	#Racks wasted by hand leave the index and their occupancy with them, no clear_old needed
+	tracker = make_tracker()
+	tracker.add_starting_tipracks(RACK,['A1','A2'])
+	tracker.assign_tipracks(1,RACK)
+	wasted = tracker.slot_racks['A1']
+	tracker.waste_tips('A1')
+	assert list(tracker.slot_racks.keys()) == ['A2']
+	assert wasted not in tracker.rack_locations and wasted not in tracker.tip_maps
+	assert tracker.tips_remaining(RACK) == 96
+	assert tracker.pick_up(1) == 0
+	assert tracker.pipette1._last_tip_picked_up_from.parent is tracker.slot_racks['A2']
+	_consistent(tracker)
+
+def test_reset_keeps_occupancy(make_tracker):
+	#Reset rebuilds the index from the deck, the tips used on each rack are kept
+	tracker = make_tracker()
+	tracker.add_starting_tipracks(RACK,['A1','A2'])
+	tracker.assign_tipracks(1,RACK)
+	for x in range(10):
+		tracker.pick_up(1)
+		tracker.drop_tip(1)
+	racks = dict(tracker.slot_racks)
+	tracker.reset_rack_list(RACK)
+	assert tracker.slot_racks == racks
+	assert tracker.tips_remaining(RACK) == 182
+	_consistent(tracker)
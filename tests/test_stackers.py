@@ -0,0 +1,30 @@
+'''
+Racks pulled from stackers, with and without lids, against TipPlanner's count of the same run
+
+	python -m pytest tests
+'''
+import pytest
+
+import TipPlanner
+
+RACKS = ['opentrons_flex_96_tiprack_50ul','opentrons_flex_96_tiprack_200ul']
+
+
+@pytest.mark.parametrize('lids',[(False,False),(True,True),(True,False)])
+def test_planner_matches_stacker_moves(lids, make_tracker):
+	#Every lidded rack costs a gripper move for its lid, the planner has to count them for the stackers that have lids only
+	tracker = make_tracker((1,8))
+	tracker.load_tips_in_stacker(tracker.ctx.load_module('flexStackerModuleV1','A4'),RACKS[0],3,lid=lids[0])
+	tracker.load_tips_in_stacker(tracker.ctx.load_module('flexStackerModuleV1','B4'),RACKS[1],3,lid=lids[1])
+	tracker.add_starting_tipracks(RACKS[0],['A1','A2'],RACKS[1],['B1'])
+	tracker.assign_tipracks(1,RACKS[0])
+	tracker.assign_tipracks(2,RACKS[1])
+	for x in range(2000):
+		pipette = 2 if x % 7 == 6 else 1
+		tracker.pick_up(pipette)
+		tracker.drop_tip(pipette)
+	config = tracker.plan_config()
+	assert config['stacker_lids'] == {RACKS[0] : lids[0], RACKS[1] : lids[1]}
+	plan = TipPlanner.plan_config(config)
+	assert sum(plan['gripper_moves'].values()) == tracker.gripper_moves
+	assert plan['racks_loaded'] == tracker.tip_rack_counts
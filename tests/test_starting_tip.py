@@ -0,0 +1,44 @@
+'''
+Starting on partly used racks and reserved wells
+
+	python -m pytest tests
+'''
+import pytest
+
+RACK = 'opentrons_flex_96_tiprack_50ul'
+
+
+def _tracker(make_tracker, starting_tip = 0):
+	tracker = make_tracker()
+	tracker.add_expansion_slots(['A4'])
+	tracker.add_starting_tipracks(RACK,['A1','A4','A2'],starting_tip_1=starting_tip)
+	tracker.assign_slots(RACK,['A1','A2'])
+	tracker.assign_tipracks(1,RACK)
+	return tracker
+
+def test_offset_spans_deck_racks(make_tracker):
+	#100 used tips empty A1 and the first 4 wells of A2, the expansion rack in between is left full
+	tracker = _tracker(make_tracker,100)
+	assert tracker.tips_in_rack(tracker.slot_racks['A1']) == 0
+	assert tracker.tips_in_rack(tracker.slot_racks['A4']) == 96
+	assert tracker.tips_in_rack(tracker.slot_racks['A2']) == 92
+	assert tracker.next_tip(1) is tracker.slot_racks['A2']['E1']
+
+def test_offset_past_deck_racks(make_tracker):
+	#Expansion racks are not counted, more than the racks on the deck hold is an error
+	tracker = _tracker(make_tracker)
+	with pytest.raises(ValueError):
+		tracker.set_starting_tip(RACK,193)
+	tracker.set_starting_tip(RACK,192)
+	assert tracker.tips_remaining(RACK) == 0
+	assert tracker.pick_up(1) == 2
+
+def test_reserved_wells_skipped(make_tracker):
+	#Reserved wells are never handed out, a tip returned to one stays reserved. The single channel finishes the column broken by the reserved well first
+	tracker = _tracker(make_tracker)
+	tracker.reserve_tips({'A1' : [1], 'A2' : ['A1']})
+	assert tracker.next_tip(1) is tracker.slot_racks['A2']['B1']
+	tracker.pick_up(1,locus=tracker.slot_racks['A1']['B1'])
+	tracker.drop_tip(1,return_tip=True)
+	assert tracker.tips_in_rack(tracker.slot_racks['A1']) == 88
+	assert tracker.tips_remaining(RACK) == 88 + 95
@@ -0,0 +1,55 @@
+'''
+Falling back to compatible rack types before pausing for a refill
+
+	python -m pytest tests
+'''
+import TipDryRun
+
+RACKS = ['opentrons_flex_96_filtertiprack_50ul','opentrons_flex_96_tiprack_50ul','opentrons_flex_96_tiprack_200ul']
+
+
+def _use_up(tracker, pickups):
+	for x in range(pickups):
+		assert tracker.pick_up(1) == 0
+		tracker.drop_tip(1)
+
+def test_highest_weight_first(make_tracker):
+	#Out of filter tips, the pipette switches to the highest weighted type on deck and stays on it
+	tracker = make_tracker()
+	tracker.add_starting_tipracks(RACKS[0],['A1'],RACKS[1],['A2'],RACKS[2],['A3'])
+	tracker.assign_tipracks(1,RACKS[0])
+	tracker.set_substitutes(1,{RACKS[1] : 1, RACKS[2] : 3})
+	_use_up(tracker,96)
+	assert tracker.pick_up(1) == 5
+	assert tracker.pipette1._last_tip_picked_up_from.parent is tracker.slot_racks['A3']
+	tracker.drop_tip(1)
+	assert tracker.pipette1.tip_racks[0].load_name == RACKS[2]
+	assert tracker.pick_up(1) == 0
+	assert tracker.tip_counts == {RACKS[0] : 96, RACKS[2] : 2}
+
+def test_own_supply_first(make_tracker):
+	#A rack of the assigned type waiting in an expansion slot is swapped in before any substitute is used
+	tracker = make_tracker()
+	tracker.add_expansion_slots(['A4'])
+	tracker.add_starting_tipracks(RACKS[0],['A1','A4'],RACKS[1],['A2'])
+	tracker.assign_slots(RACKS[0],['A1'])
+	tracker.assign_tipracks(1,RACKS[0])
+	tracker.set_substitutes(1,[RACKS[1]])
+	_use_up(tracker,96)
+	assert tracker.pick_up(1) == 2
+	assert tracker.pipette1.tip_racks[0].load_name == RACKS[0]
+
+def test_partial_expansion_rack_is_no_supply(make_tracker):
+	#Carousel only brings in full racks, a partly used rack in an expansion slot does not hold off the substitute
+	tracker = make_tracker(waste=TipDryRun.TrashBin())
+	tracker.open_slot = 'D1'
+	tracker.add_expansion_slots(['A4'])
+	tracker.add_starting_tipracks(RACKS[0],['A1','A4'],RACKS[1],['A2'])
+	tracker.assign_slots(RACKS[0],['A1'])
+	tracker.assign_tipracks(1,RACKS[0])
+	tracker.set_substitutes(1,[RACKS[1]])
+	parked = tracker.slot_racks['A4']
+	tracker.tip_maps[parked] = tracker._tip_map(parked) >> 10
+	_use_up(tracker,96)
+	assert tracker.pick_up(1) == 5
+	assert tracker.pickups_until_pause(1) == 95
@@ -0,0 +1,55 @@
+'''
+TipPlanner's Monte Carlo what-if over randomized demand
+
+	python -m pytest tests
+'''
+import pytest
+
+import TipPlanner
+import TipTracker
+
+RACK = 'opentrons_flex_96_tiprack_50ul'
+PICKUPS = [(1,RACK,1)] * 150 + [(2,RACK,8)] * 10	#230 tips, a little over two racks
+CONFIGS = [
+	{'name' : 'two racks', 'rack_assignments' : {RACK : ['A1','A2']}},
+	{'name' : 'with expansion', 'rack_assignments' : {RACK : ['A1','A2','A4','B4']}, 'ex_slots' : ['A4','B4']}]
+
+
+@pytest.mark.parametrize('trials',[0,-1,2.5])
+def test_trials_below_one(trials):
+	with pytest.raises(ValueError):
+		TipPlanner.what_if(PICKUPS,CONFIGS,trials=trials,workers=1)
+
+def test_trials_on_command_line(tmp_path):
+	config_file = tmp_path / 'plan_config.json'
+	config_file.write_text('{"pickups" : [], "rack_assignments" : {}}')
+	with pytest.raises(SystemExit):
+		TipPlanner.main([str(config_file),'--what-if','--trials','0'])
+
+def test_fixed_demand_matches_plan():
+	#Without any variation every trial is the recorded run, so the what-if is plan() for each config
+	report = TipPlanner.what_if(PICKUPS,CONFIGS,trials=5,workers=1)
+	for config,result in zip(CONFIGS,report):
+		plan = TipPlanner.plan(PICKUPS,config['rack_assignments'],config.get('ex_slots',None))
+		assert result['name'] == config['name'] and result['trials'] == 5
+		assert result['pauses'] == {'mean' : len(plan['pauses']), 'p95' : len(plan['pauses'])}
+		assert result['pause_probability'] == (1.0 if plan['pauses'] != [] else 0.0)
+		assert result['gripper_moves'] == sum(plan['gripper_moves'].values())
+		assert result['tips'] == {'mean' : 230, 'p95' : 230}
+	assert report[0]['pause_probability'] == 1.0 and report[1]['pause_probability'] == 0.0
+
+def test_randomized_demand():
+	#Runs of 50 to 200 samples on a recording of 100, more racks pause less often. The same seed repeats exactly, in one process or a pool
+	kwargs = {'trials' : 200, 'samples' : 100, 'sample_range' : (50,200), 'retry_rate' : 0.05, 'seed' : 3}
+	report = TipPlanner.what_if(PICKUPS,CONFIGS,workers=1,**kwargs)
+	assert 0 < report[1]['pause_probability'] < report[0]['pause_probability'] < 1
+	assert report[0]['tips']['p95'] > report[0]['tips']['mean'] > 0
+	assert TipPlanner.what_if(PICKUPS,CONFIGS,workers=2,**kwargs) == report
+
+def test_tracker_copies_match():
+	#TipTracker keeps private copies so it stays one file, they have to give the planner's answers
+	for values in ([],[4.0],[1.0,2.0,3.0],sorted(float(x * x % 17) for x in range(40))):
+		for q in (0,5,50,95,100):
+			assert TipTracker._percentile(values,q) == TipPlanner.percentile(values,q)
+	for slots in (('A1','A1'),('A1','D4'),('C2','B3'),('D1','A4')):
+		assert TipTracker._slot_distance(*slots) == TipPlanner.slot_distance(*slots)